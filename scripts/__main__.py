@@ -0,0 +1,214 @@
+"""Command line interface to run individual stages of the pipeline.
+
+Examples:
+    python -m scripts list
+    python -m scripts run dt_table
+    python -m scripts run daily
+    python -m scripts run daily --stale
+    python -m scripts schedule --dry-run
+    python -m scripts run refugee_cost cube idrc_oda_chart --donors POL,DEU
+    python -m scripts watch --interval 60
+    python -m scripts serve --port 8000
+    python -m scripts archive list
+    python -m scripts e2e --latency 0.1
+"""
+
+import argparse
+
+from scripts.stages import DAILY_STAGES, STAGES, WEEKLY_STAGES, run_stages
+
+GROUPS: dict[str, list[str]] = {"daily": DAILY_STAGES, "weekly": WEEKLY_STAGES}
+
+
+def _expand(stages: list[str]) -> list[str]:
+    """Expand stage groups (e.g. 'daily') into their stages"""
+    expanded = []
+    for stage in stages:
+        for s in GROUPS.get(stage, [stage]):
+            if s not in expanded:
+                expanded.append(s)
+    return expanded
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m scripts")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="run one or more stages")
+    run.add_argument("stages", nargs="+", choices=[*STAGES, *GROUPS])
+    run.add_argument(
+        "--no-timings",
+        action="store_true",
+        help="do not record import and run times",
+    )
+    run.add_argument(
+        "--stale",
+        action="store_true",
+        help="serve the cached upstream data, refresh it in the background",
+    )
+    run.add_argument(
+        "--donors", default=None, help="only these donors (ISO3 codes, e.g. POL,DEU)"
+    )
+    run.add_argument("--years", default=None, help="only these years (e.g. 2023,2024)")
+    run.add_argument(
+        "--output",
+        default=None,
+        help="folder of the scoped outputs (default: temp, needs --donors or --years)",
+    )
+
+    commands.add_parser("list", help="list the available stages")
+
+    schedule = commands.add_parser("schedule", help="run the stages that are due")
+    when = schedule.add_mutually_exclusive_group()
+    when.add_argument("--due", action="store_true", help="run the stages due (default)")
+    when.add_argument("--all", action="store_true", help="run every stage")
+    schedule.add_argument(
+        "--force", default=None, help="also run these stages (e.g. latest_oda)"
+    )
+    schedule.add_argument("--skip", default=None, help="do not run these stages")
+    schedule.add_argument(
+        "--cadence",
+        action="append",
+        default=[],
+        help="cadence of a stage for this run (e.g. crs_ukraine=daily)",
+    )
+    schedule.add_argument(
+        "--dry-run", action="store_true", help="list the stages due, run nothing"
+    )
+    schedule.add_argument(
+        "--no-timings",
+        action="store_true",
+        help="do not record import and run times",
+    )
+
+    watch = commands.add_parser("watch", help="watch the inputs and re-run stages")
+    watch.add_argument(
+        "--interval", type=int, default=30, help="seconds between checks"
+    )
+    watch.add_argument(
+        "--max-memory-mb", type=float, default=None, help="memory limit, in MB"
+    )
+
+    serve = commands.add_parser("serve", help="serve the outputs over http")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8000)
+
+    archive = commands.add_parser("archive", help="archive or restore past runs")
+    archive.add_argument("action", choices=["save", "list", "history", "restore"])
+    archive.add_argument("target", nargs="?", help="run (restore) or file (history)")
+    archive.add_argument("--to", default=None, help="folder to restore the run to")
+    archive.add_argument("--files", default="*", help="files of the run to restore")
+
+    e2e = commands.add_parser("e2e", help="run the pipeline offline, with stand-ins")
+    e2e.add_argument("stages", nargs="*", help="stages (default: daily and weekly)")
+    e2e.add_argument("--latency", type=float, default=0, help="seconds per request")
+    e2e.add_argument("--error-rate", type=float, default=0, help="share of 503s")
+    e2e.add_argument("--scale", type=int, default=1, help="payload scale factor")
+    e2e.add_argument("--folder", default=None, help="scratch folder (default: temp)")
+    e2e.add_argument(
+        "--no-memory", action="store_true", help="do not trace memory (faster)"
+    )
+
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        for name, target in STAGES.items():
+            print(f"{name:<16}{target}")
+        for name, stages in GROUPS.items():
+            print(f"{name:<16}{', '.join(stages)}")
+        return
+
+    if args.command == "schedule":
+        from scripts.schedule import run_scheduled
+
+        cadences = dict(c.split("=", 1) for c in args.cadence if "=" in c)
+        if len(cadences) != len(args.cadence):
+            parser.error("cadences are given as stage=cadence")
+
+        try:
+            run_scheduled(
+                due=not args.all,
+                force=args.force.split(",") if args.force else None,
+                skip=args.skip.split(",") if args.skip else None,
+                cadences=cadences,
+                record=not args.no_timings,
+                dry_run=args.dry_run,
+            )
+        except ValueError as e:
+            parser.error(str(e))
+        return
+
+    if args.command == "watch":
+        from scripts.watch import Watcher
+
+        Watcher(interval=args.interval, max_memory_mb=args.max_memory_mb).start()
+        return
+
+    if args.command == "serve":
+        from scripts.server import serve
+
+        serve(host=args.host, port=args.port)
+        return
+
+    if args.command == "archive":
+        from scripts import archive as archive_
+
+        if args.action == "save":
+            archive_.save_run()
+        elif args.action == "list":
+            print(archive_.list_runs().to_string(index=False))
+        elif args.target is None:
+            parser.error(f"archive {args.action} needs a target")
+        elif args.action == "history":
+            print(archive_.history(args.target).to_string(index=False))
+        else:
+            archive_.restore_run(args.target, to=args.to, pattern=args.files)
+        return
+
+    if args.command == "e2e":
+        from scripts.harness import run_offline
+
+        unknown = set(_expand(args.stages)) - set(STAGES)
+        if unknown:
+            parser.error(f"unknown stages: {sorted(unknown)}")
+
+        run_offline(
+            _expand(args.stages) or None,
+            latency=args.latency,
+            error_rate=args.error_rate,
+            scale=args.scale,
+            folder=args.folder,
+            trace_memory=not args.no_memory,
+        )
+        return
+
+    # Unscoped stages write to the project outputs, not to a folder of their own
+    if args.output is not None and not (args.donors or args.years):
+        parser.error("--output needs --donors or --years")
+
+    if args.donors or args.years:
+        from scripts.scope import SCOPED_STAGES, run_scoped
+
+        unscoped = set(_expand(args.stages)) - set(SCOPED_STAGES)
+        if unscoped:
+            parser.error(f"stages {sorted(unscoped)} can't be scoped")
+
+        run_scoped(
+            _expand(args.stages),
+            donors=args.donors.split(",") if args.donors else None,
+            years=args.years.split(",") if args.years else None,
+            folder=args.output,
+        )
+        return
+
+    if args.stale:
+        from scripts.swr import run_stale
+
+        run_stale(_expand(args.stages), record=not args.no_timings)
+        return
+
+    run_stages(_expand(args.stages), record=not args.no_timings)
+
+
+if __name__ == "__main__":
+    main()
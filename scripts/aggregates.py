@@ -0,0 +1,101 @@
+"""Donor group totals computed from a donor x group membership matrix.
+
+Every group total is computed in a single matrix product per indicator, rather
+than one groupby per group, so all chart outputs share the same totals.
+"""
+
+from functools import cache
+
+import pandas as pd
+
+DAC_TOTAL: str = "DAC Countries, Total"
+
+# User-defined groupings, by donor short name
+CUSTOM_GROUPS: dict[str, list[str]] = {
+    "Nordic Countries, Total": ["Denmark", "Finland", "Iceland", "Norway", "Sweden"],
+}
+
+
+@cache
+def donor_groups() -> dict[str, tuple[str, ...]]:
+    """Donor groups as {group name: donor short names}. DAC countries include
+    Lithuania, as in the rest of the tracker"""
+    from country_converter import country_converter
+    from oda_data.tools.groupings import donor_groupings
+
+    groupings = donor_groupings()
+
+    dac = list(groupings["dac_countries"].values()) + ["Lithuania"]
+    eu = list(groupings["eu27_countries"].values())
+
+    # The panels only hold DAC donors: the EU total is that of its DAC members
+    groups = {
+        DAC_TOTAL: dac,
+        "EU DAC Countries, Total": [d for d in dac if d in eu],
+        "G7 Countries, Total": list(groupings["g7"].values()),
+    }
+
+    groups = {
+        name: tuple(country_converter.convert(donors, to="short_name"))
+        for name, donors in groups.items()
+    }
+
+    return groups | {name: tuple(donors) for name, donors in CUSTOM_GROUPS.items()}
+
+
+def membership_matrix(
+    donors: pd.Index, groups: dict[str, tuple[str, ...]] | None = None
+) -> pd.DataFrame:
+    """A donor x group matrix of 1s (member) and 0s (not a member)"""
+    groups = donor_groups() if groups is None else groups
+
+    return pd.DataFrame(
+        {name: donors.isin(members) for name, members in groups.items()},
+        index=donors,
+        dtype="float64",
+    )
+
+
+def group_totals(
+    df: pd.DataFrame,
+    by: str,
+    donor_column: str,
+    values: list[str],
+    groups: dict[str, tuple[str, ...]] | None = None,
+) -> pd.DataFrame:
+    """Compute the totals of every group in one matrix product per indicator.
+
+    Missing values count as zero, as in a groupby sum. The result has the `by`
+    column, the `donor_column` (holding the group names) and the `values` columns.
+    """
+    groups = donor_groups() if groups is None else groups
+    totals = None
+
+    for value in values:
+        # (by x donor) @ (donor x group) = (by x group)
+        wide = df.pivot_table(
+            index=by, columns=donor_column, values=value, aggfunc="sum", dropna=False
+        ).fillna(0)
+
+        total = (
+            (wide @ membership_matrix(wide.columns, groups))
+            .rename_axis(columns=donor_column)
+            .reset_index()
+            .melt(id_vars=by, var_name=donor_column, value_name=value)
+        )
+
+        totals = (
+            total
+            if totals is None
+            else totals.merge(total, on=[by, donor_column], how="outer")
+        )
+
+    # One block per group, in the order in which they were defined
+    totals[donor_column] = pd.Categorical(totals[donor_column], categories=[*groups])
+
+    return (
+        totals.sort_values([donor_column, by])
+        .astype({donor_column: str})
+        .reset_index(drop=True)
+        .filter([by, donor_column, *values], axis=1)
+    )
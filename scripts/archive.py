@@ -0,0 +1,234 @@
+"""Versioned archive of the outputs and key inputs of every run.
+
+Files are stored once per content: each file is hashed (sha256) and saved as a
+compressed blob named after its hash (`archive/blobs/ab/abcdef...`). A run only
+adds a small index (`archive/runs/<run>.json`, path -> hash and size), so the
+archive grows with the files that change, not with the number of runs.
+
+    python -m scripts archive save
+    python -m scripts archive list
+    python -m scripts archive history output/idrc_share.csv
+    python -m scripts archive restore 20240105T060000 --to /tmp/tracker
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime
+from fnmatch import fnmatch
+from pathlib import Path
+
+import pandas as pd
+
+from scripts.config import PATHS
+
+BLOBS_FOLDER = PATHS.archive / "blobs"
+RUNS_FOLDER = PATHS.archive / "runs"
+
+# Files archived with every run (relative to the project folder)
+ARCHIVED: list[str] = [
+    "output/*.csv",
+    "output/*.xlsx",
+    "output/*.feather",
+    "output/*.parquet",
+    "raw_data/*.csv",
+    "raw_data/*.json",
+]
+
+# Records of the runs themselves, which change with every run, and derived binaries
+EXCLUDED: list[str] = [
+    "output/stage_timings.csv",
+    "output/updates.csv",
+    "output/preflight_report.csv",
+    "output/e2e_report.csv",
+    "raw_data/stage_runs.json",
+    # Rebuilt from the archived csv files
+    "output/tracker_cube.parquet",
+]
+
+
+def _file_hash(file: Path) -> str:
+    digest = hashlib.sha256()
+    with open(file, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _blob(file_hash: str) -> Path:
+    return BLOBS_FOLDER / file_hash[:2] / file_hash
+
+
+def _run_index(run: str) -> dict:
+    index = RUNS_FOLDER / f"{run}.json"
+    if not index.exists():
+        raise ValueError(f"Unknown run: {run}. See python -m scripts archive list")
+    with open(index, "r") as f:
+        return json.load(f)
+
+
+def _store_blob(file: Path, blob: Path) -> None:
+    """Compress a file to its blob. It is written to a temporary file, then moved in
+    place, so an interrupted save doesn't leave a truncated blob"""
+    blob.parent.mkdir(parents=True, exist_ok=True)
+    temporary = blob.with_name(f"{blob.name}.{os.getpid()}.tmp")
+
+    with open(file, "rb") as src, gzip.open(temporary, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.replace(temporary, blob)
+
+
+def _new_index(stamp: str):
+    """Create the index file of a new run. Runs saved in the same second get a
+    counter (20240105T060000-1), which sorts after the first one"""
+    for n in range(1000):
+        run = stamp if n == 0 else f"{stamp}-{n}"
+        try:
+            return run, open(RUNS_FOLDER / f"{run}.json", "x")
+        except FileExistsError:
+            continue
+
+    raise RuntimeError(f"Too many runs archived at {stamp}")
+
+
+def _run_indexes() -> list[Path]:
+    """The index files of the runs, in the order of the runs (by run id, so that
+    20240105T060000 comes before 20240105T060000-1)"""
+    return sorted(RUNS_FOLDER.glob("*.json"), key=lambda f: f.stem)
+
+
+def save_run(label: str = "") -> str:
+    """Archive the current outputs and inputs. Returns the id of the run"""
+    RUNS_FOLDER.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.today().strftime("%Y%m%dT%H%M%S")
+
+    files, new = {}, 0
+    for pattern in ARCHIVED:
+        for file in sorted(PATHS.project.glob(pattern)):
+            path = file.relative_to(PATHS.project).as_posix()
+            if path in EXCLUDED:
+                continue
+
+            file_hash = _file_hash(file)
+            blob = _blob(file_hash)
+
+            # Unchanged files are already stored
+            if not blob.exists():
+                _store_blob(file, blob)
+                new += 1
+
+            files[path] = {"hash": file_hash, "size": file.stat().st_size}
+
+    run, index_file = _new_index(stamp)
+    index = {"run": run, "date": str(datetime.today()), "label": label}
+    with index_file as f:
+        json.dump(index | {"files": files}, f, indent=1)
+
+    print(f"Archived run {run} ({len(files)} files, {new} new)")
+
+    return run
+
+
+def list_runs() -> pd.DataFrame:
+    """The archived runs, with the number of files and the files that changed"""
+    runs, previous = [], {}
+
+    for index in _run_indexes():
+        with open(index, "r") as f:
+            run = json.load(f)
+        files = run["files"]
+        changed = [p for p, v in files.items() if previous.get(p) != v["hash"]]
+        runs.append(
+            {
+                "run": run["run"],
+                "label": run["label"],
+                "files": len(files),
+                "changed": len(changed),
+            }
+        )
+        previous = {p: v["hash"] for p, v in files.items()}
+
+    return pd.DataFrame(runs, columns=["run", "label", "files", "changed"])
+
+
+def history(path: str) -> pd.DataFrame:
+    """The runs in which a file (relative to the project folder) changed"""
+    rows, last = [], None
+
+    for index in _run_indexes():
+        with open(index, "r") as f:
+            run = json.load(f)
+        file = run["files"].get(path)
+        file_hash = file["hash"] if file else None
+        if file_hash != last:
+            rows.append(
+                {"run": run["run"], "hash": file_hash, "size": (file or {}).get("size")}
+            )
+        last = file_hash
+
+    return pd.DataFrame(rows, columns=["run", "hash", "size"])
+
+
+def run_as_of(date: str) -> str:
+    """The last run archived on or before a date (e.g. 2024-01-31)"""
+    if len(date) <= 10:
+        # Any run of the day, including those with a counter (T235959-1)
+        day = pd.Timestamp(date).strftime("%Y%m%d")
+        runs = [r for r in list_runs().run if r[:8] <= day]
+    else:
+        runs = [r for r in list_runs().run if r <= date]
+    if not runs:
+        raise ValueError(f"No run archived on or before {date}")
+    return runs[-1]
+
+
+def read_file(run: str, path: str) -> bytes:
+    """The content of a file in an archived run"""
+    files = _run_index(run)["files"]
+    if path not in files:
+        raise ValueError(f"{path} is not in run {run}")
+    with gzip.open(_blob(files[path]["hash"]), "rb") as f:
+        return f.read()
+
+
+def read_table(run: str, path: str) -> pd.DataFrame:
+    """An archived csv, feather or parquet file as a DataFrame"""
+    from io import BytesIO
+
+    content = BytesIO(read_file(run, path))
+    if path.endswith(".feather"):
+        return pd.read_feather(content)
+    if path.endswith(".parquet"):
+        return pd.read_parquet(content)
+    return pd.read_csv(content)
+
+
+def restore_run(run: str, to: Path | None = None, pattern: str = "*") -> None:
+    """Restore the files of a run (matching a pattern) into a folder. By default
+    the files are restored in place"""
+    to = Path(to) if to is not None else PATHS.project
+    restored = 0
+
+    for path, file in _run_index(run)["files"].items():
+        if not fnmatch(path, pattern):
+            continue
+        target = to / path
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if target.exists() and _file_hash(target) == file["hash"]:
+            continue
+        with gzip.open(_blob(file["hash"]), "rb") as src, open(target, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        restored += 1
+
+    print(f"Restored {restored} files of run {run} to {to}")
+
+
+def archive_size() -> int:
+    """Size of the archive on disk, in bytes"""
+    return sum(f.stat().st_size for f in PATHS.archive.rglob("*") if f.is_file())
+
+
+if __name__ == "__main__":
+    save_run()
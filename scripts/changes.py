@@ -0,0 +1,179 @@
+"""Row-level changes of the outputs between consecutive runs.
+
+Each output has a natural key (donor or iso_code, year, ...). The rows of the last
+run are kept in a snapshot (`output/changes/snapshots`). On every run, the rows of
+each output are hashed (one hash for the key, one for the whole row) and matched
+to the snapshot in a single merge, which gives the rows added, removed and changed.
+
+The changes are written to `output/changes/<output>_delta.csv`, with a `change`
+column (added, removed or changed), the key, the new values (the old values for
+removed rows) and the previous values of the changed rows (`<column>_previous`).
+A summary of every run is appended to `output/changes/changes_log.csv`.
+`apply_delta` updates a copy of an output with its delta.
+"""
+
+from datetime import datetime
+
+import pandas as pd
+
+from scripts.config import PATHS
+
+CHANGES_FOLDER = PATHS.output / "changes"
+SNAPSHOTS_FOLDER = CHANGES_FOLDER / "snapshots"
+LOG_FILE = CHANGES_FOLDER / "changes_log.csv"
+
+# name -> file pattern (in the output folder) and key columns. Wide chart files
+# (one column per donor) are compared in long format (year, donor_name, value)
+OUTPUTS: dict[str, dict] = {
+    "cost_estimates": {
+        "files": "ukraine_refugee_cost_estimates.csv",
+        "keys": ["iso_code"],
+    },
+    "hcr_data": {"files": "hcr_data.csv", "keys": ["iso_code", "Data Date"]},
+    "idrc_share": {"files": "idrc_share.csv", "keys": ["Donor", "year"]},
+    "idrc_oda_chart": {"files": "idrc_oda_chart_*.csv", "keys": ["Donor", "year"]},
+    "idrc_constant": {
+        "files": "idrc_over_time_constant.csv",
+        "keys": ["donor_name", "year"],
+        "wide": True,
+    },
+    "latest_oda": {
+        "files": "latest_oda.csv",
+        "keys": ["donor_name", "indicator", "prices", "year"],
+    },
+    "unhcr_data": {"files": "unhcr_data_high.feather", "keys": ["iso_code", "year"]},
+    "table": {"files": "table.csv", "keys": ["Donor"]},
+}
+
+
+def read_output(name: str) -> pd.DataFrame:
+    """Read the files of an output into a single DataFrame. Numbers are read as
+    floats so that a column with a new missing value doesn't change all its hashes
+    """
+    spec = OUTPUTS[name]
+    files = sorted(PATHS.output.glob(spec["files"]))
+
+    if not files:
+        raise FileNotFoundError(f"No files for output {name}: {spec['files']}")
+
+    data = pd.concat(
+        [
+            pd.read_feather(f) if f.suffix == ".feather" else pd.read_csv(f)
+            for f in files
+        ],
+        ignore_index=True,
+    )
+
+    if spec.get("wide"):
+        data = data.melt(id_vars="year", var_name="donor_name", value_name="value")
+
+    values = [c for c in data.select_dtypes("number").columns if c not in spec["keys"]]
+
+    return data.astype({c: "float64" for c in values})
+
+
+def _hash(data: pd.DataFrame) -> pd.Series:
+    return pd.util.hash_pandas_object(data, index=False)
+
+
+def compare(
+    previous: pd.DataFrame, current: pd.DataFrame, keys: list[str]
+) -> pd.DataFrame:
+    """The rows added, removed and changed between two versions of an output"""
+    for version in [previous, current]:
+        if version.duplicated(keys).any():
+            raise ValueError(f"The key {keys} doesn't identify the rows")
+
+    previous = previous.assign(_key=_hash(previous[keys]), _row=_hash(previous))
+    current = current.assign(_key=_hash(current[keys]), _row=_hash(current))
+
+    matched = previous[["_key", "_row"]].merge(
+        current[["_key", "_row"]],
+        on="_key",
+        how="outer",
+        suffixes=("_previous", ""),
+        indicator=True,
+    )
+
+    added = matched.loc[matched._merge == "right_only", "_key"]
+    removed = matched.loc[matched._merge == "left_only", "_key"]
+    changed = matched.loc[
+        (matched._merge == "both") & (matched._row != matched._row_previous), "_key"
+    ]
+
+    values = [c for c in current.columns if c not in keys + ["_key", "_row"]]
+    old = (
+        previous.loc[previous._key.isin(changed)]
+        .set_index("_key")
+        .filter(values)
+        .add_suffix("_previous")
+    )
+
+    delta = pd.concat(
+        [
+            current.loc[current._key.isin(added)].assign(change="added"),
+            previous.loc[previous._key.isin(removed)].assign(change="removed"),
+            current.loc[current._key.isin(changed)]
+            .assign(change="changed")
+            .join(old, on="_key"),
+        ],
+        ignore_index=True,
+    )
+
+    return delta.filter(["change", *keys, *values, *old.columns]).sort_values(
+        ["change", *keys], ignore_index=True
+    )
+
+
+def apply_delta(
+    data: pd.DataFrame, delta: pd.DataFrame, keys: list[str]
+) -> pd.DataFrame:
+    """Update an output with its delta (as a downstream system would)"""
+    delta_keys = _hash(delta[keys]).to_numpy()
+    kept = data.loc[~_hash(data[keys]).isin(delta_keys).to_numpy()]
+    new = delta.loc[delta.change != "removed", list(data.columns)]
+
+    return pd.concat([kept, new], ignore_index=True)
+
+
+def record_changes(outputs: list[str] | None = None) -> pd.DataFrame:
+    """Write the delta of each output since the last run and update the snapshots"""
+    SNAPSHOTS_FOLDER.mkdir(parents=True, exist_ok=True)
+    today = datetime.today()
+    log = []
+
+    for name in outputs or list(OUTPUTS):
+        keys = OUTPUTS[name]["keys"]
+        current = read_output(name)
+        snapshot = SNAPSHOTS_FOLDER / f"{name}.parquet"
+
+        # The first run reports every row as added
+        previous = (
+            pd.read_parquet(snapshot) if snapshot.exists() else current.iloc[:0].copy()
+        )
+
+        delta = compare(previous, current, keys)
+        delta.to_csv(CHANGES_FOLDER / f"{name}_delta.csv", index=False)
+        current.to_parquet(snapshot, index=False)
+
+        counts = delta.change.value_counts()
+        log.append(
+            {
+                "date": today,
+                "output": name,
+                "rows": len(current),
+                **{c: counts.get(c, 0) for c in ["added", "removed", "changed"]},
+            }
+        )
+
+    log = pd.DataFrame(log)
+    log.to_csv(LOG_FILE, mode="a", header=not LOG_FILE.exists(), index=False)
+
+    changed = log.loc[log[["added", "removed", "changed"]].sum(axis=1) > 0]
+    print(f"Recorded changes ({len(changed)} of {len(log)} outputs changed)")
+
+    return log
+
+
+if __name__ == "__main__":
+    record_changes()
@@ -1,3 +1,4 @@
+from functools import cache
 from pathlib import Path
 
 
@@ -8,9 +9,21 @@ class PATHS:
     scripts = project / "scripts"
     raw_data = project / "raw_data"
     output = project / "output"
+    archive = project / "archive"
     pydeflate = raw_data / ".pydeflate"
 
 
+@cache
+def set_data_paths() -> None:
+    """Point oda_data and pydeflate to the raw_data folder. The heavy imports
+    happen here, on first use, and only once per process."""
+    from oda_data import set_data_path
+    from pydeflate import set_pydeflate_path
+
+    set_data_path(PATHS.raw_data)
+    set_pydeflate_path(PATHS.raw_data)
+
+
 # -----------------------------------------------------------------------------
 
 ARTICLE_COUNT: int = 50
@@ -23,4 +36,68 @@ DT_BASE: str = (
     f"&limit={ARTICLE_COUNT}&page=1&meta=filter_count&search="
 )
 
-DT_SEARCH: str = "ukraine"
+# Crises tracked by the pipeline. The per capita costs and the DAC data are shared,
+# only the refugee ledger, the cost estimates and the Donor Tracker table are
+# computed for each crisis.
+# - name: name of the origin country (highlighted in the Donor Tracker table)
+# - origin: ISO3 code of the origin country
+# - search: Donor Tracker search terms
+# - source: csv (in raw_data) of refugees by host country and date, used to build
+#   the ledger. None if the ledger is built by another stage (the UNHCR scrape)
+# - refugees_column: column of the number of refugees in the source and ledger
+# - years: years for which the costs are estimated
+# - reported: years for which the reported IDRC replaces the estimate
+# Other keys (file names) default to values based on the crisis key, see crisis_config
+CRISES: dict[str, dict] = {
+    "ukraine": {
+        "name": "Ukraine",
+        "origin": "UKR",
+        "search": "ukraine",
+        "source": None,
+        "refugees_column": "Refugees from Ukraine recorded in country as of date",
+        "years": [2022, 2023, 2024],
+        "reported": [2022],
+        # Ukraine keeps the original file names
+        "ledger": "hcr_data.csv",
+        "dt_articles": "dt_articles.json",
+        "dt_table": "dt_table.csv",
+        "dt_source": "Donor Tracker",
+    },
+}
+
+
+def crisis_config(crisis: str) -> dict:
+    """The configuration of a crisis, with the default file names"""
+    if crisis not in CRISES:
+        raise ValueError(f"Unknown crisis: {crisis}. Valid crises: {list(CRISES)}")
+
+    defaults = {
+        "source": f"{crisis}_refugees.csv",
+        "reported": [],
+        "ledger": f"{crisis}_refugee_ledger.csv",
+        "dt_articles": f"dt_articles_{crisis}.json",
+        "dt_table": f"{crisis}_dt_table.csv",
+        "dt_source": f"Donor Tracker ({crisis})",
+    }
+
+    return defaults | CRISES[crisis]
+
+
+DT_SEARCH: str = CRISES["ukraine"]["search"]
+
+# Donor Tracker tables built from the local article index (see dt_index.py):
+# file -> query and the term highlighted in the content
+DT_TABLES: dict[str, dict] = {
+    "dt_table_refugees.csv": {
+        "query": "ukraine AND (refugee* OR asylum)",
+        "highlight": "refugee",
+    },
+    "dt_table_idrc.csv": {
+        "query": "ukraine AND (in-donor OR idrc OR (refugee* AND cost*))",
+        "highlight": "Ukraine",
+    },
+    "dt_table_humanitarian.csv": {
+        "query": "ukraine AND (humanitarian OR topic:humanitarian*)",
+        "highlight": "humanitarian",
+    },
+}
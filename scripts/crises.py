@@ -0,0 +1,99 @@
+"""Refugee cost estimates for several crises, in one batch.
+
+The crises are configured in `config.CRISES`. The inputs shared by all the crises
+(the DAC data, the IDRC in constant prices and the cost per refugee) are computed
+once and kept in memory, so each additional crisis only costs its own stages:
+its refugee ledger, its cost estimates and its Donor Tracker table.
+
+The ledger of a new crisis is built from a csv in raw_data with the number of
+refugees by host country and date (columns iso_code, Country, Data Date and the
+refugees column of the crisis).
+"""
+
+import numpy as np
+import pandas as pd
+
+from scripts.config import CRISES, PATHS, crisis_config
+
+
+def add_horizon_ratios(df: pd.DataFrame, years: list[int]) -> pd.DataFrame:
+    """Share of the yearly cost of a refugee allocated to each year of the horizon,
+    based on the month of arrival. With `share` the months left in the arrival year
+    (over 12), the arrival year gets `share`, the next year `1 - share` and the year
+    after `share` again. Years before the arrival get 0.
+
+    This differs from the Ukraine ledger (unhcr_data.add_yearly_ratios), which is
+    left as published:
+    - Ukraine's arrivals of July 2022 get 2/3 and 1/3 (a correction of that month's
+      data), where this rule gives 1/2 to each year.
+    - Ukraine's arrivals in the third year also get `share` in the second year,
+      where this rule gives nothing to the years before the arrival."""
+    share = 1 - (df["Data Date"].dt.month - 1) / 12
+    offset = (df["Data Date"].dt.year - years[0]).to_numpy()
+    pattern = [share, 1 - share, share]
+
+    for i, year in enumerate(years):
+        df[f"ratio{str(year)[2:]}"] = np.select(
+            [offset == i - k for k in range(len(pattern))], pattern, default=0
+        )
+
+    return df
+
+
+def crisis_ledger(crisis: str) -> pd.DataFrame:
+    """The monthly refugee ledger of a crisis, from its source file"""
+    from scripts.unhcr_data import (
+        filter_hrc_data_by_month,
+        monthly_difference_by_country,
+    )
+
+    config_ = crisis_config(crisis)
+    column = config_["refugees_column"]
+
+    data = (
+        pd.read_csv(PATHS.raw_data / config_["source"], parse_dates=["Data Date"])
+        .filter(["iso_code", "Country", "Data Date", column], axis=1)
+        .pipe(filter_hrc_data_by_month)
+        .pipe(monthly_difference_by_country, column=column)
+        .pipe(add_horizon_ratios, years=config_["years"])
+    )
+
+    # Change the date format
+    data["Data Date"] = data["Data Date"].dt.strftime("%m-%Y")
+
+    return data
+
+
+def build_ledger(crisis: str) -> None:
+    """Build the monthly refugee ledger of a crisis from its source file"""
+    ledger = crisis_ledger(crisis)
+    ledger.to_csv(PATHS.output / crisis_config(crisis)["ledger"], index=False)
+
+
+def run_crisis(crisis: str) -> None:
+    """Update the ledger, the cost estimates and the Donor Tracker table of a crisis"""
+    from scripts.dt_table import live_dt_table_pipeline
+    from scripts.idrc_per_capita import (
+        export_summary_cost_data,
+        update_refugee_cost_data,
+    )
+
+    # The Ukraine ledger is built from the UNHCR scrape (hcr_ledger stage)
+    if crisis_config(crisis)["source"] is not None:
+        build_ledger(crisis)
+
+    update_refugee_cost_data(crisis)
+    export_summary_cost_data(crisis)
+    live_dt_table_pipeline(crisis)
+    print(f"Updated the {crisis} refugee cost estimates")
+
+
+def run_crises(crises: list[str] | None = None) -> None:
+    """Run several crises (all of them by default). The shared inputs are
+    computed by the first crisis and reused by the others"""
+    for crisis in crises or list(CRISES):
+        run_crisis(crisis)
+
+
+if __name__ == "__main__":
+    run_crises()
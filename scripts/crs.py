@@ -0,0 +1,284 @@
+"""Bilateral ODA to Ukraine, from the CRS project-level data.
+
+The CRS (Creditor Reporting System) bulk files hold millions of project rows per
+year, more than the tracker can read at once. They are streamed in batches: only
+the columns used here are parsed, and only the rows with Ukraine as recipient are
+kept as each batch is read. Every batch is aggregated by donor, year, sector and
+flow type and added to the running totals, so the peak memory depends on the
+batch size and the number of groups, not on the size of the files.
+
+The CRS files (the pipe-delimited text files of the OECD bulk download, or parquet
+files with the same columns) go in `raw_data/crs`. Amounts are in USD millions,
+current prices.
+
+    python -m scripts run crs_ukraine
+
+`python -m scripts.crs` compares the memory of the streamed aggregation with a
+full read of the files, on synthetic CRS files of growing size.
+"""
+
+import re
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from pyarrow import csv
+
+from scripts.config import PATHS
+
+CRS_FOLDER = PATHS.raw_data / "crs"
+
+OUTPUT_FILE = PATHS.output / "ukraine_bilateral_oda.csv"
+
+# DAC recipient code of Ukraine
+RECIPIENT_CODE: int = 85
+
+# Bytes of text parsed per batch (text files) and rows per batch (parquet files).
+# The text reader reads a few blocks ahead, so the memory used is a multiple of it
+BLOCK_SIZE: int = 2 * 2**20
+BATCH_SIZE: int = 250_000
+
+# Columns read (the CRS names in snake case, e.g. DonorCode) and their types
+COLUMNS: dict[str, pa.DataType] = {
+    "year": pa.int16(),
+    "donor_code": pa.int32(),
+    "donor_name": pa.string(),
+    "recipient_code": pa.int32(),
+    "sector_code": pa.int32(),
+    "sector_name": pa.string(),
+    "flow_code": pa.int32(),
+    "flow_name": pa.string(),
+    "usd_commitment": pa.float64(),
+    "usd_disbursement": pa.float64(),
+}
+
+KEYS: list[str] = ["donor_code", "year", "sector_code", "flow_code"]
+
+VALUES: dict[str, str] = {
+    "usd_commitment": "commitments",
+    "usd_disbursement": "disbursements",
+}
+
+# code -> name. The name last read is kept for each code
+NAMES: dict[str, str] = {
+    "donor_code": "donor_name",
+    "sector_code": "sector_name",
+    "flow_code": "flow_name",
+}
+
+
+def crs_files(folder: Path = CRS_FOLDER) -> list[Path]:
+    """The CRS files in the folder"""
+    return sorted(folder.glob("*.txt")) + sorted(folder.glob("*.parquet"))
+
+
+def _snake(name: str) -> str:
+    """A CRS column name in snake case (DonorCode -> donor_code)"""
+    name = name.strip().lstrip("\ufeff")
+    return re.sub(r"(?<=[a-z])(?=[A-Z])", "_", name).lower()
+
+
+def _header(file: Path) -> list[str]:
+    """The column names of a CRS file"""
+    if file.suffix == ".parquet":
+        return pq.read_schema(file).names
+
+    with open(file, "r", encoding="utf-8-sig") as f:
+        return f.readline().rstrip("\r\n").split("|")
+
+
+def _read(file: Path, names: dict[str, str]) -> Iterator[pa.RecordBatch]:
+    """The batches of a CRS file, with the columns used only (the other columns of
+    the text files are not parsed)"""
+    if file.suffix == ".parquet":
+        yield from pq.ParquetFile(file).iter_batches(
+            batch_size=BATCH_SIZE, columns=list(names.values())
+        )
+        return
+
+    yield from csv.open_csv(
+        file,
+        read_options=csv.ReadOptions(block_size=BLOCK_SIZE),
+        parse_options=csv.ParseOptions(delimiter="|"),
+        convert_options=csv.ConvertOptions(
+            include_columns=list(names.values()),
+            column_types={c: COLUMNS[s] for s, c in names.items()},
+        ),
+    )
+
+
+def _batches(file: Path) -> Iterator[pd.DataFrame]:
+    """The rows of Ukraine in a CRS file, batch by batch"""
+    names = {_snake(c): c for c in _header(file) if _snake(c) in COLUMNS}
+    missing = [c for c in COLUMNS if c not in names]
+    if missing:
+        raise ValueError(f"{file.name} has no {missing} columns")
+
+    # The same columns and types whatever the format of the file
+    schema = pa.schema([(c, COLUMNS[c]) for c in names])
+
+    for batch in _read(file, names):
+        recipient = batch.column(names["recipient_code"])
+        batch = batch.filter(pc.equal(recipient, RECIPIENT_CODE))
+        if batch.num_rows:
+            batch = batch.select(list(names.values())).rename_columns(list(names))
+            yield batch.cast(schema).to_pandas()
+
+
+def aggregate_crs(files: list[Path] | None = None) -> pd.DataFrame:
+    """ODA to Ukraine by donor, year, sector and flow type, from the CRS files"""
+    files = crs_files() if files is None else files
+
+    totals = None
+    names = {code: {} for code in NAMES}
+
+    for file in files:
+        for batch in _batches(file):
+            for code, name in NAMES.items():
+                latest = batch.drop_duplicates(code, keep="last")
+                names[code].update(zip(latest[code], latest[name]))
+
+            part = batch.groupby(KEYS, dropna=False)[list(VALUES)].sum(min_count=1)
+            totals = part if totals is None else totals.add(part, fill_value=0)
+
+    if totals is None:
+        return pd.DataFrame(columns=KEYS + list(NAMES.values()) + list(VALUES.values()))
+
+    totals = totals.reset_index()
+    for code, name in NAMES.items():
+        totals[name] = totals[code].map(names[code])
+
+    return (
+        totals.rename(columns=VALUES)
+        .filter(
+            ["year", "donor_code", "donor_name", "sector_code", "sector_name"]
+            + ["flow_code", "flow_name", "commitments", "disbursements"],
+            axis=1,
+        )
+        .sort_values(["donor_name", "year", "sector_code", "flow_code"])
+        .reset_index(drop=True)
+    )
+
+
+def update_crs_ukraine() -> None:
+    """Export the ODA to Ukraine from the CRS files of raw_data/crs"""
+    files = crs_files()
+    if not files:
+        print(f"No CRS files in {CRS_FOLDER}. Skipping the ODA to Ukraine")
+        return
+
+    df = aggregate_crs(files)
+    df.to_csv(OUTPUT_FILE, index=False)
+    print(f"Exported ODA to Ukraine ({len(df)} rows, from {len(files)} CRS files)")
+
+
+# -----------------------------------------------------------------------------
+# Benchmark
+
+
+def _write_synthetic(
+    folder: Path, years: int, rows: int = 1_000_000, chunk: int = 250_000
+) -> list[Path]:
+    """Write CRS-like text files (one per year of `rows` rows, ~330 bytes per row,
+    1% of the rows for Ukraine), in chunks"""
+    random = np.random.default_rng(0)
+    titles = np.array([f"Project {i} " + "x" * (i % 60) for i in range(500)])
+    descriptions = np.array(
+        [f"Description {i} " + "y" * (150 + i % 100) for i in range(500)]
+    )
+
+    files = []
+    for year in range(2018, 2018 + years):
+        file = folder / f"CRS {year} data.txt"
+        for start in range(0, rows, chunk):
+            n = min(chunk, rows - start)
+            donor = random.integers(1, 80, n)
+            sector = random.choice([110, 120, 150, 160, 210, 310, 720, 930, 998], n)
+            flow = random.choice([11, 13, 19], n)
+            recipient = np.where(random.random(n) < 0.01, RECIPIENT_CODE, 1000)
+            pd.DataFrame(
+                {
+                    "Year": year,
+                    "DonorCode": donor,
+                    "DonorName": np.char.add("Donor ", donor.astype(str)),
+                    "AgencyCode": random.integers(1, 20, n),
+                    "RecipientCode": recipient,
+                    "RecipientName": np.where(recipient == 85, "Ukraine", "Other"),
+                    "FlowCode": flow,
+                    "FlowName": np.char.add("Flow ", flow.astype(str)),
+                    "SectorCode": sector,
+                    "SectorName": np.char.add("Sector ", sector.astype(str)),
+                    "ProjectTitle": titles[random.integers(0, 500, n)],
+                    "LongDescription": descriptions[random.integers(0, 500, n)],
+                    "USD_Commitment": random.gamma(1, 2, n).round(5),
+                    "USD_Disbursement": random.gamma(1, 2, n).round(5),
+                }
+            ).to_csv(file, sep="|", index=False, mode="a", header=start == 0)
+        files.append(file)
+
+    return files
+
+
+def _measure(files: list[Path], mode: str) -> dict:
+    """Time and peak memory of an aggregation (run in a new process)"""
+    import resource
+    import time
+
+    start = time.perf_counter()
+    if mode == "streamed":
+        result = aggregate_crs(files)
+    else:
+        # The columns are projected, but every row is read before filtering
+        result = (
+            pd.concat(
+                [
+                    pd.read_csv(f, sep="|", usecols=lambda c: _snake(c) in COLUMNS)
+                    for f in files
+                ]
+            )
+            .rename(columns=_snake)
+            .loc[lambda d: d.recipient_code == RECIPIENT_CODE]
+            .groupby(KEYS)[list(VALUES)]
+            .sum()
+        )
+
+    return {
+        "seconds": round(time.perf_counter() - start, 1),
+        # kilobytes on linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3),
+        "groups": len(result),
+    }
+
+
+def benchmark(years: tuple[int, ...] = (1, 2, 4, 8)) -> pd.DataFrame:
+    """Time and peak memory of the streamed aggregation and of a full read, for a
+    growing number of synthetic CRS files (one per year, 1 million rows each)"""
+    import shutil
+    import tempfile
+    from concurrent.futures import ProcessPoolExecutor
+
+    folder = Path(tempfile.mkdtemp(prefix="crs-benchmark-"))
+    results = []
+    try:
+        files = _write_synthetic(folder, max(years))
+        for n in years:
+            size = sum(f.stat().st_size for f in files[:n]) / 1e6
+            for mode in ["streamed", "full read"]:
+                # A new process for each run, so that the peaks are not shared
+                with ProcessPoolExecutor(1) as pool:
+                    measure = pool.submit(_measure, files[:n], mode).result()
+                results.append(
+                    {"years": n, "files_mb": round(size), "mode": mode} | measure
+                )
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    return pd.DataFrame(results)
+
+
+if __name__ == "__main__":
+    print(benchmark().to_string(index=False))
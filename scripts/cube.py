@@ -0,0 +1,268 @@
+"""Donor x year x indicator x prices cube used as the single source for the charts.
+
+The cube is built once per run from the IDRC, ODA and GNI files and the refugee
+cost estimates. It holds current and constant prices, the estimates and the
+derived shares, in a long format stored as a parquet file sorted by donor and year.
+Chart outputs are projections, filters or pivots of the cube.
+"""
+
+from functools import cache
+
+import pandas as pd
+
+from scripts.config import PATHS, set_data_paths
+
+CUBE_FILE = PATHS.output / "tracker_cube.parquet"
+
+BASE_YEAR: int = 2022
+
+# Year of the latest reported IDRC, added to the estimated additional costs
+LATEST_IDRC_YEAR: int = 2021
+
+# Years for which IDRC is estimated from the refugee cost estimates
+ESTIMATE_YEARS: list[int] = [2023, 2024]
+
+# Derived shares (in %): name -> (numerator, denominator)
+SHARES: dict[str, tuple[str, str]] = {
+    "idrc_oda": ("idrc", "total_oda"),
+    "idrc_gni": ("idrc", "gni"),
+    "oda_gni": ("total_oda", "gni"),
+}
+
+INDEX: list[str] = ["iso_code", "year", "prices"]
+
+
+def _reported_data(
+    idrc: pd.DataFrame | None = None,
+    oda: pd.DataFrame | None = None,
+    gni: pd.DataFrame | None = None,
+) -> pd.DataFrame:
+    """Reported IDRC, ODA and GNI, in current prices, as a long DataFrame. The
+    panels are read from the saved files if not given"""
+    from bblocks.dataframe_tools.add import add_iso_codes_column
+
+    from scripts.oda import read_gni, read_idrc, read_oda
+
+    idrc = read_idrc() if idrc is None else idrc
+    oda = read_oda() if oda is None else oda
+    gni = read_gni() if gni is None else gni
+
+    data = [
+        idrc.rename(columns={"idrc": "value"}).assign(indicator="idrc"),
+        oda.rename(columns={"total_oda": "value"}).assign(indicator="total_oda"),
+        gni.rename(columns={"gni": "value"}).assign(indicator="gni"),
+    ]
+
+    return (
+        pd.concat(data, ignore_index=True)
+        # bblocks fills unmatched names in place, which categoricals don't allow
+        .astype({"donor_name": str})
+        .pipe(add_iso_codes_column, id_column="donor_name", id_type="regex")
+        .filter(["iso_code", "year", "indicator", "value"], axis=1)
+    )
+
+
+def _to_constant(data: pd.DataFrame) -> pd.DataFrame:
+    """Deflate every indicator to constant prices in a single call"""
+    from pydeflate import deflate
+
+    set_data_paths()
+
+    return deflate(
+        df=data.copy(deep=True),
+        base_year=BASE_YEAR,
+        deflator_source="oecd_dac",
+        deflator_method="dac_deflator",
+        exchange_source="oecd_dac",
+        exchange_method="implied",
+        id_column="iso_code",
+        id_type="ISO3",
+        date_column="year",
+        source_column="value",
+        target_column="value",
+    )
+
+
+def _idrc_estimates(
+    reported: pd.DataFrame, refugee_costs: pd.DataFrame | None = None
+) -> pd.DataFrame:
+    """Estimated IDRC: the additional refugee costs (the saved cost estimates if
+    not given) plus the latest reported IDRC"""
+    from scripts.oda import read_refugee_cost_data
+    from scripts.scope import in_scope
+
+    if refugee_costs is None:
+        refugee_costs = read_refugee_cost_data()
+
+    additional = (
+        refugee_costs.pipe(in_scope)
+        .drop(["total_refugees"], axis=1)
+        .rename(columns={"cost22": 2022, "cost23": 2023, "cost24": 2024})
+        .melt(id_vars=["iso_code"], var_name="year", value_name="additional")
+        .assign(additional=lambda d: d.additional / 1e6)
+        .loc[lambda d: d.year.isin(ESTIMATE_YEARS)]
+    )
+
+    latest = reported.loc[
+        lambda d: (d.indicator == "idrc") & (d.year == LATEST_IDRC_YEAR)
+    ].filter(["iso_code", "prices", "value"], axis=1)
+
+    # One set of estimates per price basis
+    return (
+        additional.merge(pd.Series(latest.prices.unique(), name="prices"), how="cross")
+        .merge(latest, on=["iso_code", "prices"], how="left")
+        .assign(
+            value=lambda d: (d.additional + d.value).where(d.additional > 1, 0),
+            indicator="idrc",
+        )
+        .drop("additional", axis=1)
+    )
+
+
+def _gni_estimates(reported: pd.DataFrame) -> pd.DataFrame:
+    """GNI for the estimated years, assumed equal to the base year GNI"""
+    gni = reported.loc[lambda d: (d.indicator == "gni") & (d.year == BASE_YEAR)]
+
+    return pd.concat(
+        [gni.assign(year=year) for year in ESTIMATE_YEARS], ignore_index=True
+    )
+
+
+def _add_shares(data: pd.DataFrame) -> pd.DataFrame:
+    """Add the derived shares, computed on the (donor, year, prices) wide table"""
+    wide = data.set_index(INDEX + ["indicator"]).value.unstack("indicator")
+    estimate = data.groupby(INDEX).estimate.any()
+
+    for share, (numerator, denominator) in SHARES.items():
+        wide[share] = 100 * wide[numerator] / wide[denominator]
+
+    shares = (
+        wide.filter(SHARES, axis=1)
+        .join(estimate)
+        .reset_index()
+        .melt(id_vars=INDEX + ["estimate"], var_name="indicator", value_name="value")
+        .dropna(subset=["value"])
+    )
+
+    return pd.concat([data, shares], ignore_index=True)
+
+
+def compute_cube(
+    idrc: pd.DataFrame | None = None,
+    oda: pd.DataFrame | None = None,
+    gni: pd.DataFrame | None = None,
+    refugee_costs: pd.DataFrame | None = None,
+) -> pd.DataFrame:
+    """The cube, sorted by donor and year. The panels and the refugee cost
+    estimates are read from the saved files if not given"""
+    from scripts.oda import convert_unique
+    from scripts.scope import in_scope
+
+    current = _reported_data(idrc, oda, gni).assign(prices="current")
+    constant = _to_constant(current).assign(prices="constant")
+    reported = pd.concat([current, constant], ignore_index=True)
+
+    # The estimates keep their missing values so that every estimated donor has a row
+    return (
+        pd.concat(
+            [
+                reported.assign(estimate=False),
+                _idrc_estimates(reported, refugee_costs).assign(estimate=True),
+                _gni_estimates(reported).assign(estimate=True),
+            ],
+            ignore_index=True,
+        )
+        .pipe(_add_shares)
+        .pipe(in_scope, year_column="year")
+        .assign(donor_name=lambda d: convert_unique(d.iso_code, to="name_short"))
+        .filter(
+            ["iso_code", "donor_name", "year"]
+            + ["indicator", "prices", "estimate", "value"],
+            axis=1,
+        )
+        .astype(
+            {
+                "iso_code": "category",
+                "donor_name": "category",
+                "year": "int16",
+                "indicator": "category",
+                "prices": "category",
+                "value": "float64",
+            }
+        )
+        .sort_values(["iso_code", "year", "indicator", "prices"])
+        .reset_index(drop=True)
+    )
+
+
+def build_cube() -> pd.DataFrame:
+    """Build the cube and save it as a parquet file sorted by donor and year"""
+    cube = compute_cube()
+
+    cube.to_parquet(CUBE_FILE, index=False)
+    load_cube.cache_clear()
+    print("Built the tracker data cube")
+
+    return cube
+
+
+@cache
+def load_cube() -> pd.DataFrame:
+    """Read the cube, indexed by donor and year. It is built if it doesn't exist"""
+    if not CUBE_FILE.exists():
+        build_cube()
+
+    return index_cube(pd.read_parquet(CUBE_FILE))
+
+
+def index_cube(cube: pd.DataFrame) -> pd.DataFrame:
+    """The cube indexed by donor and year"""
+    return (
+        cube.set_index(["donor_name", "year"], drop=False)
+        .rename_axis(["donor", "period"])
+        .sort_index()
+    )
+
+
+def cube_view(
+    indicators: list[str],
+    prices: str = "current",
+    estimates: bool | None = None,
+    years: list[int] | None = None,
+    cube: pd.DataFrame | None = None,
+) -> pd.DataFrame:
+    """A wide (donor, year) x indicator view of the cube.
+
+    Args:
+        indicators: the indicators to keep as columns.
+        prices: "current" or "constant".
+        estimates: True to keep only estimates, False to keep only reported data,
+            None to keep both.
+        years: optionally, the years to keep.
+        cube: the indexed cube (see index_cube). By default, the saved cube.
+    """
+    from scripts import scope
+
+    cube = load_cube() if cube is None else cube
+
+    mask = cube.indicator.isin(indicators) & (cube.prices == prices)
+    if estimates is not None:
+        mask &= cube.estimate == estimates
+    if years is not None:
+        mask &= cube.year.isin(years)
+    if scope.DONORS is not None:
+        mask &= cube.iso_code.isin(scope.DONORS)
+    if scope.YEARS is not None:
+        mask &= cube.year.isin(scope.YEARS)
+
+    return (
+        cube.loc[mask]
+        .astype({"iso_code": str, "donor_name": str, "indicator": str})
+        .set_index(["iso_code", "donor_name", "year", "indicator"])
+        .value.unstack("indicator")
+        .reindex(columns=indicators)
+        .rename_axis(columns=None)
+        .reset_index(["iso_code", "donor_name", "year"])
+        .reset_index(drop=True)
+        .astype({"year": "int64"})
+    )
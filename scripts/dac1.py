@@ -0,0 +1,221 @@
+"""Single-pass loader for the DAC1 indicators used by the tracker.
+
+The raw DAC1 file downloaded by oda_data is read once, keeping only the columns
+and the donors, years and aid types needed by the tracker. All indicators are
+extracted from that one read and returned as a long table.
+
+The local extracts of raw_data (e.g. table1_raw_2022_2022.feather) are read
+instead when they cover the years requested. The committed extract only covers
+2022 while the tracker reads 2010-2023, so a full run needs the bulk file, which
+is downloaded when it is not in raw_data.
+"""
+
+import json
+import re
+from functools import cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from scripts.config import PATHS, set_data_paths
+
+# The raw DAC1 file (all years), as saved by oda_data.download_dac1
+DAC1_FILE = PATHS.raw_data / "table1_raw.feather"
+
+# Local DAC1 extracts of a range of years: table1_raw_{first}_{last}.{format}
+EXTRACT = re.compile(r"table1_raw_(\d{4})_(\d{4})\.(feather|parquet)")
+
+# Indicators read directly from DAC1. Their filters come from oda_data's settings
+BASE_INDICATORS: list[str] = [
+    "total_oda_ge",
+    "total_oda_flow_net",
+    "idrc_ge",
+    "idrc_flow",
+    "gni",
+]
+
+# Indicators built from the base indicators: name -> components
+DERIVED_INDICATORS: dict[str, tuple[str, str]] = {
+    # grant equivalents, filled with flows where grant equivalents are missing
+    "idrc_ge_linked": ("idrc_ge", "idrc_flow"),
+    # flows before 2018, grant equivalents from 2018 onwards
+    "total_oda_official_definition": ("total_oda_flow_net", "total_oda_ge"),
+}
+
+# All the indicators needed by the tracker and the years they cover
+TRACKER_INDICATORS: list[str] = [
+    "idrc_ge_linked",
+    "gni",
+    "total_oda_ge",
+    "total_oda_official_definition",
+]
+TRACKER_YEARS = range(2010, 2024)
+
+COLUMNS: list[str] = ["donor_code", "year", "aidtype_code", "flows_code", "value"]
+
+
+@cache
+def dac_donors() -> dict[int, str]:
+    """DAC countries (plus Lithuania) as a {donor_code: donor_name} dictionary"""
+    from oda_data.tools.groupings import donor_groupings
+
+    return donor_groupings()["dac_countries"] | {84: "Lithuania"}
+
+
+@cache
+def _indicator_filters() -> pd.DataFrame:
+    """The aid type and flow codes of each base indicator, as defined by oda_data"""
+    from oda_data.config import OdaPATHS
+
+    with open(OdaPATHS.settings / "indicators.json", "r") as f:
+        indicators = json.load(f)
+
+    return pd.DataFrame(
+        [
+            {
+                "indicator": indicator,
+                "aidtype_code": indicators[indicator]["filters"]["aidtype_code"],
+                "flows_code": indicators[indicator]["filters"]["flows_code"],
+            }
+            for indicator in BASE_INDICATORS
+        ]
+    )
+
+
+def _base_indicators(indicators: list[str]) -> list[str]:
+    """Resolve the base indicators needed to build the requested indicators"""
+    base = []
+    for indicator in indicators:
+        if indicator in DERIVED_INDICATORS:
+            base.extend(DERIVED_INDICATORS[indicator])
+        elif indicator in BASE_INDICATORS:
+            base.append(indicator)
+        else:
+            raise ValueError(f"Indicator {indicator} is not supported")
+
+    return list(dict.fromkeys(base))
+
+
+def dac1_file(years: list | range) -> Path:
+    """The local DAC1 file with the years: the bulk file or, without it, an
+    extract covering the years. The bulk file is downloaded if there is neither"""
+    if DAC1_FILE.exists():
+        return DAC1_FILE
+
+    # Feather extracts first, the format of the bulk file
+    extracts = sorted(
+        (f for f in DAC1_FILE.parent.glob("table1_raw_*") if EXTRACT.fullmatch(f.name)),
+        key=lambda f: f.suffix != ".feather",
+    )
+    for file in extracts:
+        first, last, _ = EXTRACT.fullmatch(file.name).groups()
+        if years and all(int(first) <= y <= int(last) for y in years):
+            return file
+
+    from oda_data import download_dac1
+
+    set_data_paths()
+    download_dac1()
+
+    return DAC1_FILE
+
+
+def read_dac1(
+    indicators: list[str], years: list | range, donors: list[int]
+) -> pd.DataFrame:
+    """Read the DAC1 file once, pushing the column selection and the donor, year
+    and aid type filters down to the reader"""
+    import pyarrow.dataset as ds
+
+    file = dac1_file(years)
+
+    filters = _indicator_filters().loc[lambda d: d.indicator.isin(indicators)]
+
+    expression = (
+        ds.field("donor_code").isin(donors)
+        & ds.field("year").isin(list(years))
+        & ds.field("aidtype_code").isin(filters.aidtype_code.unique().tolist())
+        & ds.field("flows_code").isin(filters.flows_code.unique().tolist())
+        & (ds.field("amounttype_code") == "A")
+    )
+
+    file_format = "parquet" if file.suffix == ".parquet" else "feather"
+
+    data = (
+        ds.dataset(file, format=file_format)
+        .to_table(columns=COLUMNS, filter=expression)
+        .to_pandas()
+    )
+
+    # An inner merge on the codes labels each row with its indicator
+    return data.merge(filters, on=["aidtype_code", "flows_code"], how="inner").filter(
+        ["donor_code", "year", "indicator", "value"], axis=1
+    )
+
+
+def _add_derived_indicators(data: pd.DataFrame) -> pd.DataFrame:
+    """Build the derived indicators as columns of a (donor, year) x indicator table"""
+    wide = data.pivot_table(
+        index=["donor_code", "year"], columns="indicator", values="value", aggfunc="sum"
+    ).reindex(columns=BASE_INDICATORS)
+
+    main, fallback = DERIVED_INDICATORS["idrc_ge_linked"]
+    wide["idrc_ge_linked"] = wide[main].fillna(wide[fallback])
+
+    flows, grant_equivalents = DERIVED_INDICATORS["total_oda_official_definition"]
+    years = wide.index.get_level_values("year")
+    wide["total_oda_official_definition"] = np.where(
+        years < 2018, wide[flows], wide[grant_equivalents]
+    )
+
+    return wide
+
+
+def load_dac1_indicators(
+    indicators: list[str] | None = None, years: list | range = TRACKER_YEARS
+) -> pd.DataFrame:
+    """Load several DAC1 indicators in one pass.
+
+    Returns a long DataFrame with donor_code, donor_name, year, indicator and value
+    columns. Values are in current USD millions.
+    """
+    from scripts.oda import convert_unique
+    from scripts.scope import DONORS, scoped_years
+
+    indicators = TRACKER_INDICATORS if indicators is None else indicators
+    donors = dac_donors()
+    years = scoped_years(years)
+
+    # Only the donors in scope are read
+    if DONORS is not None:
+        codes = convert_unique(pd.Series(donors), to="ISO3")
+        donors = {c: n for c, n in donors.items() if codes[c] in DONORS}
+
+    data = read_dac1(
+        indicators=_base_indicators(indicators), years=years, donors=list(donors)
+    )
+
+    return (
+        data.pipe(_add_derived_indicators)
+        .filter(indicators, axis=1)
+        .rename_axis(columns="indicator")
+        .stack()
+        .rename("value")
+        .reset_index()
+        .assign(donor_name=lambda d: d.donor_code.map(donors))
+        .filter(["donor_code", "donor_name", "year", "indicator", "value"], axis=1)
+        .sort_values(["indicator", "year", "donor_code"])
+        .reset_index(drop=True)
+    )
+
+
+@cache
+def tracker_dac1_data() -> pd.DataFrame:
+    """All the DAC1 indicators used by the tracker, read once per process"""
+    from scripts.shared import attach
+
+    if (shared := attach("dac1")) is not None:
+        return shared
+
+    return load_dac1_indicators(TRACKER_INDICATORS, TRACKER_YEARS)
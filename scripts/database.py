@@ -0,0 +1,265 @@
+"""Export of the tracker data to a single SQLite database (`output/tracker.sqlite`).
+
+The data is stored in normalized tables (countries, donor groups, the indicators of
+the cube, the monthly refugee ledger, the cost estimates, the asylum applications
+and the latest ODA), indexed on iso_code and year. Views reproduce the charts
+from these tables, e.g.
+
+    SELECT * FROM idrc_share_chart WHERE Donor = 'Germany' AND year >= 2020
+
+The database is written with bulk inserts in a single transaction, to a temporary
+file that replaces the previous database when it is complete.
+"""
+
+import os
+import sqlite3
+
+import pandas as pd
+
+from scripts.config import PATHS
+
+DB_FILE = PATHS.output / "tracker.sqlite"
+
+# table -> columns (name and type)
+TABLES: dict[str, list[str]] = {
+    "countries": ["iso_code TEXT", "name TEXT"],
+    "donor_groups": ["group_name TEXT", "iso_code TEXT"],
+    "indicators": [
+        "iso_code TEXT",
+        "year INTEGER",
+        "indicator TEXT",
+        "prices TEXT",
+        "estimate INTEGER",
+        "value REAL",
+    ],
+    "refugees_monthly": [
+        "iso_code TEXT",
+        "month TEXT",
+        "refugees INTEGER",
+        "difference REAL",
+        "ratio22 REAL",
+        "ratio23 REAL",
+        "ratio24 REAL",
+        "imputed INTEGER",
+    ],
+    "crisis_refugees": ["crisis TEXT", "iso_code TEXT", "total_refugees REAL"],
+    "cost_estimates": ["crisis TEXT", "iso_code TEXT", "year INTEGER", "cost REAL"],
+    "asylum_applications": ["iso_code TEXT", "year INTEGER", "applications INTEGER"],
+    "latest_oda": [
+        "iso_code TEXT",
+        "year INTEGER",
+        "indicator TEXT",
+        "prices TEXT",
+        "currency TEXT",
+        "donor_code INTEGER",
+        "value REAL",
+    ],
+}
+
+KEYS: dict[str, str] = {
+    "countries": "iso_code",
+    "donor_groups": "group_name, iso_code",
+    "asylum_applications": "iso_code, year",
+}
+
+INDEXES: list[str] = [
+    "CREATE INDEX ix_groups_iso ON donor_groups (iso_code)",
+    "CREATE INDEX ix_indicators_iso_year ON indicators (iso_code, year)",
+    "CREATE INDEX ix_indicators_year ON indicators (indicator, prices, year)",
+    "CREATE INDEX ix_refugees_iso_month ON refugees_monthly (iso_code, month)",
+    "CREATE INDEX ix_crisis_refugees_iso ON crisis_refugees (iso_code, crisis)",
+    "CREATE INDEX ix_costs_iso_year ON cost_estimates (iso_code, year)",
+    "CREATE INDEX ix_latest_oda_iso_year ON latest_oda (iso_code, year)",
+]
+
+# Views matching the chart outputs (long format: the chart pages and the wide
+# pivot are presentation steps)
+VIEWS: dict[str, str] = {
+    "donor_indicators": """
+        SELECT i.iso_code, c.name AS donor_name, i.year, i.prices, i.estimate,
+            MAX(CASE WHEN i.indicator = 'idrc' THEN i.value END) AS idrc,
+            MAX(CASE WHEN i.indicator = 'total_oda' THEN i.value END) AS total_oda,
+            MAX(CASE WHEN i.indicator = 'gni' THEN i.value END) AS gni,
+            MAX(CASE WHEN i.indicator = 'idrc_oda' THEN i.value END) AS idrc_oda
+        FROM indicators i JOIN countries c USING (iso_code)
+        GROUP BY i.iso_code, i.year, i.prices, i.estimate""",
+    "idrc_share_chart": """
+        SELECT d.year, SUM(COALESCE(d.idrc, 0)) AS idrc,
+            SUM(COALESCE(d.total_oda, 0)) AS total_oda,
+            ROUND(100 * SUM(COALESCE(d.idrc, 0)) / SUM(COALESCE(d.total_oda, 0)), 5)
+                AS share,
+            g.group_name AS Donor
+        FROM donor_indicators d JOIN donor_groups g USING (iso_code)
+        WHERE d.prices = 'current' AND d.estimate = 0
+        GROUP BY g.group_name, d.year
+        UNION ALL
+        SELECT year, idrc, total_oda, ROUND(idrc_oda, 5), donor_name
+        FROM donor_indicators
+        WHERE prices = 'current' AND estimate = 0
+            AND (idrc IS NOT NULL OR total_oda IS NOT NULL)""",
+    "idrc_oda_chart": """
+        SELECT year, donor_name AS Donor,
+            CASE WHEN MAX(idrc) > 1 THEN MAX(idrc) END AS "In-Donor Refugee Costs",
+            CASE WHEN year < 2023 THEN MAX(total_oda) END AS "Total ODA",
+            CASE WHEN year < 2023 THEN MAX(gni) END AS GNI,
+            CASE WHEN year < 2023 THEN ROUND(
+                100 * COALESCE(CASE WHEN MAX(idrc) > 1 THEN MAX(idrc) END, 0)
+                / MAX(gni), 3) END AS "IDRC as a share of GNI",
+            CASE WHEN year < 2023 THEN ROUND(
+                100 * COALESCE(MAX(total_oda), 0) / MAX(gni), 2) END
+                AS "ODA as a share of GNI"
+        FROM donor_indicators
+        WHERE prices = 'current' AND year IN (2012, 2016, 2021, 2022, 2023, 2024)
+        GROUP BY iso_code, year""",
+    "idrc_constant_chart": """
+        SELECT d.year, g.group_name AS donor_name, SUM(d.idrc) AS idrc
+        FROM donor_indicators d JOIN donor_groups g USING (iso_code)
+        WHERE d.prices = 'constant' AND g.group_name = 'DAC Countries, Total'
+            AND d.year >= 2012 AND d.idrc > 0.0001
+        GROUP BY d.year, g.group_name
+        UNION ALL
+        SELECT year, donor_name, CASE WHEN idrc > 0.0001 THEN idrc END
+        FROM donor_indicators WHERE prices = 'constant' AND year >= 2012""",
+    "cost_estimates_chart": """
+        SELECT r.crisis, r.iso_code, r.total_refugees,
+            MAX(CASE WHEN e.year = 2022 THEN e.cost END) AS cost22,
+            MAX(CASE WHEN e.year = 2023 THEN e.cost END) AS cost23,
+            MAX(CASE WHEN e.year = 2024 THEN e.cost END) AS cost24
+        FROM crisis_refugees r
+            LEFT JOIN cost_estimates e USING (crisis, iso_code)
+        GROUP BY r.crisis, r.iso_code""",
+    "hcr_data": """
+        SELECT r.iso_code, c.name AS Country, r.month, r.refugees, r.difference,
+            r.ratio22, r.ratio23, r.ratio24, r.imputed
+        FROM refugees_monthly r LEFT JOIN countries c USING (iso_code)""",
+}
+
+
+def _cost_estimates() -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Refugees and cost estimates of every crisis, in long format"""
+    refugees, costs = [], []
+
+    for file in sorted(PATHS.output.glob("*_refugee_cost_estimates.csv")):
+        crisis = file.name.removesuffix("_refugee_cost_estimates.csv")
+        data = pd.read_csv(file).assign(crisis=crisis)
+        refugees.append(data.filter(["crisis", "iso_code", "total_refugees"]))
+        costs.append(
+            data.drop(columns="total_refugees")
+            .melt(id_vars=["crisis", "iso_code"], var_name="year", value_name="cost")
+            .assign(year=lambda d: 2000 + d.year.str[4:].astype(int))
+        )
+
+    return pd.concat(refugees), pd.concat(costs)
+
+
+def read_tables() -> dict[str, pd.DataFrame]:
+    """The normalized tables, from the outputs of the run"""
+    from scripts.aggregates import donor_groups
+    from scripts.cube import load_cube
+    from scripts.oda import convert_unique
+
+    cube = load_cube().reset_index(drop=True).astype({"iso_code": str})
+    hcr = pd.read_csv(PATHS.output / "hcr_data.csv")
+    oda = pd.read_csv(PATHS.output / "latest_oda.csv").assign(
+        iso_code=lambda d: convert_unique(d.donor_name, to="ISO3")
+    )
+    refugees, costs = _cost_estimates()
+
+    countries = (
+        pd.concat(
+            [
+                cube.filter(["iso_code", "donor_name"]).astype(str),
+                hcr.filter(["iso_code", "Country"]).set_axis(
+                    ["iso_code", "donor_name"], axis=1
+                ),
+            ]
+        )
+        .dropna(subset=["iso_code"])
+        .drop_duplicates("iso_code")
+        .set_axis(["iso_code", "name"], axis=1)
+    )
+
+    iso_codes = dict(zip(countries.name, countries.iso_code))
+    groups = pd.DataFrame(
+        [
+            (group, iso_codes[donor])
+            for group, donors in donor_groups().items()
+            for donor in donors
+            if donor in iso_codes
+        ],
+        columns=["group_name", "iso_code"],
+    ).drop_duplicates()
+
+    return {
+        "countries": countries,
+        "donor_groups": groups,
+        "indicators": cube.filter(
+            ["iso_code", "year", "indicator", "prices", "estimate", "value"]
+        ).astype({"indicator": str, "prices": str, "estimate": int}),
+        "refugees_monthly": hcr.assign(
+            month=lambda d: pd.to_datetime(d["Data Date"], format="%m-%Y").dt.strftime(
+                "%Y-%m"
+            ),
+            refugees=hcr["Refugees from Ukraine recorded in country as of date"],
+            imputed=hcr.get("imputed", False),
+        ),
+        "crisis_refugees": refugees,
+        "cost_estimates": costs,
+        "asylum_applications": pd.read_feather(
+            PATHS.output / "unhcr_data_high.feather"
+        ).rename(columns={"value": "applications"}),
+        "latest_oda": oda,
+    }
+
+
+def _rows(df: pd.DataFrame, columns: list[str]) -> list[tuple]:
+    """Rows as tuples of python values, with None for missing values"""
+    df = df.filter(columns).astype(object)
+    return list(df.where(df.notna(), None).itertuples(index=False, name=None))
+
+
+def export_database(tables: dict[str, pd.DataFrame] | None = None) -> None:
+    """Write the tables, indexes and views to the database, in one transaction"""
+    tables = read_tables() if tables is None else tables
+
+    temporary = DB_FILE.with_suffix(".tmp")
+    temporary.unlink(missing_ok=True)
+
+    con = sqlite3.connect(temporary, isolation_level=None)
+    try:
+        # The file only replaces the database once complete
+        con.execute("PRAGMA journal_mode = OFF")
+        con.execute("PRAGMA synchronous = OFF")
+        con.execute("BEGIN")
+
+        for name, schema in TABLES.items():
+            key = [f"PRIMARY KEY ({KEYS[name]})"] if name in KEYS else []
+            con.execute(f"CREATE TABLE {name} ({', '.join(schema + key)})")
+            columns = [column.split()[0] for column in schema]
+            con.executemany(
+                f"INSERT INTO {name} ({', '.join(columns)}) "
+                f"VALUES ({', '.join('?' * len(columns))})",
+                _rows(tables[name], columns),
+            )
+
+        for index in INDEXES:
+            con.execute(index)
+        for name, query in VIEWS.items():
+            con.execute(f"CREATE VIEW {name} AS {query}")
+
+        con.execute("COMMIT")
+        con.execute("ANALYZE")
+    except BaseException:
+        # No partial database is left behind (closed first, to be removable)
+        con.close()
+        temporary.unlink(missing_ok=True)
+        raise
+    finally:
+        con.close()
+
+    os.replace(temporary, DB_FILE)
+    print(f"Exported the tracker database ({len(TABLES)} tables, {len(VIEWS)} views)")
+
+
+if __name__ == "__main__":
+    export_database()
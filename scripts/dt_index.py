@@ -0,0 +1,291 @@
+"""Local store and inverted index of the Donor Tracker articles.
+
+The articles are synced from the CMS into `raw_data/dt_store.json`. The first sync
+(or a sync of an incomplete store, e.g. seeded with dt_articles.json) downloads
+every page. Later syncs only download the pages with new articles and the articles
+modified since the last modification stored (`date_updated`). An inverted index over the title, the
+content, the funders and the topics is built in memory, and the tables in
+`config.DT_TABLES` are produced from local queries, without a CMS query per table.
+
+Queries are made of terms, combined with AND (or a space), OR, NOT and brackets.
+Terms can be restricted to a field (title:, content:, funder:, topic:) and
+end with * to match a prefix, e.g.
+
+    ukraine AND (refugee* OR funder:poland) NOT topic:debt
+"""
+
+import ast
+import json
+import re
+from functools import cache
+
+from scripts import config
+
+STORE_FILE = config.PATHS.raw_data / "dt_store.json"
+
+DT_ITEMS: str = "https://cms.donortracker.org/items/policy_updates"
+
+FIELDS: list[str] = ["title", "content", "funder", "topic"]
+
+# Fields of the articles downloaded from the CMS
+ARTICLE_FIELDS: list[str] = [
+    "title",
+    "slug",
+    "publish_date",
+    "date_updated",
+    "content",
+    "sources",
+    "funders.funder_profiles_id.name",
+    "topics.topics_id.name",
+]
+
+# Pages read by a full sync, at most
+MAX_PAGES: int = 1_000
+
+
+def _names(value, key: str) -> list[str]:
+    """Names of the funders or topics of an article. The CMS returns them as lists,
+    older downloads stored them as strings"""
+    if isinstance(value, str):
+        value = ast.literal_eval(value) if value else []
+    return [item[key]["name"] for item in value or [] if item.get(key)]
+
+
+def _tokens(text: str) -> list[str]:
+    text = re.sub(r":abbr\[(.*?)\]", r"\1", text or "")
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+def _read_state() -> dict:
+    """The stored articles (by slug) and whether the store holds all of them. Older
+    stores (articles only) and the dt_articles.json seed are incomplete"""
+    if STORE_FILE.exists():
+        with open(STORE_FILE, "r") as f:
+            state = json.load(f)
+        if "articles" in state:
+            return state
+        return {"complete": False, "articles": state}
+
+    seed = config.PATHS.raw_data / "dt_articles.json"
+    if not seed.exists():
+        return {"complete": False, "articles": {}}
+
+    with open(seed, "r") as f:
+        articles = {article["slug"]: article for article in json.load(f)["data"]}
+
+    return {"complete": False, "articles": articles}
+
+
+def read_store() -> dict[str, dict]:
+    """The stored articles, by slug. The store is seeded with dt_articles.json"""
+    return _read_state()["articles"]
+
+
+def _pages(filter_: dict, sort: str, page_size: int, max_pages: int):
+    """The pages of published articles matching the filter"""
+    import requests
+
+    for page in range(1, max_pages + 1):
+        params = {
+            "fields": ARTICLE_FIELDS,
+            "filter": json.dumps({"status": {"_eq": "published"}} | filter_),
+            "sort": sort,
+            "limit": page_size,
+            "page": page,
+        }
+        articles = requests.get(DT_ITEMS, params=params, timeout=60).json()["data"]
+        yield articles
+
+        if len(articles) < page_size:
+            return
+
+
+def _changed(article: dict, stored: dict | None) -> bool:
+    """Whether an article is new or was modified since it was stored"""
+    return stored is None or article.get("date_updated") != stored.get("date_updated")
+
+
+def sync_articles(page_size: int = 100, max_pages: int = 20) -> int:
+    """Download the articles that are new or modified since the last sync (every
+    article if the store is incomplete) and add them to the store. Returns the
+    number of articles added or updated"""
+    state = _read_state()
+    store = state["articles"]
+
+    if not state["complete"]:
+        # Full sync: the articles deleted or unpublished in the CMS are dropped
+        synced, articles = {}, []
+        for articles in _pages({}, "-publish_date", page_size, MAX_PAGES):
+            synced.update({a["slug"]: a for a in articles})
+
+        # A full last page: MAX_PAGES was reached, the store stays incomplete
+        complete = len(articles) < page_size
+
+        changed = sum(_changed(a, store.get(slug)) for slug, a in synced.items())
+        store = synced
+
+    else:
+        changed, complete = 0, True
+
+        # New articles, newest first: a page without new articles means that the
+        # rest is already stored
+        for articles in _pages({}, "-publish_date", page_size, max_pages):
+            fresh = [a for a in articles if a["slug"] not in store]
+            store.update({a["slug"]: a for a in fresh})
+            changed += len(fresh)
+            if not fresh:
+                break
+
+        # Articles modified since the last modification stored
+        updated = [a.get("date_updated") for a in store.values()]
+        latest = max((u for u in updated if u), default=None)
+        modified = {"date_updated": {"_gt": latest} if latest else {"_nnull": True}}
+
+        for articles in _pages(modified, "-date_updated", page_size, MAX_PAGES):
+            edited = [a for a in articles if _changed(a, store.get(a["slug"]))]
+            store.update({a["slug"]: a for a in edited})
+            changed += len(edited)
+
+    with open(STORE_FILE, "w") as f:
+        json.dump({"complete": complete, "articles": store}, f)
+
+    load_index.cache_clear()
+    print(
+        f"Synced Donor Tracker articles ({changed} new or updated, {len(store)} stored)"
+    )
+
+    return changed
+
+
+class ArticleIndex:
+    """Inverted index (field -> term -> article ids) over the stored articles"""
+
+    def __init__(self, articles: list[dict]):
+        # Newest first, so that query results are sorted by date
+        self.articles = sorted(articles, key=lambda a: a["publish_date"], reverse=True)
+        self.postings: dict[str, dict[str, set[int]]] = {f: {} for f in FIELDS}
+
+        for i, article in enumerate(self.articles):
+            texts = {
+                "title": article.get("title"),
+                "content": article.get("content"),
+                "funder": " ".join(
+                    _names(article.get("funders"), "funder_profiles_id")
+                ),
+                "topic": " ".join(_names(article.get("topics"), "topics_id")),
+            }
+            for field, text in texts.items():
+                for token in _tokens(text):
+                    self.postings[field].setdefault(token, set()).add(i)
+
+    def _term(self, term: str) -> set[int]:
+        field, _, word = term.rpartition(":")
+        fields = [field] if field in FIELDS else FIELDS
+
+        # A term with separators (e.g. in-donor) matches all its parts
+        words = _tokens(word.rstrip("*")) or [""]
+        prefix = word.endswith("*")
+
+        matches = None
+        for w in words:
+            ids = set()
+            for f in fields:
+                postings = self.postings[f]
+                if prefix and w == words[-1]:
+                    for t in postings:
+                        if t.startswith(w):
+                            ids |= postings[t]
+                else:
+                    ids |= postings.get(w, set())
+            matches = ids if matches is None else matches & ids
+
+        return matches
+
+    def search(self, query: str) -> list[dict]:
+        """The articles matching a query, newest first"""
+        tokens = re.findall(r"\(|\)|[^\s()]+", query)
+        everything = set(range(len(self.articles)))
+
+        def parse_or() -> set[int]:
+            ids = parse_and()
+            while tokens and tokens[0] == "OR":
+                tokens.pop(0)
+                ids = ids | parse_and()
+            return ids
+
+        def parse_and() -> set[int]:
+            ids = parse_not()
+            while tokens and tokens[0] not in ("OR", ")"):
+                if tokens[0] == "AND":
+                    tokens.pop(0)
+                ids = ids & parse_not()
+            return ids
+
+        def parse_not() -> set[int]:
+            if tokens and tokens[0] == "NOT":
+                tokens.pop(0)
+                return everything - parse_not()
+            return parse_atom()
+
+        def parse_atom() -> set[int]:
+            if not tokens:
+                raise ValueError(f"Incomplete query: {query}")
+            token = tokens.pop(0)
+            if token == "(":
+                ids = parse_or()
+                if not tokens or tokens.pop(0) != ")":
+                    raise ValueError(f"Unbalanced brackets in query: {query}")
+                return ids
+            return self._term(token)
+
+        ids = parse_or()
+        if tokens:
+            raise ValueError(f"Unexpected '{tokens[0]}' in query: {query}")
+
+        return [self.articles[i] for i in sorted(ids)]
+
+
+@cache
+def load_index() -> ArticleIndex:
+    """The index of the stored articles. It is kept in memory"""
+    return ArticleIndex(list(read_store().values()))
+
+
+def export_dt_tables(tables: dict[str, dict] | None = None) -> None:
+    """Write the Donor Tracker tables from local queries"""
+    import pandas as pd
+
+    from scripts.dt_table import dt_data_to_df
+
+    index = load_index()
+
+    for file, table in (tables or config.DT_TABLES).items():
+        articles = index.search(table["query"])[: config.ARTICLE_COUNT]
+        if not articles:
+            # An empty table, rather than the articles of a previous query
+            print(f"No articles for {file} ({table['query']})")
+            pd.DataFrame(columns=["title", "content"]).to_csv(
+                config.PATHS.output / file, index=False
+            )
+            continue
+
+        df = dt_data_to_df({"data": articles}, highlight=table["highlight"])
+        df.columns = ["title", "content"]
+        df.to_csv(config.PATHS.output / file, index=False)
+
+    print(f"Wrote {len(tables or config.DT_TABLES)} Donor Tracker tables")
+
+
+def update_dt_tables() -> None:
+    """Sync the articles once and write all the Donor Tracker tables"""
+    try:
+        sync_articles()
+    except (OSError, ValueError, KeyError) as e:
+        # The stored articles are used if the CMS can't be reached
+        print(f"Could not sync Donor Tracker articles: {e!r}")
+
+    export_dt_tables()
+
+
+if __name__ == "__main__":
+    update_dt_tables()
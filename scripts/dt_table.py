@@ -1,41 +1,56 @@
 import json
 
 import pandas as pd
-import requests
 
 from scripts import config
+from scripts.freshness import refresh_if_changed
+from scripts.swr import stale_while_revalidate
 
 
-def download_dt_data() -> json:
+def _dt_source(search: str = config.DT_SEARCH) -> str:
+    """The freshness source of a Donor Tracker search"""
+    for crisis in config.CRISES:
+        if config.crisis_config(crisis)["search"] == search:
+            return config.crisis_config(crisis)["dt_source"]
+    return config.crisis_config("ukraine")["dt_source"]
+
+
+@stale_while_revalidate(
+    "Donor Tracker articles", source=_dt_source, stages=["dt_table", "crises"]
+)
+def download_dt_data(search: str = config.DT_SEARCH) -> json:
     """Get data from Donor Tracker"""
-    url = config.DT_BASE + config.DT_SEARCH
+    import requests
+
+    url = config.DT_BASE + search
     r = requests.get(url)
     return r.json()
 
 
-def update_dt_data() -> None:
+def update_dt_data(crisis: str = "ukraine") -> None:
     """Update Donor Tracker data"""
-    data = download_dt_data()
-    with open(config.PATHS.raw_data / "dt_articles.json", "w") as f:
+    crisis = config.crisis_config(crisis)
+    data = download_dt_data(crisis["search"])
+    with open(config.PATHS.raw_data / crisis["dt_articles"], "w") as f:
         json.dump(data, f)
 
 
-def read_dt_data() -> json:
+def read_dt_data(file: str = "dt_articles.json") -> json:
     """Read Donor Tracker data"""
-    with open(config.PATHS.raw_data / "dt_articles.json", "r") as f:
+    with open(config.PATHS.raw_data / file, "r") as f:
         data = json.load(f)
     return data
 
 
-def _clean_content(content: str) -> str:
+def _clean_content(content: str, highlight: str = "Ukraine") -> str:
     """Remove the markdown formatting in favour of plain text"""
 
     import re
 
-    # remove acronym notes, highlight ukraine and remove titles, breaklines, etc
+    # remove acronym notes, highlight the country and remove titles, breaklines, etc
     new_content = (
         re.sub(r":abbr\[(.*?)\]", r"\1", content)
-        .replace("Ukraine", "<strong>Ukraine</strong>")
+        .replace(highlight, f"<strong>{highlight}</strong>")
         .replace(r"**", "")
         .replace(r"##", "")
         .replace("  ", " ")
@@ -51,12 +66,14 @@ def _clean_content(content: str) -> str:
     return new_content.replace(" . .", ". ")
 
 
-def _shorten_content(content: str, char_count: int = 200) -> str:
+def _shorten_content(
+    content: str, char_count: int = 200, highlight: str = "Ukraine"
+) -> str:
     """Shorten content to char_count characters"""
 
     if len(content) > char_count:
-        return _clean_content(content[:char_count] + "...")
-    return _clean_content(content)
+        return _clean_content(content[:char_count] + "...", highlight)
+    return _clean_content(content, highlight)
 
 
 def _convert_slug(df: pd.DataFrame) -> str:
@@ -73,13 +90,15 @@ def title_break_date(df: pd.DataFrame) -> str:
     return f"<strong>{df.title}</strong><br>{df.publish_date}"
 
 
-def clean_dt_data(df: pd.DataFrame) -> pd.DataFrame:
+def clean_dt_data(df: pd.DataFrame, highlight: str = "Ukraine") -> pd.DataFrame:
     """Clean Donor Tracker data"""
 
     return (
         df.assign(
             publish_date=pd.to_datetime(df.publish_date).dt.strftime("%d %b %Y"),
-            content=lambda d: d.content.apply(_shorten_content, char_count=200),
+            content=lambda d: d.content.apply(
+                _shorten_content, char_count=200, highlight=highlight
+            ),
             read_more=lambda d: d.apply(_convert_slug, axis=1),
             title_date=lambda d: d.apply(title_break_date, axis=1),
         )
@@ -90,29 +109,35 @@ def clean_dt_data(df: pd.DataFrame) -> pd.DataFrame:
     )
 
 
-def dt_data_to_df(dt_data: json) -> pd.DataFrame:
+def dt_data_to_df(dt_data: json, highlight: str = "Ukraine") -> pd.DataFrame:
     """Convert Donor Tracker data to a DataFrame"""
-    df = pd.DataFrame(dt_data["data"]).pipe(clean_dt_data)
+    df = pd.DataFrame(dt_data["data"]).pipe(clean_dt_data, highlight=highlight)
 
     return df
 
 
-def live_dt_table_pipeline() -> None:
-    """Run the pipeline to update the Donor Tracker table"""
-    # update the table data
-    update_dt_data()
-    print("Updated Donor Tracker data")
+def live_dt_table_pipeline(crisis: str = "ukraine") -> None:
+    """Run the pipeline to update the Donor Tracker table of a crisis"""
+    config_ = config.crisis_config(crisis)
+
+    # update the table data, only if there are new articles
+    if refresh_if_changed(
+        config_["dt_source"],
+        lambda: update_dt_data(crisis),
+        target=config.PATHS.raw_data / config_["dt_articles"],
+    ):
+        print("Updated Donor Tracker data")
 
     # read the table data
-    dt_data = read_dt_data()
+    dt_data = read_dt_data(config_["dt_articles"])
 
     # convert to a DataFrame
-    df = dt_data_to_df(dt_data)
+    df = dt_data_to_df(dt_data, highlight=config_["name"])
 
     df.columns = ["title", "content"]
 
     # write to a csv
-    df.to_csv(config.PATHS.output / "dt_table.csv", index=False)
+    df.to_csv(config.PATHS.output / config_["dt_table"], index=False)
     print("Wrote Donor Tracker table to csv")
 
 
@@ -0,0 +1,174 @@
+"""Cheap freshness checks for the upstream data sources.
+
+Each source is probed with a HEAD request (ETag / Last-Modified) or a small
+metadata query. The version found is compared with the one recorded in
+`raw_data/data_updates.json`, and the (expensive) refresh only runs when the
+source has changed.
+"""
+
+import hashlib
+import json
+from datetime import datetime
+from pathlib import Path
+from typing import Callable
+
+from scripts import config
+from scripts.config import PATHS
+
+REGISTRY_FILE = PATHS.raw_data / "data_updates.json"
+
+# method: "head" uses the ETag/Last-Modified headers (falling back to the body hash),
+# "get" hashes the body of a small query, "always" cannot be probed cheaply
+SOURCES: dict[str, dict] = {
+    "OECD DAC": {
+        "url": "https://stats.oecd.org/DownloadFiles.aspx?DatasetCode=TABLE1",
+        "method": "head",
+    },
+    "UNHCR asylum API": {
+        "url": (
+            "https://api.unhcr.org/population/v1/asylum-applications/"
+            "?limit=1&dataset=asylum-applications&displayType=totals"
+            "&yearFrom=2010&yearTo=2021&coa_all=true"
+        ),
+        "method": "get",
+    },
+    # The Power BI report is a javascript shell: the data cannot be probed cheaply
+    "UNHCR Power BI": {"url": None, "method": "always"},
+}
+
+# One Donor Tracker query per crisis
+SOURCES |= {
+    config.crisis_config(crisis)["dt_source"]: {
+        "url": (
+            "https://cms.donortracker.org/items/policy_updates?fields=slug&"
+            "fields=publish_date&filter={%22status%22:%22published%22}"
+            "&sort=-publish_date&limit=1&page=1&meta=filter_count"
+            f"&search={config.crisis_config(crisis)['search']}"
+        ),
+        "method": "get",
+    }
+    for crisis in config.CRISES
+}
+
+# Changes found by the scheduler: the refresh of the stage it runs uses them
+# (once) instead of probing the source again
+_PROBED: dict[str, str | None] = {}
+
+
+def read_registry() -> dict:
+    """Read the registry of source versions. Older entries (a date string)
+    are read as the date of the last update"""
+    if not REGISTRY_FILE.exists():
+        return {}
+
+    with open(REGISTRY_FILE, "r") as f:
+        registry = json.load(f)
+
+    return {
+        k: v if isinstance(v, dict) else {"version": None, "updated": v}
+        for k, v in registry.items()
+    }
+
+
+def save_registry(registry: dict) -> None:
+    """Save the registry of source versions"""
+    with open(REGISTRY_FILE, "w") as f:
+        json.dump(registry, f, indent=2)
+
+
+def _hash(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()[:16]
+
+
+def probe(url: str, method: str = "head", timeout: int = 30) -> str | None:
+    """Return a version identifier for the resource at url, or None if the
+    source could not be reached"""
+    import requests
+
+    try:
+        if method == "head":
+            r = requests.head(url, timeout=timeout, allow_redirects=True)
+            r.raise_for_status()
+            version = r.headers.get("ETag") or r.headers.get("Last-Modified")
+            if version is not None:
+                return version
+
+        r = requests.get(url, timeout=timeout)
+        r.raise_for_status()
+        return _hash(r.content)
+
+    except requests.RequestException as e:
+        print(f"Could not probe {url}: {e}")
+        return None
+
+
+def check_source(source: str, keep: bool = False) -> tuple[bool, str | None]:
+    """Check whether a source has changed since its version was last recorded.
+    Returns whether it changed and the version found upstream. With `keep`, a
+    change is kept for the next refresh_if_changed of the source"""
+    if source not in SOURCES:
+        raise ValueError(f"Unknown source: {source}. Valid sources: {list(SOURCES)}")
+
+    if SOURCES[source]["method"] == "always":
+        return True, None
+
+    version = probe(SOURCES[source]["url"], SOURCES[source]["method"])
+
+    if version is None:
+        return False, None
+
+    recorded = read_registry().get(source, {}).get("version")
+
+    if keep and version != recorded:
+        _PROBED[source] = version
+
+    return version != recorded, version
+
+
+def refresh_if_changed(
+    source: str, refresh: Callable[[], None], target: Path | None = None
+) -> bool:
+    """Run refresh only if the source changed (or the target file is missing),
+    then record the new version. Returns whether the refresh ran"""
+    if source in _PROBED:
+        changed, version = True, _PROBED.pop(source)
+    else:
+        changed, version = check_source(source)
+
+    if target is not None and not target.exists():
+        changed = True
+
+    if not changed:
+        print(f"{source} has not changed. Skipping download")
+        return False
+
+    from scripts.swr import served_stale
+
+    refresh()
+
+    # Written only when the data was refreshed: the registry is committed with the
+    # data, so a run without upstream changes leaves it as it was
+    registry = read_registry()
+    entry = registry.get(source, {"version": None, "updated": None})
+    entry["updated"] = datetime.today().strftime("%Y-%m-%d")
+    # Cached data may have been served: the version is recorded once fresh
+    if served_stale(source):
+        print(f"Refreshed {source} from the cache")
+    else:
+        entry["version"] = version or entry.get("version")
+        print(f"Refreshed {source}")
+
+    registry[source] = entry
+    save_registry(registry)
+
+    return True
+
+
+def check_all() -> dict[str, bool]:
+    """Check every source and return which ones have changed"""
+    return {source: check_source(source)[0] for source in SOURCES}
+
+
+if __name__ == "__main__":
+    for name, has_changed in check_all().items():
+        print(f"{name}: {'changed' if has_changed else 'up to date'}")
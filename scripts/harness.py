@@ -0,0 +1,359 @@
+"""Offline end-to-end run of the pipeline, with local stand-ins for the upstream
+services.
+
+A local http server replaces the external services, serving fixtures built from
+the data recorded in `raw_data` (the Donor Tracker articles, the UNHCR asylum
+data and the latest HCR snapshot):
+
+    /dt/items/policy_updates     Donor Tracker CMS (config.DT_BASE, dt_index)
+    /unhcr/asylum-applications/  UNHCR asylum API (zipped csv)
+    /unhcr/powerbi               cells of the UNHCR Power BI report (get_page)
+    /oecd/table1                 OECD DAC bulk file version (HEAD)
+
+The DAC bulk files are read from the local oda_data/pydeflate cache, which the
+stand-in reports as up to date. oda_data builds the DAC1 download links itself (on
+the OECD website), so the recorded DAC1 extract stands in for the bulk file. The pipeline runs on a copy of `raw_data` and
+`output` in a scratch folder, so the repository is not modified, and the wall-clock
+time and the peak memory of each stage are reported.
+
+The stand-ins can add latency, fail a share of the requests (503) and scale the
+Donor Tracker and UNHCR payloads (scaled payloads change the outputs, so they are
+only meant for timings):
+
+    python -m scripts e2e --latency 0.2 --error-rate 0.1 --scale 10
+"""
+
+import io
+import json
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+from scripts.config import PATHS
+
+# Version reported for the OECD DAC file. The scratch registry records it, so the
+# local bulk files are used instead of a download
+OECD_VERSION: str = "offline-fixture"
+
+# Recorded DAC1 extract used as the DAC1 bulk file (raw_data/table1_raw.feather)
+DAC1_FIXTURE: str = "table1_raw_2022_2022.feather"
+
+# Modules that read PATHS when they are imported. They must be imported after
+# the paths point to the scratch folder
+_PATH_MODULES: list[str] = [
+    "scripts.archive",
+    "scripts.changes",
+    "scripts.crs",
+    "scripts.cube",
+    "scripts.dac1",
+    "scripts.database",
+    "scripts.dt_index",
+    "scripts.freshness",
+    "scripts.preflight",
+    "scripts.prices",
+    "scripts.schedule",
+    "scripts.unhcr_data",
+    "scripts.watch",
+]
+
+
+def _dt_fixture(scale: int = 1) -> list[dict]:
+    """Donor Tracker articles, repeated `scale` times (with new slugs)"""
+    with open(PATHS.raw_data / "dt_articles.json", "r") as f:
+        articles = json.load(f)["data"]
+
+    return [
+        a | {"slug": a["slug"] if i == 0 else f"{a['slug']}-{i}"}
+        for i in range(scale)
+        for a in articles
+    ]
+
+
+def _asylum_fixture(scale: int = 1) -> bytes:
+    """The UNHCR asylum applications, as downloaded from the API (a zipped csv).
+    The recorded yearly totals are split in `scale` application types"""
+    data = pd.read_feather(PATHS.output / "unhcr_data_high.feather")
+
+    csv = pd.concat(
+        [
+            pd.DataFrame(
+                {
+                    "Year": data.year,
+                    "Country of asylum (ISO)": data.iso_code,
+                    "Application type": "N" if i == 0 else f"N{i}",
+                    "Applied": data.value,
+                }
+            )
+            for i in range(scale)
+        ],
+        ignore_index=True,
+    ).to_csv(index=False)
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("asylum-applications.csv", csv)
+
+    return buffer.getvalue()
+
+
+def _powerbi_fixture() -> list[str]:
+    """Cells of the Power BI report, rebuilt from the most recent HCR snapshot: the
+    neighbouring countries (two tables) and the other European countries"""
+    snapshots = [
+        pd.read_csv(f, parse_dates=["Data Date"], dayfirst=True)
+        for f in PATHS.raw_data.glob("*_hcr_data.csv")
+        if f.name != "latest_hcr_data.csv"
+    ]
+    data = max(snapshots, key=lambda d: d["Data Date"].max()).rename(
+        columns={
+            "Individual refugees from Ukraine recorded across Europe": "Refugees from "
+            "Ukraine recorded in country as of date"
+        }
+    )
+    data["Data Date"] = data["Data Date"].dt.strftime("%m/%d/%Y")
+
+    columns = list(data.columns[1:])
+    neighbours = data.loc[data[columns[-1]].notna(), columns]
+    others = data.loc[data[columns[-1]].isna(), columns[:4]]
+
+    def _table(df: pd.DataFrame) -> list[str]:
+        cells = df.map(lambda v: f"{v:,}" if isinstance(v, int) else str(v))
+        return list(df.columns) + cells.to_numpy().ravel().tolist() + ["Total"]
+
+    half = len(neighbours) // 2
+
+    return (
+        _table(neighbours.iloc[:half]) + _table(neighbours.iloc[half:]) + _table(others)
+    )
+
+
+class StandInServer:
+    """Local http server with the fixtures of the upstream services"""
+
+    def __init__(self, latency: float = 0, error_rate: float = 0, scale: int = 1):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests: dict[str, int] = {}
+        self._random = random.Random(0)
+        self._lock = threading.Lock()
+
+        self.articles = _dt_fixture(scale)
+        self.asylum = _asylum_fixture(scale)
+        self.powerbi = json.dumps(_powerbi_fixture()).encode()
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}"
+
+    def _articles(self, query: dict) -> bytes:
+        search = query.get("search", [""])[0].lower()
+        limit = int(query.get("limit", ["50"])[0])
+        page = int(query.get("page", ["1"])[0])
+
+        found = [
+            a
+            for a in self.articles
+            if search in f"{a.get('title')} {a.get('content')}".lower()
+        ]
+        data = found[(page - 1) * limit : page * limit]
+
+        return json.dumps({"data": data, "meta": {"filter_count": len(found)}}).encode()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _respond(self, body: bytes | None) -> None:
+                path = urlparse(self.path).path
+                with server._lock:
+                    server.requests[path] = server.requests.get(path, 0) + 1
+                    fail = server._random.random() < server.error_rate
+
+                time.sleep(server.latency)
+
+                if fail or body is None:
+                    self.send_response(503 if fail else 404)
+                    self.end_headers()
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+                if path.startswith("/oecd/"):
+                    self.send_header("ETag", OECD_VERSION)
+                self.end_headers()
+                if self.command == "GET":
+                    self.wfile.write(body)
+
+            def do_HEAD(self):
+                self._respond(b"" if self.path.startswith("/oecd/") else None)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                routes = {
+                    "/dt/items/policy_updates": lambda: server._articles(
+                        parse_qs(url.query)
+                    ),
+                    "/unhcr/asylum-applications/": lambda: server.asylum,
+                    "/unhcr/powerbi": lambda: server.powerbi,
+                    "/oecd/table1": lambda: b"",
+                }
+                self._respond(routes[url.path]() if url.path in routes else None)
+
+        return Handler
+
+    def start(self) -> "StandInServer":
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def _max_rss_mb() -> float | None:
+    """Peak resident memory of the process, in MB (not available on Windows)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / 1e6 if sys.platform == "darwin" else peak / 1e3, 1)
+
+
+def _use_scratch_folder(folder: Path) -> None:
+    """Copy the data to a scratch folder and point PATHS to it"""
+    imported = [m for m in _PATH_MODULES if m in sys.modules]
+    if imported:
+        raise RuntimeError(f"Run the harness in a new process ({imported} imported)")
+
+    shutil.copytree(PATHS.raw_data, folder / "raw_data")
+    shutil.copytree(PATHS.output, folder / "output")
+
+    PATHS.project = folder
+    PATHS.raw_data = folder / "raw_data"
+    PATHS.output = folder / "output"
+    PATHS.archive = folder / "archive"
+    PATHS.pydeflate = PATHS.raw_data / ".pydeflate"
+
+    dac1 = PATHS.raw_data / "table1_raw.feather"
+    if not dac1.exists() and (PATHS.raw_data / DAC1_FIXTURE).exists():
+        shutil.copy(PATHS.raw_data / DAC1_FIXTURE, dac1)
+
+
+def _point_to(url: str) -> None:
+    """Point the pipeline to the stand-in services"""
+    from scripts import config, dt_index, freshness, idrc_per_capita
+    from scripts.unhcr_tools import get_page
+
+    config.DT_BASE = config.DT_BASE.replace("https://cms.donortracker.org", f"{url}/dt")
+    dt_index.DT_ITEMS = f"{url}/dt/items/policy_updates"
+    idrc_per_capita.UNHCR_API_URL = idrc_per_capita.UNHCR_API_URL.replace(
+        "https://api.unhcr.org/population/v1", f"{url}/unhcr"
+    )
+    get_page.ELEMENTS_URL = f"{url}/unhcr/powerbi"
+
+    for source in freshness.SOURCES.values():
+        if source["url"] is None:
+            continue
+        source["url"] = (
+            source["url"]
+            .replace("https://cms.donortracker.org", f"{url}/dt")
+            .replace("https://api.unhcr.org/population/v1", f"{url}/unhcr")
+            .replace("https://stats.oecd.org", f"{url}/oecd")
+        )
+    freshness.SOURCES["OECD DAC"]["url"] = f"{url}/oecd/table1"
+
+    registry = freshness.read_registry()
+    registry["OECD DAC"] = {"version": OECD_VERSION, "updated": None}
+    freshness.save_registry(registry)
+
+
+def run_offline(
+    stages: list[str] | None = None,
+    latency: float = 0,
+    error_rate: float = 0,
+    scale: int = 1,
+    folder: Path | None = None,
+    trace_memory: bool = True,
+) -> pd.DataFrame:
+    """Run the stages (the daily and weekly updates by default) against the local
+    stand-ins and report the time and peak memory of each stage.
+
+    Peak memory is measured with tracemalloc (Python and numpy allocations), which
+    slows the stages down: use trace_memory=False for timings only."""
+    from scripts.stages import DAILY_STAGES, WEEKLY_STAGES, load_stage
+
+    if stages is None:
+        stages = list(dict.fromkeys(["unhcr_asylum", *DAILY_STAGES, *WEEKLY_STAGES]))
+        # Preflight again, on the inputs written by the run (the latest HCR snapshot
+        # of the scrape)
+        stages.append("preflight")
+
+    folder = Path(folder or tempfile.mkdtemp(prefix="tracker-e2e-"))
+    _use_scratch_folder(folder)
+
+    server = StandInServer(latency, error_rate, scale).start()
+    _point_to(server.url)
+    print(f"Stand-in services at {server.url}, data in {folder}")
+
+    report = []
+    start = time.perf_counter()
+    if trace_memory:
+        tracemalloc.start()
+
+    try:
+        for stage in stages:
+            if trace_memory:
+                tracemalloc.reset_peak()
+            stage_start = time.perf_counter()
+            try:
+                load_stage(stage)()
+                error = ""
+            except Exception as e:  # failures are reported, the run goes on
+                error = repr(e)[:200]
+
+            report.append(
+                {
+                    "stage": stage,
+                    "seconds": round(time.perf_counter() - stage_start, 4),
+                    "peak_mb": (
+                        round(tracemalloc.get_traced_memory()[1] / 1e6, 2)
+                        if trace_memory
+                        else None
+                    ),
+                    "max_rss_mb": _max_rss_mb(),
+                    "error": error,
+                }
+            )
+    finally:
+        tracemalloc.stop()
+        server.stop()
+
+    report = pd.DataFrame(report)
+    report.to_csv(PATHS.output / "e2e_report.csv", index=False)
+
+    print(report.to_string(index=False))
+    print(
+        f"Ran {len(report)} stages in {time.perf_counter() - start:.1f}s "
+        f"({(report.error != '').sum()} failed), {sum(server.requests.values())} "
+        f"requests to the stand-ins"
+    )
+
+    return report
+
+
+if __name__ == "__main__":
+    run_offline()
@@ -1,24 +1,41 @@
 import zipfile
 import io
+from functools import cache
+from typing import Sequence
 
-import country_converter as coco
 import pandas as pd
-import requests
-from pydeflate import set_pydeflate_path, deflate
-from bblocks.dataframe_tools.add import add_iso_codes_column, add_short_names_column
 
-
-from scripts.config import PATHS
+from scripts.config import PATHS, crisis_config, set_data_paths
 from scripts.oda import read_idrc
-
-set_pydeflate_path(PATHS.raw_data)
+from scripts.schema import apply_schema
+from scripts.swr import stale_while_revalidate
 
 HIGH_LOW = "high"
 YEAR_START = 2018
 YEAR_END = 2022
 
-
+UNHCR_API_URL: str = (
+    "https://api.unhcr.org/population/v1/"
+    "asylum-applications/"
+    "?limit=20&dataset=asylum-applications&"
+    "displayType=totals&yearFrom=2010&yearTo=2021&"
+    "coa_all=true&"
+    "columns%5B%5D=procedure_type&"
+    "columns%5B%5D=app_type&"
+    "columns%5B%5D=app_pc&"
+    "columns%5B%5D=app_size&"
+    "columns%5B%5D=dec_level&"
+    "columns%5B%5D=applied"
+    "&download=true"
+)
+
+
+@stale_while_revalidate(
+    "UNHCR asylum data", source="UNHCR asylum API", stages=["unhcr_asylum"]
+)
 def read_zipped_csv(url: str, filename: str) -> pd.DataFrame:
+    import requests
+
     # Send a HTTP request to the URL
     response = requests.get(url)
 
@@ -38,21 +55,6 @@ def read_zipped_csv(url: str, filename: str) -> pd.DataFrame:
 
 def update_unhcr_data(low_or_high: str) -> None:
     """Read historical UNHCR data and save it to a feather file"""
-    url = (
-        "https://api.unhcr.org/population/v1/"
-        "asylum-applications/"
-        "?limit=20&dataset=asylum-applications&"
-        "displayType=totals&yearFrom=2010&yearTo=2021&"
-        "coa_all=true&"
-        "columns%5B%5D=procedure_type&"
-        "columns%5B%5D=app_type&"
-        "columns%5B%5D=app_pc&"
-        "columns%5B%5D=app_size&"
-        "columns%5B%5D=dec_level&"
-        "columns%5B%5D=applied"
-        "&download=true"
-    )
-
     corrections = {
         (2018, "GBR"): 1,
         (2018, "KAZ"): 1,
@@ -75,7 +77,7 @@ def update_unhcr_data(low_or_high: str) -> None:
     _replace = {x: "" for x in ["(", ")", "/"]}
 
     df = (
-        read_zipped_csv(url, "asylum-applications.csv")
+        read_zipped_csv(UNHCR_API_URL, "asylum-applications.csv")
         .rename(
             columns=lambda x: x.lower()
             .replace(" ", "_")
@@ -100,69 +102,109 @@ def update_unhcr_data(low_or_high: str) -> None:
         df[df.app_type.isin(f_)]
         .groupby(["year", "iso_code"], as_index=False)
         .sum(numeric_only=True)
+        .pipe(apply_schema, {"value": "Int32"})
     )
 
     df.to_feather(PATHS.output / f"unhcr_data_{low_or_high}.feather")
+    read_historical_unhcr_data.cache_clear()
+    cost_per_refugee.cache_clear()
 
 
+@cache
 def read_historical_unhcr_data(low_or_high: str) -> pd.DataFrame:
-    """Read the locally saved historical UNHCR data"""
-    return pd.read_feather(PATHS.output / f"unhcr_data_{low_or_high}.feather")
+    """Read the locally saved historical UNHCR data. It is kept in memory"""
+    from scripts.scope import in_scope
+    from scripts.shared import attach
+
+    if (df := attach(f"unhcr_{low_or_high}")) is None:
+        df = pd.read_feather(PATHS.output / f"unhcr_data_{low_or_high}.feather").pipe(
+            apply_schema, {"value": "Int32"}
+        )
+
+    return df.pipe(in_scope)
 
 
 def filter_dac(df: pd.DataFrame) -> pd.DataFrame:
     """Filter the data to only DAC countries (by ISO3 code)"""
+    import country_converter as coco
     from oda_data.tools.groupings import donor_groupings
 
+    from scripts.scope import in_scope
+
     dac = coco.convert(
         list(donor_groupings()["dac_countries"].values()) + ["Lithuania"], to="ISO3"
     )
 
-    return df[df.iso_code.isin(dac)]
+    return df[df.iso_code.isin(dac)].pipe(in_scope)
 
 
-def read_ukriane_hcr_data() -> pd.DataFrame:
-    """Read the locally saved HCR data"""
+def read_ukriane_hcr_data(file: str = "hcr_data.csv") -> pd.DataFrame:
+    """Read the locally saved HCR data (or the refugee ledger of another crisis)"""
+    return pd.read_csv(PATHS.output / file).pipe(format_ledger)
 
-    return pd.read_csv(PATHS.output / "hcr_data.csv").rename(
-        columns={
-            "Individual refugees from Ukraine recorded across Europe": "value",
-            "Country": "country",
-            "Data Date": "date",
-        }
+
+def format_ledger(df: pd.DataFrame) -> pd.DataFrame:
+    """The columns and dtypes of a refugee ledger used by the cost estimates"""
+    from scripts.scope import in_scope
+
+    return (
+        df.pipe(in_scope)
+        .rename(
+            columns={
+                "Individual refugees from Ukraine recorded across Europe": "value",
+                "Country": "country",
+                "Data Date": "date",
+            }
+        )
+        .pipe(apply_schema)
     )
 
 
 def yearly_refugees_spending(
-    cost_data: pd.DataFrame, refugee_data: pd.DataFrame
+    cost_data: pd.DataFrame,
+    refugee_data: pd.DataFrame,
+    years: Sequence[int] = (2022, 2023, 2024),
 ) -> pd.DataFrame:
     """Calculate the yearly spending on refugees"""
+    from scripts.scope import in_scope, scoped_years
 
-    data = refugee_data.merge(cost_data, on=["iso_code"], how="left")
+    years = scoped_years(years)
+    data = refugee_data.pipe(in_scope).merge(cost_data, on=["iso_code"], how="left")
 
     # Ensure all differences are positive or zero
     data = data.assign(difference=lambda d: d.difference.apply(lambda x: max(x, 0)))
 
-    data = data.assign(
-        cost22=lambda d: d["difference"] * d.ratio22 * d.tot_cost_dfl,
-        cost23=lambda d: d["difference"] * d.ratio23 * d.tot_cost_dfl,
-        cost24=lambda d: d["difference"] * d.ratio24 * d.tot_cost_dfl,
-    )
+    # e.g. cost22 = difference * ratio22 * cost per refugee
+    costs = [f"cost{str(year)[2:]}" for year in years]
+    for cost in costs:
+        data[cost] = data["difference"] * data[f"ratio{cost[4:]}"] * data.tot_cost_dfl
 
     return (
-        data.groupby(["iso_code"], as_index=False)[
-            ["difference", "cost22", "cost23", "cost24"]
+        data.groupby(["iso_code"], as_index=False, observed=True)[
+            ["difference"] + costs
         ]
         .sum(numeric_only=True)
         .rename({"difference": "total_refugees"}, axis=1)
     )
 
 
+@cache
 def yearly_constant_idrc() -> pd.DataFrame:
-    """Read the saved IDRC data, format it, and convert it to constant prices"""
+    """Read the saved IDRC data, format it, and convert it to constant prices.
+    It is kept in memory"""
+    return constant_idrc(read_idrc())
+
+
+def constant_idrc(idrc: pd.DataFrame) -> pd.DataFrame:
+    """IDRC (donor_name, year, idrc) by ISO3 code, in constant prices"""
+    from bblocks.dataframe_tools.add import add_iso_codes_column
+    from pydeflate import deflate
+
+    set_data_paths()
+
     idrc = (
-        read_idrc()
-        .rename(columns={"idrc": "value"})
+        idrc.rename(columns={"idrc": "value"})
+        .astype({"donor_name": str})
         .pipe(add_iso_codes_column, id_column="donor_name", id_type="regex")
     ).drop(columns=["donor_name"])
 
@@ -184,10 +226,11 @@ def per_capita_idrc(
     historical_refugees: pd.DataFrame, reported_idrc_data: pd.DataFrame
 ) -> pd.DataFrame:
     """Calculate the per capita IDRC spending"""
+    from scripts.scope import in_scope
 
     # Combine the datasets
-    df = reported_idrc_data.merge(
-        historical_refugees,
+    df = reported_idrc_data.pipe(in_scope).merge(
+        historical_refugees.pipe(in_scope),
         on=["iso_code", "year"],
         suffixes=("_idrc", "_ref"),
         how="inner",
@@ -196,65 +239,97 @@ def per_capita_idrc(
     # Filter and calculate per capita
     return (
         df.loc[lambda d: d.year.isin(range(YEAR_START, YEAR_END + 1))]
-        .groupby(["iso_code"], as_index=False)[["value_idrc", "value_ref"]]
+        .groupby(["iso_code"], as_index=False, observed=True)[
+            ["value_idrc", "value_ref"]
+        ]
         .sum(numeric_only=True)
         .assign(tot_cost_dfl=lambda d: round(d.value_idrc * 1e6 / d.value_ref, 1))
         .filter(["iso_code", "tot_cost_dfl"], axis=1)
     )
 
 
-def update_refugee_cost_data() -> None:
-    """Calculate the cost estimates per year. This assumes that
-    the historical data and ukraine-specific data have been downloaded
-    and updated"""
-
-    # Read the historical data
+@cache
+def cost_per_refugee() -> pd.DataFrame:
+    """The IDRC per refugee of each DAC donor, shared by all the crises.
+    It is kept in memory"""
     refugees = read_historical_unhcr_data(HIGH_LOW).pipe(filter_dac)
 
-    # load IDRC data
-    idrc = yearly_constant_idrc()
+    return per_capita_idrc(refugees, yearly_constant_idrc())
 
-    # Get the per capita numbers
-    idrc_per_capita = per_capita_idrc(refugees, idrc)
 
-    # Get the latest Ukraine refugees data
-    ukraine_data = read_ukriane_hcr_data().pipe(filter_dac)
+def refugee_cost_estimates(
+    crisis: str = "ukraine",
+    ledger: pd.DataFrame | None = None,
+    cost_data: pd.DataFrame | None = None,
+    idrc: pd.DataFrame | None = None,
+) -> pd.DataFrame:
+    """The cost estimates per year of a crisis. The ledger, the cost per refugee
+    and the IDRC in constant prices are read from the saved data if not given"""
+    from scripts.scope import scoped_years
+
+    config_ = crisis_config(crisis)
+
+    # load IDRC data
+    idrc = yearly_constant_idrc() if idrc is None else idrc
+
+    # Get the latest refugees data of the crisis
+    if ledger is None:
+        crisis_data = read_ukriane_hcr_data(config_["ledger"]).pipe(filter_dac)
+    else:
+        crisis_data = ledger.pipe(format_ledger).pipe(filter_dac)
 
     # Calculate the yearly spending on refugees
     summary = yearly_refugees_spending(
-        cost_data=idrc_per_capita, refugee_data=ukraine_data
+        cost_data=cost_per_refugee() if cost_data is None else cost_data,
+        refugee_data=crisis_data,
+        years=config_["years"],
     )
 
-    # Preliminary data for 2022
-    summary = (
-        summary.merge(idrc.query("year == 2022"), on=["iso_code"], how="left")
-        .assign(cost22=lambda d: d.value * 1e6)
-        .drop(["value", "year"], axis=1)
-    )
+    # Preliminary data for the years with reported IDRC (2022 for Ukraine)
+    for year in scoped_years(config_["reported"]):
+        summary = (
+            summary.merge(idrc.loc[idrc.year == year], on=["iso_code"], how="left")
+            .assign(**{f"cost{str(year)[2:]}": lambda d: d.value * 1e6})
+            .drop(["value", "year"], axis=1)
+        )
 
-    summary.to_csv(PATHS.output / "ukraine_refugee_cost_estimates.csv", index=False)
+    return summary
 
 
-def export_summary_cost_data() -> None:
+def update_refugee_cost_data(crisis: str = "ukraine") -> None:
     """Calculate the cost estimates per year. This assumes that
-    the historical data and ukraine-specific data have been downloaded
-    and updated"""
+    the historical data and ukraine-specific data (or the ledger of the crisis)
+    have been downloaded and updated"""
+    refugee_cost_estimates(crisis).to_csv(
+        PATHS.output / f"{crisis}_refugee_cost_estimates.csv", index=False
+    )
 
-    # Read the historical data
-    refugees = read_historical_unhcr_data(HIGH_LOW).pipe(filter_dac)
+
+def export_summary_cost_data(crisis: str = "ukraine") -> None:
+    """Calculate the cost estimates per year. This assumes that
+    the historical data and ukraine-specific data (or the ledger of the crisis)
+    have been downloaded and updated"""
+    from bblocks.dataframe_tools.add import add_short_names_column
+
+    from scripts.scope import scoped_years
+    from scripts.workbook import write_workbook
+
+    config_ = crisis_config(crisis)
 
     # load IDRC data
     idrc = yearly_constant_idrc()
 
     # Get the per capita numbers
-    idrc_per_capita = per_capita_idrc(refugees, idrc)
+    idrc_per_capita = cost_per_refugee()
 
-    # Get the latest Ukraine refugees data
-    ukraine_data = read_ukriane_hcr_data().pipe(filter_dac)
+    # Get the latest refugees data of the crisis
+    crisis_data = read_ukriane_hcr_data(config_["ledger"]).pipe(filter_dac)
 
     # Calculate the yearly spending on refugees
     summary = yearly_refugees_spending(
-        cost_data=idrc_per_capita, refugee_data=ukraine_data
+        cost_data=idrc_per_capita,
+        refugee_data=crisis_data,
+        years=config_["years"],
     )
 
     # Get the latest official IDRC number
@@ -275,27 +350,22 @@ def export_summary_cost_data() -> None:
 
     sheet1 = sheet1.merge(idrc_latest, on="iso_code", how="left")
 
+    additional = {
+        f"cost{str(y)[2:]}": f"additional_cost_{y}"
+        for y in scoped_years(config_["years"])
+    }
+
     sheet1 = sheet1.rename(
-        columns={
-            "total_refugees": "refugees_to_date",
-            "cost22": "additional_cost_2022",
-            "cost23": "additional_cost_2023",
-            "cost24": "additional_cost_2024",
-        }
+        columns={"total_refugees": "refugees_to_date"} | additional
     ).filter(
-        [
-            "donor",
-            "refugees_to_date",
-            "latest_reported_idrc",
-            "additional_cost_2022",
-            "additional_cost_2023",
-            "additional_cost_2024",
-        ],
+        ["donor", "refugees_to_date", "latest_reported_idrc"]
+        + list(additional.values()),
         axis=1,
     )
 
     sheet2 = (
-        idrc_per_capita.pipe(
+        idrc_per_capita.copy()
+        .pipe(
             add_short_names_column,
             id_column="iso_code",
             id_type="ISO3",
@@ -305,7 +375,7 @@ def export_summary_cost_data() -> None:
         .filter(["donor", "cost_per_refugee"], axis=1)
     )
 
-    sheet3 = ukraine_data.rename(
+    sheet3 = crisis_data.rename(
         columns={
             "difference": "monthly_difference",
             "value": "refugees_to_date",
@@ -313,13 +383,33 @@ def export_summary_cost_data() -> None:
         }
     ).drop(columns=["iso_code"])
 
-    with pd.ExcelWriter(PATHS.output / "ukraine_refugee_cost_estimates.xlsx") as writer:
-        sheet1.to_excel(writer, sheet_name="Summary", index=False)
-        sheet2.to_excel(writer, sheet_name="Cost per refugee", index=False)
-        sheet3.to_excel(writer, sheet_name="Monthly data", index=False)
+    # Refugee counts are stored as floats, and the ratios need more than 2 decimals
+    ratios = {c: "0.0000" for c in sheet3.columns if c.startswith("ratio")}
+    formats = {
+        "Summary": {"refugees_to_date": "#,##0"},
+        "Monthly data": {"monthly_difference": "#,##0"} | ratios,
+    }
+
+    # Streamed row by row: the monthly sheet grows with the ledger
+    write_workbook(
+        PATHS.output / f"{crisis}_refugee_cost_estimates.xlsx",
+        {"Summary": sheet1, "Cost per refugee": sheet2, "Monthly data": sheet3},
+        formats=formats,
+    )
+
+
+def refresh_unhcr_data() -> None:
+    """Download the historical UNHCR data, only if the API data has changed"""
+    from scripts.freshness import refresh_if_changed
+
+    refresh_if_changed(
+        "UNHCR asylum API",
+        lambda: update_unhcr_data(HIGH_LOW),
+        target=PATHS.output / f"unhcr_data_{HIGH_LOW}.feather",
+    )
 
 
 if __name__ == "__main__":
-    update_unhcr_data("high")
+    refresh_unhcr_data()
     update_refugee_cost_data()
     export_summary_cost_data()
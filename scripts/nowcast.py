@@ -0,0 +1,112 @@
+"""Nowcasting of the months missing from the monthly refugee ledger.
+
+The HCR snapshots are irregular, so some months have no observation and the
+arrivals of those months are booked in the next observed month. Here the number
+of refugees of every country is laid out in a countries x months matrix and, for
+all the countries at once:
+
+- the missing months between two observations are interpolated linearly
+- the months after the last observation, up to the end of the estimate horizon,
+  are projected with a linear trend fitted on the last observations
+
+Imputed months are flagged (`imputed` column). The monthly differences and the
+yearly ratios are then computed as for the observed months.
+"""
+
+import numpy as np
+import pandas as pd
+
+from scripts.config import crisis_config
+
+REFUGEES_COLUMN = "Refugees from Ukraine recorded in country as of date"
+
+
+def nowcast_ledger(
+    df: pd.DataFrame,
+    column: str = REFUGEES_COLUMN,
+    horizon: pd.Period | None = None,
+    window: int = 3,
+) -> pd.DataFrame:
+    """Add the missing months of each country (interpolated) and the months up to
+    the horizon (projected from the trend of the last `window` observations)"""
+    if horizon is None:
+        horizon = pd.Period(f"{max(crisis_config('ukraine')['years'])}-12", "M")
+
+    df = df.assign(month=df["Data Date"].dt.to_period("M"), imputed=False)
+
+    levels = df.pivot_table(
+        index="iso_code", columns="month", values=column, aggfunc="last"
+    )
+    months = pd.period_range(
+        levels.columns.min(), max(levels.columns.max(), horizon), freq="M"
+    )
+    levels = levels.reindex(columns=months)
+
+    y = levels.to_numpy(dtype="float64", na_value=np.nan)
+    observed = ~np.isnan(y)
+    t = np.broadcast_to(np.arange(len(months)), y.shape)
+
+    # Index of the previous and the next observation of each month
+    previous = np.maximum.accumulate(np.where(observed, t, -1), axis=1)
+    following = np.minimum.accumulate(
+        np.where(observed, t, len(months))[:, ::-1], axis=1
+    )[:, ::-1]
+
+    y_previous = np.take_along_axis(y, previous.clip(0), axis=1)
+    y_following = np.take_along_axis(y, following.clip(max=len(months) - 1), axis=1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        share = (t - previous) / (following - previous)
+    between = ~observed & (previous >= 0) & (following < len(months))
+    interpolated = y_previous + share * (y_following - y_previous)
+
+    # Trend of the last observations (least squares, one slope per country)
+    last = np.cumsum(observed[:, ::-1], axis=1)[:, ::-1] <= window
+    fit = observed & last
+    n = fit.sum(1)
+    st, sy = (t * fit).sum(1), np.where(fit, y, 0).sum(1)
+    stt, sty = (t * t * fit).sum(1), np.where(fit, t * y, 0).sum(1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = (n * sty - st * sy) / (n * stt - st**2)
+    slope = np.nan_to_num(slope)[:, None]
+
+    after = ~observed & (previous >= 0) & (following == len(months))
+    after &= np.asarray(months <= horizon)[None, :]
+    projected = np.maximum(y_previous + slope * (t - previous), 0)
+
+    imputed = np.select([between, after], [interpolated, projected], np.nan).round()
+
+    new = (
+        pd.DataFrame(imputed, index=levels.index, columns=months)
+        .rename_axis(columns="month")
+        .stack()
+        .rename(column)
+        .reset_index()
+        .assign(
+            imputed=True,
+            date_month=lambda d: d.month,
+            **{"Data Date": lambda d: d.month.dt.to_timestamp()},
+        )
+    )
+
+    countries = df.drop_duplicates("iso_code").set_index("iso_code").Country
+    new["Country"] = new.iso_code.map(countries)
+
+    return (
+        pd.concat([df, new], ignore_index=True)
+        .drop(columns="month")
+        .astype({column: "Int64"})
+        .sort_values(["iso_code", "Data Date"], ignore_index=True)
+    )
+
+
+def nowcast_ukraine_hcr_data() -> None:
+    """Rebuild the monthly refugee data with the missing months nowcast"""
+    from scripts.unhcr_data import rebuild_ukraine_hcr_data
+
+    rebuild_ukraine_hcr_data(nowcast=True)
+
+
+if __name__ == "__main__":
+    nowcast_ukraine_hcr_data()
@@ -1,30 +1,17 @@
 import pandas as pd
-from bblocks.dataframe_tools.add import add_iso_codes_column
-from country_converter import country_converter
-from oda_data.tools.groupings import donor_groupings
-from pydeflate import deflate, set_pydeflate_path
-from oda_data import ODAData, set_data_path, download_dac1
 
+from scripts.aggregates import DAC_TOTAL, donor_groups, group_totals
+from scripts.config import PATHS, set_data_paths
+from scripts.cube import build_cube, cube_view
+from scripts.dac1 import dac_donors, tracker_dac1_data
+from scripts.freshness import refresh_if_changed
+from scripts.schema import apply_schema
 
-from scripts.config import PATHS
 
-# set the data path
-set_data_path(PATHS.raw_data)
-set_pydeflate_path(PATHS.raw_data)
-
-
-def __export_df_page(
-    page: int,
-    page_countries: list,
-    idrc: pd.DataFrame,
-    oda: pd.DataFrame,
-    gni: pd.DataFrame,
-) -> None:
+def __export_df_page(page: int, page_countries: list, data: pd.DataFrame) -> None:
     """Helper function to export the individual pages"""
     _ = (
-        idrc.merge(oda, on=["year", "donor_name"], how="outer")
-        .merge(gni, on=["year", "donor_name"], how="outer")
-        .sort_values(["year", "donor_name"])
+        data.sort_values(["year", "donor_name"])
         .loc[lambda d: d.donor_name.isin(page_countries)]
         .reset_index(drop=True)
         .assign(
@@ -65,66 +52,86 @@ def __export_df_page(
     _.to_csv(PATHS.output / f"idrc_oda_chart_{page}.csv", index=False)
 
 
+def _download_dac1() -> None:
+    """Download the full DAC1 file to the raw_data folder"""
+    from oda_data import download_dac1
+
+    set_data_paths()
+    download_dac1()
+
+
 def update_oda() -> None:
     """Update the ODA data from the raw_data folder"""
 
-    # download_dac1()
+    # Only download DAC1 when the OECD file has changed
+    if refresh_if_changed("OECD DAC", _download_dac1):
+        tracker_dac1_data.cache_clear()
 
-    oda = ODAData(
-        years=[2022],
-        donors=list(donor_groupings()["dac_countries"]) + [84],
-        include_names=True,
+    df = (
+        tracker_dac1_data()
+        .loc[lambda d: (d.indicator == "total_oda_ge") & (d.year == 2022)]
+        .assign(currency="USD", prices="current")
+        .filter(
+            ["year", "indicator", "donor_code", "donor_name", "currency", "prices"]
+            + ["value"],
+            axis=1,
+        )
     )
 
-    oda.load_indicator(["total_oda_ge"])
-
-    df = oda.get_data()
-
     df.to_csv(PATHS.output / "latest_oda.csv", index=False)
 
 
 def update_total_oda_data() -> None:
-    from oda_data import ODAData
-
-    oda = ODAData(
-        years=range(2010, 2023),
-        donors=list(donor_groupings()["dac_countries"]) + [84],
-        include_names=True,
+    df = (
+        tracker_dac1_data()
+        .loc[
+            lambda d: (d.indicator == "total_oda_official_definition")
+            & (d.year.isin(range(2010, 2023)))
+        ]
+        .filter(["year", "donor_name", "value"], axis=1)
     )
 
-    oda.load_indicator(["total_oda_official_definition"])
+    df.to_csv(PATHS.raw_data / "total_oda_current.csv", index=False)
 
-    df = oda.get_data().filter(["year", "donor_name", "value"], axis=1)
 
-    df.to_csv(PATHS.raw_data / "total_oda_current.csv", index=False)
+def convert_unique(codes: pd.Series, to: str) -> pd.Series:
+    """Convert country names or codes, converting each distinct value only once"""
+    from country_converter import country_converter
+
+    unique = codes.dropna().unique().tolist()
+    converted = country_converter.convert(unique, to=to)
+
+    # A single value is returned as a string rather than a list
+    if isinstance(converted, str):
+        converted = [converted]
+
+    return codes.map(dict(zip(unique, converted)))
 
 
 def read_oda():
     """Read ODA data from raw_data folder. This data contains flows up to 2017 and
     grant equivalents from 2018 onwards. It is in current prices"""
-    return (
-        pd.read_csv(PATHS.raw_data / "total_oda_current.csv")
-        .filter(["year", "donor_name", "value"], axis=1)
-        .rename(columns={"value": "total_oda"})
-        .assign(
-            donor_name=lambda d: country_converter.convert(
-                d.donor_name, to="short_name"
-            )
+    from scripts.scope import in_scope
+    from scripts.shared import attach
+
+    if (df := attach("oda")) is None:
+        df = (
+            pd.read_csv(PATHS.raw_data / "total_oda_current.csv")
+            .filter(["year", "donor_name", "value"], axis=1)
+            .rename(columns={"value": "total_oda"})
+            .assign(donor_name=lambda d: convert_unique(d.donor_name, to="short_name"))
+            .pipe(apply_schema)
         )
-    )
+
+    return df.pipe(in_scope, "donor_name", names=True)
 
 
 def _raw_oda_data(indicator: str) -> pd.DataFrame:
     """Read the data for a specific indicator"""
-    dac_donors = donor_groupings()["dac_countries"] | {84: "Lithuania"}
-
-    # Instantiate the ODAData class
-    oda = ODAData(years=range(2010, 2024), donors=list(dac_donors), include_names=True)
-
-    # Get the IDRC data
     return (
-        oda.load_indicator(indicator)
-        .get_data()
+        tracker_dac1_data()
+        .loc[lambda d: d.indicator == indicator]
+        .sort_values(["year", "donor_code"])
         .filter(["year", "donor_name", "value"], axis=1)
     )
 
@@ -140,9 +147,17 @@ def _create_idrc_data() -> None:
 
 def read_idrc():
     """Read IDRC data from raw_data folder. This data comes from Table 1 from OECD DAC"""
-    return pd.read_csv(PATHS.raw_data / "total_idrc_current.csv").assign(
-        donor_name=lambda d: country_converter.convert(d.donor_name, to="short_name")
-    )
+    from scripts.scope import in_scope
+    from scripts.shared import attach
+
+    if (df := attach("idrc")) is None:
+        df = (
+            pd.read_csv(PATHS.raw_data / "total_idrc_current.csv")
+            .assign(donor_name=lambda d: convert_unique(d.donor_name, to="short_name"))
+            .pipe(apply_schema)
+        )
+
+    return df.pipe(in_scope, "donor_name", names=True)
 
 
 def _create_gni_data() -> None:
@@ -154,11 +169,28 @@ def _create_gni_data() -> None:
     df.to_csv(PATHS.raw_data / "gni.csv", index=False)
 
 
+def update_dac1_exports() -> None:
+    """Export the IDRC, GNI and total ODA files, reading DAC1 once"""
+    tracker_dac1_data.cache_clear()
+
+    _create_idrc_data()
+    _create_gni_data()
+    update_total_oda_data()
+
+
 def read_gni():
     """Read GNI data from raw_data folder. This data comes from Table 1 from OECD DAC"""
-    return pd.read_csv(PATHS.raw_data / "gni.csv").assign(
-        donor_name=lambda d: country_converter.convert(d.donor_name, to="short_name")
-    )
+    from scripts.scope import in_scope
+    from scripts.shared import attach
+
+    if (df := attach("gni")) is None:
+        df = (
+            pd.read_csv(PATHS.raw_data / "gni.csv")
+            .assign(donor_name=lambda d: convert_unique(d.donor_name, to="short_name"))
+            .pipe(apply_schema)
+        )
+
+    return df.pipe(in_scope, "donor_name", names=True)
 
 
 def _pop_groups(list_: list, group_size: int) -> tuple[list, ...]:
@@ -180,75 +212,41 @@ def _pop_groups(list_: list, group_size: int) -> tuple[list, ...]:
 
 def read_refugee_cost_data() -> pd.DataFrame:
     """Read the saved refugee cost data"""
-    return pd.read_csv(PATHS.output / "ukraine_refugee_cost_estimates.csv")
-
-
-def idrc_oda_chart() -> None:
-    """Build the CSVs used by the ODA IDRC chart"""
+    from scripts.scope import in_scope
 
-    # Read the different datasets that are needed for the chart
-    idrc_est = (
-        read_refugee_cost_data()
-        .drop(["total_refugees"], axis=1)
-        .rename(columns={"cost22": 2022, "cost23": 2023, "cost24": 2024})
-        .melt(id_vars=["iso_code"], var_name="year", value_name="idrc")
-        .assign(idrc=lambda d: d.idrc / 1e6)
-    )
-    idrc_hist = (
-        read_idrc()
-        .pipe(add_iso_codes_column, id_column="donor_name", id_type="regex")
-        .filter(["iso_code", "year", "idrc"], axis=1)
+    return pd.read_csv(PATHS.output / "ukraine_refugee_cost_estimates.csv").pipe(
+        in_scope
     )
 
-    idrc_latest = idrc_hist.query("year == 2021").drop("year", axis=1)
 
-    # Add the latest IDRC data to the estimated data
-    idrc_est = (
-        idrc_est.merge(idrc_latest, on="iso_code", how="left", suffixes=("", "_latest"))
-        .assign(
-            idrc=lambda d: d.apply(
-                lambda x: x.idrc + x.idrc_latest if x.idrc > 1 else 0, axis=1
-            )
+def idrc_oda_table(cube: pd.DataFrame | None = None) -> pd.DataFrame:
+    """IDRC (reported and estimated), ODA and GNI for the years of the ODA IDRC
+    chart"""
+    return (
+        cube_view(
+            ["idrc", "total_oda", "gni"],
+            prices="current",
+            years=[2012, 2016, 2021, 2022, 2023, 2024],
+            cube=cube,
         )
-        .drop("idrc_latest", axis=1)
-    ).loc[lambda d: d.year > 2022]
-
-    # Combine the historical and estimated data
-    idrc = pd.concat([idrc_hist, idrc_est], ignore_index=True).assign(
-        idrc=lambda d: d.idrc.apply(lambda x: x if x > 1 else pd.NA)
+        .assign(idrc=lambda d: d.idrc.where(d.idrc > 1))
+        .drop("iso_code", axis=1)
     )
 
-    # add the donor names
-    idrc = idrc.assign(
-        donor_name=lambda d: country_converter.convert(d.iso_code, to="name_short")
-    ).drop("iso_code", axis=1)
 
-    # Read the other datasets
-    oda = read_oda().assign(
-        donor_name=lambda d: country_converter.convert(d.donor_name, to="name_short")
-    )
-    gni = read_gni().assign(
-        donor_name=lambda d: country_converter.convert(d.donor_name, to="name_short")
-    )
+def idrc_oda_chart() -> None:
+    """Build the CSVs used by the ODA IDRC chart"""
 
-    # Assign the 2021 GNI value to 2022, 2023 and 2024
-    dfs = [
-        gni.copy(deep=True).loc[lambda d: d.year == 2022].assign(year=y)
-        for y in [2023, 2024]
-    ]
-    gni = pd.concat([gni, *dfs], ignore_index=True)
+    # IDRC (reported and estimated), ODA and GNI for the chart years
+    data = idrc_oda_table()
 
-    # Filter and sort the dataframes
-    idrc, oda, gni = [
-        d.astype({"year": "Int32"})
-        .loc[d.year.isin([2012, 2016, 2021, 2022, 2023, 2024])]
+    # Sort the IDRC data in order for the pages to go from the highest spender to lowest
+    idrc = (
+        cube_view(["idrc"], prices="current", years=data.year.unique().tolist())
+        .assign(idrc=lambda d: d.idrc.where(d.idrc > 1))
         .sort_values(["year", "donor_name"])
-        .reset_index(drop=True)
-        for d in [idrc, oda, gni]
-    ]
-
-    # Sort the IDRC data frame in order for the pages to go from the highest spender to lowest
-    idrc = idrc.sort_values(["year", "idrc"], ascending=(True, False))
+        .sort_values(["year", "idrc"], ascending=(True, False))
+    )
 
     p1_countries = [
         "Canada",
@@ -265,101 +263,83 @@ def idrc_oda_chart() -> None:
     chart_pages = [p1_countries] + [*chart_pages]
 
     for page_, list_ in enumerate(chart_pages):
-        __export_df_page(page=page_, page_countries=list_, idrc=idrc, oda=oda, gni=gni)
+        __export_df_page(page=page_, page_countries=list_, data=data)
 
     print("Exported data for ODA/IDRC charts (pages)")
 
 
-def idrc_as_share():
-    """Build the CSV used by the IDRC as a share of GNI chart"""
+def _dac_order(names: pd.Series) -> pd.Series:
+    """The DAC donor code of each donor (short name), the order of the DAC files.
+    Other donors come last"""
+    donors = dac_donors()
+    short_names = convert_unique(pd.Series(list(donors.values())), to="short_name")
+
+    return names.map(dict(zip(short_names, donors))).fillna(float("inf"))
 
-    # Read the different datasets that are needed for the chart
-    idrc = read_idrc()
-    oda = read_oda()
 
-    # Merge the dataframes and create the share column
+def idrc_share_table(cube: pd.DataFrame | None = None) -> pd.DataFrame:
+    """Reported IDRC, ODA and IDRC as a share of ODA, of every donor and donor
+    group"""
+    from scripts import scope
+
+    # Reported IDRC and ODA, with IDRC as a share of ODA
     df = (
-        idrc.merge(oda, on=["year", "donor_name"], how="outer")
-        .assign(share=lambda d: round(100 * d.idrc / d.total_oda, 5))
+        cube_view(
+            ["idrc", "total_oda", "idrc_oda"],
+            prices="current",
+            estimates=False,
+            cube=cube,
+        )
+        .dropna(subset=["idrc", "total_oda"], how="all")
+        .assign(share=lambda d: round(d.idrc_oda, 5))
         .rename(columns={"donor_name": "Donor"})
+        .filter(["year", "Donor", "idrc", "total_oda", "share"], axis=1)
     )
 
-    dac = (
-        df.groupby(["year"], as_index=False, dropna=False, observed=True)
-        .sum(numeric_only=True)
-        .drop("share", axis=1)
+    # As the merge of the IDRC and ODA files: the donors that reported IDRC, then
+    # those with ODA only, each by year and in the order of the DAC files
+    df = (
+        df.assign(oda_only=df.idrc.isna(), order=_dac_order(df.Donor))
+        .sort_values(["oda_only", "year", "order"])
+        .drop(columns=["oda_only", "order"])
     )
-    dac["share"] = round(100 * dac.idrc / dac.total_oda, 5)
-    dac["Donor"] = "DAC Countries, Total"
-
-    data = pd.concat([dac, df], ignore_index=True)
-
-    data.to_csv(PATHS.output / "idrc_share.csv", index=False)
-    print("Exported data for IDRC as a share")
 
+    # Totals and shares for every donor group (which need all the donors)
+    groups = group_totals(
+        df, by="year", donor_column="Donor", values=["idrc", "total_oda"]
+    ).assign(share=lambda d: round(100 * d.idrc / d.total_oda, 5))
 
-def idrc_constant_wide() -> None:
-    """Build the CSV used by the IDRC constant prices chart"""
+    if scope.DONORS is not None:
+        groups = groups.iloc[:0]
 
-    # Read the different datasets that are needed for the chart
-    idrc_est = (
-        read_refugee_cost_data()
-        .drop(["total_refugees"], axis=1)
-        .rename(columns={"cost22": 2022, "cost23": 2023, "cost24": 2024})
-        .melt(id_vars=["iso_code"], var_name="year", value_name="idrc")
-        .assign(idrc=lambda d: d.idrc / 1e6)
-        .loc[lambda d: d.year > 2022]
-    )
-    idrc_hist = (
-        read_idrc()
-        .pipe(add_iso_codes_column, id_column="donor_name", id_type="regex")
-        .filter(["iso_code", "year", "idrc"], axis=1)
+    return pd.concat(
+        [groups.filter(["year", "idrc", "total_oda", "share", "Donor"]), df],
+        ignore_index=True,
     )
 
-    # Deflate to 2022 prices
-    idrc_hist = deflate(
-        df=idrc_hist.copy(deep=True),
-        base_year=2022,
-        deflator_source="oecd_dac",
-        deflator_method="dac_deflator",
-        exchange_source="oecd_dac",
-        exchange_method="implied",
-        id_column="iso_code",
-        id_type="ISO3",
-        date_column="year",
-        source_column="idrc",
-        target_column="idrc",
-    )
 
-    idrc_latest = idrc_hist.query("year == 2021").drop("year", axis=1)
+def idrc_as_share():
+    """Build the CSV used by the IDRC as a share of GNI chart"""
+    idrc_share_table().to_csv(PATHS.output / "idrc_share.csv", index=False)
+    print("Exported data for IDRC as a share")
 
-    # Add the latest IDRC data to the estimated data
-    idrc_est = (
-        idrc_est.merge(idrc_latest, on="iso_code", how="left", suffixes=("", "_latest"))
-        .assign(
-            idrc=lambda d: d.apply(
-                lambda x: x.idrc + x.idrc_latest if x.idrc > 1 else 0, axis=1
-            )
-        )
-        .drop("idrc_latest", axis=1)
-    ).loc[lambda d: d.year > 2022]
 
-    # Combine the historical and estimated data
-    idrc = pd.concat([idrc_hist, idrc_est], ignore_index=True).assign(
-        idrc=lambda d: d.idrc.apply(lambda x: x if x > 0.0001 else pd.NA)
-    )
+def idrc_wide(idrc: pd.DataFrame) -> pd.DataFrame:
+    """Pivot IDRC (donor_name, year, idrc) to the wide format of the constant prices
+    chart: one column per donor, with the DAC total first"""
+    from scripts import scope
 
-    # add the donor names
-    idrc = idrc.assign(
-        donor_name=lambda d: country_converter.convert(d.iso_code, to="name_short")
-    ).drop("iso_code", axis=1)
+    # Calculate dac total (which needs all the donors)
+    dac_total = group_totals(
+        idrc,
+        by="year",
+        donor_column="donor_name",
+        values=["idrc"],
+        groups={DAC_TOTAL: donor_groups()[DAC_TOTAL]},
+    )
 
-    # Calculate dac total
-    dac_total = (
-        idrc.groupby(["year"], as_index=False, dropna=False, observed=True)[
-            "idrc"
-        ].sum()
-    ).assign(donor_name="DAC Countries, Total")
+    if scope.DONORS is not None:
+        dac_total = dac_total.iloc[:0]
 
     # Merge with the original dataframe
     idrc_constant = (
@@ -374,14 +354,31 @@ def idrc_constant_wide() -> None:
         ["donor_name", "year"], ascending=[True, True]
     )
 
-    data = (
+    return (
         idrc_constant.pivot(index="year", columns="donor_name", values="idrc")
         .filter(order, axis=1)
         .reset_index()
         .loc[lambda d: d.year >= 2012]
     )
 
-    data.to_csv(PATHS.output / "idrc_over_time_constant.csv", index=False)
+
+def idrc_constant_table(cube: pd.DataFrame | None = None) -> pd.DataFrame:
+    """Reported and estimated IDRC in constant prices, in the wide format of the
+    constant prices chart"""
+    idrc = (
+        cube_view(["idrc"], prices="constant", cube=cube)
+        .assign(idrc=lambda d: d.idrc.where(d.idrc > 0.0001))
+        .drop("iso_code", axis=1)
+    )
+
+    return idrc_wide(idrc)
+
+
+def idrc_constant_wide() -> None:
+    """Build the CSV used by the IDRC constant prices chart"""
+    idrc_constant_table().to_csv(
+        PATHS.output / "idrc_over_time_constant.csv", index=False
+    )
     print("IDRC over time constant prices CSV created (wide)")
 
 
@@ -389,6 +386,7 @@ if __name__ == "__main__":
     update_oda()
     _create_idrc_data()
     _create_gni_data()
+    build_cube()
     idrc_as_share()
     idrc_oda_chart()
     idrc_constant_wide()
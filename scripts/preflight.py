@@ -0,0 +1,246 @@
+"""Checks of the local inputs, run before any download or scraping.
+
+Every input file is read once and checked for presence, required columns, dates
+that parse, numeric values, year coverage and codes or names that resolve to ISO3.
+The files of an input (e.g. all the HCR snapshots) are checked together: each check
+is a single vectorized pass over all of them. The results are collected in a report
+(one row per file and check). The run is aborted if any check fails with an
+"error" level.
+"""
+
+import pandas as pd
+
+from scripts.config import CRISES, PATHS, crisis_config
+from scripts.unhcr_data import LATEST_SNAPSHOT
+
+REPORT_FILE = PATHS.output / "preflight_report.csv"
+
+# The snapshot of the latest scrape, saved with ISO dates
+_LATEST = LATEST_SNAPSHOT.relative_to(PATHS.project).as_posix()
+
+# Column of the refugees count in the HCR snapshots (it was renamed on the website)
+REFUGEES_COLUMNS = (
+    "Refugees from Ukraine recorded in country as of date",
+    "Individual refugees from Ukraine recorded across Europe",
+)
+
+# Checks for each input. Files are relative to the project folder and can be globs.
+# - columns: required columns. A tuple means that one of the columns is required.
+# - dates: column -> format the dates must parse with
+# - numeric: columns that must be numeric
+# - years: (column, first year, last year, level) of the years that must be present
+# - iso: column of ISO3 codes that must be valid
+# - names: column of country names that must resolve to an ISO3 code
+# - exclude: files matched by the glob that are checked by another input
+# - optional: a missing file is a warning (e.g. a file written by the pipeline)
+INPUTS: dict[str, dict] = {
+    "raw_data/non-eu-refugees.csv": {
+        "columns": ["iso_code", "country", "date", "value"],
+        "dates": {"date": "%B-%Y"},
+        "numeric": ["value"],
+        "iso": "iso_code",
+    },
+    "raw_data/*_hcr_data.csv": {
+        "columns": ["iso_code", "Country", "Data Date", REFUGEES_COLUMNS],
+        "dates": {"Data Date": "%d %B %Y"},
+        "iso": "iso_code",
+        "exclude": [_LATEST],
+    },
+    _LATEST: {
+        "columns": ["iso_code", "Country", "Data Date", REFUGEES_COLUMNS[0]],
+        "dates": {"Data Date": "%Y-%m-%d"},
+        "numeric": [REFUGEES_COLUMNS[0]],
+        "iso": "iso_code",
+        # Seeded from the published data when it is missing (unhcr_data.py)
+        "optional": True,
+    },
+    "output/hcr_data.csv": {
+        "columns": ["iso_code", "Country", "Data Date", REFUGEES_COLUMNS[0]]
+        + ["difference", "ratio22", "ratio23", "ratio24"],
+        "dates": {"Data Date": "%m-%Y"},
+        "numeric": [REFUGEES_COLUMNS[0], "difference"],
+        "iso": "iso_code",
+    },
+    "output/unhcr_data_high.feather": {
+        "columns": ["year", "iso_code", "value"],
+        "numeric": ["year", "value"],
+        # Missing years shorten the per capita window, but don't break it
+        "years": ("year", 2018, 2022, "warning"),
+        "iso": "iso_code",
+    },
+    "raw_data/total_idrc_current.csv": {
+        "columns": ["year", "donor_name", "idrc"],
+        "numeric": ["year", "idrc"],
+        "years": ("year", 2018, 2022, "error"),
+        "names": "donor_name",
+    },
+    "raw_data/total_oda_current.csv": {
+        "columns": ["year", "donor_name", "value"],
+        "numeric": ["year", "value"],
+        "years": ("year", 2012, 2022, "error"),
+        "names": "donor_name",
+    },
+    "raw_data/gni.csv": {
+        "columns": ["year", "donor_name", "gni"],
+        "numeric": ["year", "gni"],
+        "years": ("year", 2012, 2022, "error"),
+        "names": "donor_name",
+    },
+}
+
+# The refugee data of the other crises
+INPUTS |= {
+    f"raw_data/{crisis_config(crisis)['source']}": {
+        "columns": ["iso_code", "Country", "Data Date"]
+        + [crisis_config(crisis)["refugees_column"]],
+        "numeric": [crisis_config(crisis)["refugees_column"]],
+        "iso": "iso_code",
+    }
+    for crisis in CRISES
+    if crisis_config(crisis)["source"] is not None
+}
+
+
+def _read(file) -> pd.DataFrame:
+    if file.suffix == ".feather":
+        return pd.read_feather(file)
+    return pd.read_csv(file, encoding="utf-8-sig")
+
+
+def _valid_iso_codes() -> set[str]:
+    import country_converter as coco
+
+    return set(coco.CountryConverter().data["ISO3"])
+
+
+def _row(file: str, check: str, level: str, failed: list | str) -> dict:
+    return {
+        "file": file,
+        "check": check,
+        "level": level,
+        "passed": not failed,
+        "detail": "" if not failed else str(failed)[:200],
+    }
+
+
+def _missing_columns(data: pd.DataFrame, spec: dict) -> list[str]:
+    return [
+        " or ".join(c) if isinstance(c, tuple) else c
+        for c in spec.get("columns", [])
+        if not set(c if isinstance(c, tuple) else [c]) & set(data.columns)
+    ]
+
+
+def _check_input(data: pd.DataFrame, files: list[str], spec: dict) -> list[dict]:
+    """Run the checks of an input on the rows of all its files (with a `file`
+    column), one pass per check. Each check returns a report row per file"""
+    results = []
+
+    def add(check: str, failed: pd.DataFrame, level: str = "error") -> None:
+        """Report the failed values (`file` and `value` columns) of each file"""
+        by_file = failed.groupby("file", sort=False)["value"].unique()
+        for file in files:
+            values = by_file[file].tolist() if file in by_file.index else []
+            results.append(_row(file, check, level, values))
+
+    def failing(mask: pd.Series, column: str) -> pd.DataFrame:
+        return data.loc[mask, ["file", column]].rename(columns={column: "value"})
+
+    for column, format_ in spec.get("dates", {}).items():
+        dates = pd.to_datetime(data[column], format=format_, errors="coerce")
+        add(f"dates ({column})", failing(dates.isna(), column))
+
+    for column in spec.get("numeric", []):
+        values = pd.to_numeric(data[column], errors="coerce")
+        add(
+            f"numeric ({column})", failing(values.isna() & data[column].notna(), column)
+        )
+
+    if "years" in spec:
+        column, start, end, level = spec["years"]
+        window = set(range(start, end + 1))
+        present = data.groupby("file", sort=False)[column].unique()
+        for file in files:
+            missing_years = sorted(window - set(present.get(file, [])))
+            # An empty window is always an error
+            level_ = "error" if len(missing_years) == len(window) else level
+            results.append(_row(file, f"years {start}-{end}", level_, missing_years))
+
+    if "iso" in spec:
+        column = spec["iso"]
+        codes = data[column]
+        add(
+            "iso codes",
+            failing(codes.notna() & ~codes.isin(_valid_iso_codes()), column),
+        )
+
+    if "names" in spec:
+        from scripts.oda import convert_unique
+
+        column = spec["names"]
+        names = pd.Series(data[column].unique())
+        unresolved = names.loc[
+            pd.Series(convert_unique(names, to="ISO3")) == "not found"
+        ]
+        add("names to iso", failing(data[column].isin(unresolved), column))
+
+    return results
+
+
+def _input_files(pattern: str, spec: dict) -> list:
+    excluded = {PATHS.project / f for f in spec.get("exclude", [])}
+    return [f for f in sorted(PATHS.project.glob(pattern)) if f not in excluded]
+
+
+def run_preflight() -> pd.DataFrame:
+    """Check all the inputs, save the report and raise an error if any check fails"""
+    report = []
+
+    for pattern, spec in INPUTS.items():
+        files = _input_files(pattern, spec)
+
+        if not files:
+            level = "warning" if spec.get("optional") else "error"
+            report.append(_row(pattern, "present", level, "file not found"))
+            continue
+
+        # Each file is read once. The columns are checked file by file, the other
+        # checks on the files with all the columns, together
+        frames, checked = [], []
+        for file in files:
+            name = file.relative_to(PATHS.project).as_posix()
+            try:
+                data = _read(file)
+            except Exception as e:  # any unreadable file is reported
+                report.append(_row(name, "readable", "error", repr(e)))
+                continue
+
+            missing = _missing_columns(data, spec)
+            report.append(_row(name, "columns", "error", missing))
+            if not missing:
+                frames.append(data.assign(file=name))
+                checked.append(name)
+
+        if frames:
+            report += _check_input(pd.concat(frames, ignore_index=True), checked, spec)
+
+    report = pd.DataFrame(report)
+    report.to_csv(REPORT_FILE, index=False)
+
+    failed = report.loc[~report.passed]
+    for row in failed.itertuples():
+        print(f"{row.level.upper()}: {row.file} [{row.check}] {row.detail}")
+
+    errors = failed.loc[failed.level == "error"]
+    if len(errors) > 0:
+        raise ValueError(
+            f"Preflight failed: {len(errors)} check(s) with errors. See {REPORT_FILE}"
+        )
+
+    print(f"Preflight passed ({len(report)} checks, {len(failed)} warnings)")
+
+    return report
+
+
+if __name__ == "__main__":
+    run_preflight()
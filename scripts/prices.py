@@ -0,0 +1,166 @@
+"""Constant prices in several base years and currencies, in a single pass.
+
+pydeflate builds a deflator table for each (base year, currency) combination.
+Here the DAC price deflators and the implied exchange rates are loaded once and
+the deflators of every combination are computed together, with the same formulas
+and rounding as pydeflate (oecd_dac, dac_deflator, implied exchange rates).
+"""
+
+from functools import cache
+
+import numpy as np
+import pandas as pd
+
+from scripts.config import PATHS, set_data_paths
+
+# Currency -> ISO3 code of its exchange rate in the DAC data
+CURRENCIES: dict[str, str] = {"USD": "USA", "EUR": "EUI", "GBP": "GBR", "CAD": "CAN"}
+
+# Base years of the constant prices outputs (the deflators end in 2022)
+BASE_YEARS: list[int] = [2022]
+
+BASES_FILE = PATHS.output / "idrc_constant_bases.csv"
+
+
+@cache
+def _deflator_inputs() -> tuple[pd.DataFrame, pd.DataFrame]:
+    """DAC price deflators and exchange rates (LCU per USD) as iso_code x year
+    tables. They are kept in memory"""
+    from pydeflate.get_data.exchange_data import ExchangeOECD
+    from pydeflate.get_data.oecd_data import OECD
+
+    set_data_paths()
+
+    oecd = OECD()
+    oecd.load_data()
+    prices = oecd.get_method(oecd.available_methods()["dac_deflator"])
+    exchange = ExchangeOECD().usd_exchange_rate()
+
+    def _wide(df: pd.DataFrame) -> pd.DataFrame:
+        return df.assign(year=df.year.dt.year).pivot(
+            index="iso_code", columns="year", values="value"
+        )
+
+    prices, exchange = _wide(prices), _wide(exchange)
+    exchange = exchange.reindex(index=prices.index.union(exchange.index))
+
+    return prices, exchange.reindex(columns=prices.columns)
+
+
+def deflators(
+    base_years: list[int] = BASE_YEARS, currencies: list[str] = tuple(CURRENCIES)
+) -> pd.DataFrame:
+    """Deflators (from current USD) of every base year and currency combination.
+
+    Arrays are indexed (currency, base year, iso_code, year)."""
+    prices, exchange = _deflator_inputs()
+    prices = prices.reindex(index=exchange.index)
+
+    years = list(prices.columns)
+    base = [years.index(year) for year in base_years]
+    p, e = prices.to_numpy(), exchange.to_numpy()
+    e_target = exchange.loc[[CURRENCIES[c] for c in currencies]].to_numpy()
+    e_usd = exchange.loc[["USA"]].to_numpy()
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Price deflator, rebased to each base year: (base, iso, year)
+        price = np.round(100 * p[None] / p[:, base].T[:, :, None], 6)
+
+        # Exchange rate to each target currency: (currency, iso, year)
+        xe = e[None] / e_target[:, None, :]
+
+        # Exchange deflator, rebased: (currency, base, iso, year)
+        xe_deflator = np.round(
+            100 * xe[:, None] / xe[:, :, base].transpose(0, 2, 1)[:, :, :, None], 6
+        )
+
+        # Conversion from USD to the target currency
+        ratio = (e / e_usd)[None] / xe
+        xe_deflator = xe_deflator * ratio[:, None]
+
+        deflator = np.round(100 * price[None] / xe_deflator, 6)
+
+    deflator[deflator == 0] = np.nan
+
+    index = pd.MultiIndex.from_product(
+        [list(currencies), list(base_years), list(prices.index)],
+        names=["currency", "base_year", "iso_code"],
+    )
+
+    return (
+        pd.DataFrame(deflator.reshape(-1, len(years)), index=index, columns=years)
+        .rename_axis(columns="year")
+        .stack()
+        .rename("deflator")
+        .reset_index()
+    )
+
+
+def to_constant(
+    data: pd.DataFrame,
+    base_years: list[int] = BASE_YEARS,
+    currencies: list[str] = tuple(CURRENCIES),
+    id_column: str = "iso_code",
+    date_column: str = "year",
+    value_column: str = "value",
+) -> pd.DataFrame:
+    """Convert current USD amounts to constant prices in every base year and
+    currency. The rows are repeated for each combination (base_year and currency
+    columns)"""
+    table = deflators(base_years, currencies).rename(
+        columns={"iso_code": id_column, "year": date_column}
+    )
+
+    return (
+        data.merge(table, on=[id_column, date_column], how="left")
+        .assign(**{value_column: lambda d: d[value_column] / (d.deflator / 100)})
+        .drop("deflator", axis=1)
+    )
+
+
+def idrc_constant_bases(
+    base_years: list[int] = BASE_YEARS, currencies: list[str] = tuple(CURRENCIES)
+) -> None:
+    """Export IDRC in constant prices for every base year and currency, as a tidy
+    table and as one wide chart csv per combination"""
+    from scripts.cube import BASE_YEAR, cube_view
+    from scripts.oda import idrc_wide
+
+    # Reported IDRC is converted from current prices. The estimates are in
+    # constant prices of the cube's base year, so they use that year's deflators
+    reported = cube_view(["idrc"], estimates=False).assign(price_year=lambda d: d.year)
+    estimates = cube_view(["idrc"], prices="constant", estimates=True).assign(
+        price_year=BASE_YEAR
+    )
+
+    idrc = (
+        pd.concat([reported, estimates], ignore_index=True)
+        .pipe(
+            to_constant,
+            base_years=base_years,
+            currencies=currencies,
+            date_column="price_year",
+            value_column="idrc",
+        )
+        .filter(["iso_code", "donor_name", "year", "base_year", "currency", "idrc"])
+        .sort_values(["base_year", "currency", "iso_code", "year"])
+    )
+
+    idrc.to_csv(BASES_FILE, index=False)
+
+    for (base_year, currency), data in idrc.groupby(["base_year", "currency"]):
+        idrc_wide(
+            data.assign(idrc=lambda d: d.idrc.where(d.idrc > 0.0001)).drop(
+                columns=["iso_code", "base_year", "currency"]
+            )
+        ).to_csv(
+            PATHS.output
+            / f"idrc_over_time_constant_{currency.lower()}_{base_year}.csv",
+            index=False,
+        )
+
+    print(f"IDRC constant prices CSVs created ({len(base_years) * len(currencies)})")
+
+
+if __name__ == "__main__":
+    idrc_constant_bases()
@@ -0,0 +1,181 @@
+"""Cadence-aware runs of the daily and weekly updates.
+
+Each stage of the updates has a cadence:
+
+- "daily": runs once per calendar day
+- "weekly": runs once per ISO week (on the first run of the week)
+- "upstream": runs when its upstream source (freshness.SOURCES) has changed, found
+  with the cheap probe (once: the stage uses the probe of the scheduler), or if it
+  never ran
+
+The last successful run of each stage is recorded in `raw_data/stage_runs.json`,
+which is committed with the data so the record is kept between scheduled runs.
+Only the stages that are due are run, in pipeline order, so a daily run doesn't
+pay for the weekly work:
+
+    python -m scripts schedule                 # the stages due (--due)
+    python -m scripts schedule --all           # every stage
+    python -m scripts schedule --dry-run       # the stages due, and why
+    python -m scripts schedule --force latest_oda --skip dt_tables
+    python -m scripts schedule --cadence crs_ukraine=daily
+"""
+
+import json
+from datetime import datetime
+
+from scripts.config import PATHS
+
+STATE_FILE = PATHS.raw_data / "stage_runs.json"
+
+CADENCE_TYPES: list[str] = ["daily", "weekly", "upstream"]
+
+# stage -> cadence, in the order the stages are run
+CADENCES: dict[str, str] = {
+    "preflight": "daily",
+    "unhcr": "daily",
+    "unhcr_asylum": "upstream",
+    "refugee_cost": "weekly",
+    "latest_oda": "upstream",
+    "crs_ukraine": "weekly",
+    "cube": "daily",
+    "idrc_share": "daily",
+    "idrc_oda_chart": "daily",
+    "idrc_constant": "daily",
+    "idrc_constant_bases": "daily",
+    "dt_table": "daily",
+    "dt_tables": "daily",
+    "summary_cost": "daily",
+    "database": "daily",
+    "changes": "daily",
+    "last_updated": "daily",
+    "archive": "daily",
+}
+
+# Upstream source of the "upstream" stages
+UPSTREAM: dict[str, str] = {
+    "unhcr_asylum": "UNHCR asylum API",
+    "latest_oda": "OECD DAC",
+}
+
+
+def read_state() -> dict:
+    """The last successful run of each stage"""
+    if not STATE_FILE.exists():
+        return {}
+
+    with open(STATE_FILE, "r") as f:
+        return json.load(f)
+
+
+def save_state(state: dict) -> None:
+    with open(STATE_FILE, "w") as f:
+        json.dump(state, f, indent=2)
+
+
+def is_due(
+    stage: str, cadence: str, last: datetime | None, now: datetime
+) -> tuple[bool, str]:
+    """Whether a stage is due, and why"""
+    if cadence not in CADENCE_TYPES:
+        raise ValueError(f"Unknown cadence: {cadence}. Valid cadences: {CADENCE_TYPES}")
+
+    if cadence == "upstream" and stage not in UPSTREAM:
+        raise ValueError(f"{stage} has no upstream source (see schedule.UPSTREAM)")
+
+    if last is None:
+        return True, "never ran"
+
+    ran = f"last ran {last:%Y-%m-%d %H:%M}"
+
+    if cadence == "daily":
+        return last.date() < now.date(), ran
+
+    if cadence == "weekly":
+        return last.isocalendar()[:2] < now.isocalendar()[:2], ran
+
+    from scripts.freshness import check_source
+
+    # Kept for the stage, which then doesn't probe the source again
+    changed, _ = check_source(UPSTREAM[stage], keep=True)
+    return changed, f"{UPSTREAM[stage]} {'changed' if changed else 'unchanged'}"
+
+
+def plan(
+    due: bool = True,
+    force: list[str] | None = None,
+    skip: list[str] | None = None,
+    cadences: dict[str, str] | None = None,
+    now: datetime | None = None,
+) -> dict[str, str]:
+    """The stages to run (in order) and why. `cadences` overrides the cadence of
+    some stages, `force` and `skip` run or skip stages whatever their cadence"""
+    force, skip, cadences = force or [], skip or [], cadences or {}
+    now = now or datetime.now()
+
+    unknown = set(force + skip + list(cadences)) - set(CADENCES)
+    if unknown:
+        raise ValueError(f"Unknown stages: {sorted(unknown)}. Valid: {list(CADENCES)}")
+
+    invalid = {c for c in cadences.values() if c not in CADENCE_TYPES}
+    if invalid:
+        raise ValueError(f"Unknown cadences: {invalid}. Valid: {CADENCE_TYPES}")
+
+    cadences = CADENCES | cadences
+
+    state = read_state()
+    stages = {}
+    for stage, cadence in cadences.items():
+        if stage in skip:
+            continue
+        if stage in force:
+            stages[stage] = "forced"
+        elif not due:
+            stages[stage] = "all"
+        else:
+            last = state.get(stage, {}).get("last_run")
+            last = datetime.fromisoformat(last) if last else None
+            run, reason = is_due(stage, cadence, last, now)
+            if run:
+                stages[stage] = f"{cadence}, {reason}"
+
+    return stages
+
+
+def run_scheduled(
+    due: bool = True,
+    force: list[str] | None = None,
+    skip: list[str] | None = None,
+    cadences: dict[str, str] | None = None,
+    record: bool = True,
+    dry_run: bool = False,
+) -> list[str]:
+    """Run the stages due (or all the stages with due=False), recording each
+    successful run. Returns the stages run"""
+    from scripts.stages import run_stage
+
+    stages = plan(due=due, force=force, skip=skip, cadences=cadences)
+
+    for stage, reason in stages.items():
+        print(f"{stage:<22}{reason}")
+    if not stages:
+        print("No stage is due")
+    if dry_run:
+        return []
+
+    for stage in stages:
+        start = datetime.now()
+        run_stage(stage, record=record)
+
+        # Saved after each stage: a failed stage and the ones after it stay due
+        state = read_state()
+        state[stage] = {
+            "last_run": start.isoformat(timespec="seconds"),
+            "seconds": round((datetime.now() - start).total_seconds(), 1),
+        }
+        save_state(state)
+
+    return list(stages)
+
+
+if __name__ == "__main__":
+    run_scheduled()
@@ -0,0 +1,82 @@
+"""Compact dtypes for the data read and written by the scripts.
+
+Identifiers (codes, names, types) are stored as categoricals, years and counts
+as nullable integers. Amounts are kept as float64: they are published with their
+full precision, so float32 would change the outputs.
+
+Groupbys on categorical columns must use observed=True (only the categories
+that are present are kept).
+"""
+
+import pandas as pd
+
+REFUGEES = "Refugees from Ukraine recorded in country as of date"
+REFUGEES_OLD = "Individual refugees from Ukraine recorded across Europe"
+
+SCHEMA: dict[str, str] = {
+    "iso_code": "category",
+    "donor_name": "category",
+    "Country": "category",
+    "country": "category",
+    "app_type": "category",
+    "year": "Int16",
+    REFUGEES: "Int32",
+    REFUGEES_OLD: "Int32",
+}
+
+
+def apply_schema(
+    df: pd.DataFrame, overrides: dict[str, str] | None = None
+) -> pd.DataFrame:
+    """Cast the columns of a DataFrame to their compact dtype. Columns not in
+    the schema (or the overrides) are left as they are"""
+    schema = SCHEMA | (overrides or {})
+
+    return df.astype({c: t for c, t in schema.items() if c in df.columns})
+
+
+def memory_usage(df: pd.DataFrame) -> float:
+    """Memory used by a DataFrame, in MB"""
+    return df.memory_usage(deep=True).sum() / 1e6
+
+
+def benchmark() -> pd.DataFrame:
+    """Memory used by the main readers with the default and the compact dtypes"""
+    from scripts.idrc_per_capita import read_historical_unhcr_data
+    from scripts.oda import read_gni, read_idrc, read_oda
+    from scripts.unhcr_data import load_historic_hcr_data
+
+    readers = {
+        "read_idrc": read_idrc,
+        "read_oda": read_oda,
+        "read_gni": read_gni,
+        "read_historical_unhcr_data": lambda: read_historical_unhcr_data("high"),
+        "load_historic_hcr_data": load_historic_hcr_data,
+    }
+
+    results = []
+    for name, reader in readers.items():
+        compact = reader()
+        default = compact.astype(
+            {
+                c: "object" if isinstance(t, pd.CategoricalDtype) else "int64"
+                for c, t in compact.dtypes.items()
+                if c in SCHEMA and not compact[c].isna().any()
+            }
+        )
+        results.append(
+            {
+                "reader": name,
+                "rows": len(compact),
+                "default_mb": round(memory_usage(default), 3),
+                "compact_mb": round(memory_usage(compact), 3),
+            }
+        )
+
+    return pd.DataFrame(results).assign(
+        ratio=lambda d: round(d.default_mb / d.compact_mb, 1)
+    )
+
+
+if __name__ == "__main__":
+    print(benchmark().to_string(index=False))
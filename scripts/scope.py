@@ -0,0 +1,155 @@
+"""Runs of the pipeline scoped to some donors and years.
+
+To check the numbers of a single donor, the computation stages can be run for that
+donor only, e.g.
+
+    python -m scripts run refugee_cost cube idrc_oda_chart --donors POL,DEU
+
+The scope is applied by the readers and the computations (the DAC1 loader, the
+IDRC/ODA/GNI readers, `filter_dac`, the refugee ledger, the per capita costs, the
+cost estimates and the cube views of the charts), so only the slice in scope is
+loaded and computed. The values of the donors in scope are those of a full run.
+
+- donors (ISO3 codes) are filtered everywhere. Group totals (e.g. DAC Countries,
+  Total) need all the donors, so they are left out of scoped charts.
+- years are filtered in the DAC1 loader, the estimate years and the charts. The
+  other readers keep all the years, as the estimates depend on past years (the
+  per capita window, the latest reported IDRC).
+
+Scoped runs write to a scratch folder, never to `output`.
+"""
+
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+from typing import Iterable
+
+import pandas as pd
+
+from scripts.config import PATHS
+
+# The active scope: None keeps all the donors (ISO3 codes) or years
+DONORS: list[str] | None = None
+YEARS: list[int] | None = None
+
+# Stages that can be scoped (the computations, from local inputs)
+SCOPED_STAGES: list[str] = [
+    "hcr_ledger",
+    "hcr_nowcast",
+    "refugee_cost",
+    "summary_cost",
+    "cube",
+    "idrc_share",
+    "idrc_oda_chart",
+    "idrc_constant",
+    "idrc_constant_bases",
+    "sensitivity",
+]
+
+# Outputs of other stages read by the scoped stages, copied to the scratch folder.
+# The cube is not copied: it is rebuilt for the scope when it is needed
+INPUTS: list[str] = [
+    "hcr_data.csv",
+    "*_refugee_ledger.csv",
+    "unhcr_data_*.feather",
+    "*_refugee_cost_estimates.csv",
+]
+
+# Modules that read PATHS.output when they are imported
+_PATH_MODULES: list[str] = ["scripts.cube", "scripts.prices"]
+
+
+def _clear_caches() -> None:
+    """Clear the data kept in memory, read with the previous scope"""
+    from scripts.cube import load_cube
+    from scripts.dac1 import tracker_dac1_data
+    from scripts.idrc_per_capita import (
+        cost_per_refugee,
+        read_historical_unhcr_data,
+        yearly_constant_idrc,
+    )
+
+    for cached in [
+        tracker_dac1_data,
+        read_historical_unhcr_data,
+        yearly_constant_idrc,
+        cost_per_refugee,
+        load_cube,
+    ]:
+        cached.cache_clear()
+
+
+def set_scope(
+    donors: Iterable[str] | None = None, years: Iterable[int] | None = None
+) -> None:
+    """Set the donors (ISO3 codes) and years in scope. None keeps them all"""
+    global DONORS, YEARS
+
+    DONORS = None if donors is None else [d.strip().upper() for d in donors]
+    YEARS = None if years is None else [int(y) for y in years]
+
+    if "scripts.idrc_per_capita" in sys.modules or "scripts.cube" in sys.modules:
+        _clear_caches()
+
+
+def scoped_years(years: Iterable[int]) -> list[int]:
+    """The years in scope, out of the given years"""
+    return [y for y in years if YEARS is None or y in YEARS]
+
+
+def in_scope(
+    df: pd.DataFrame,
+    donor_column: str = "iso_code",
+    names: bool = False,
+    year_column: str | None = None,
+) -> pd.DataFrame:
+    """Keep the rows of the donors in scope (by ISO3 code, or by name with
+    names=True) and, with a year column, of the years in scope"""
+    if DONORS is not None:
+        donors = df[donor_column]
+        if names:
+            from scripts.oda import convert_unique
+
+            donors = convert_unique(donors.astype(str), to="ISO3")
+        df = df.loc[donors.isin(DONORS)]
+
+    if YEARS is not None and year_column is not None:
+        df = df.loc[df[year_column].isin(YEARS)]
+
+    return df
+
+
+def run_scoped(
+    stages: list[str],
+    donors: Iterable[str] | None = None,
+    years: Iterable[int] | None = None,
+    folder: Path | None = None,
+) -> Path:
+    """Run the stages for the donors and years in scope, writing the outputs to a
+    scratch folder (with a copy of the inputs from the output folder). Returns
+    the folder"""
+    from scripts.stages import run_stages
+
+    unscoped = [s for s in stages if s not in SCOPED_STAGES]
+    if unscoped:
+        raise ValueError(f"Stages {unscoped} can't be scoped. Valid: {SCOPED_STAGES}")
+
+    imported = [m for m in _PATH_MODULES if m in sys.modules]
+    if imported:
+        raise RuntimeError(f"Run the scoped stages in a new process ({imported})")
+
+    folder = Path(folder or tempfile.mkdtemp(prefix="tracker-scope-"))
+    folder.mkdir(parents=True, exist_ok=True)
+    for pattern in INPUTS:
+        for file in PATHS.output.glob(pattern):
+            shutil.copy2(file, folder / file.name)
+    PATHS.output = folder
+
+    set_scope(donors, years)
+    run_stages(stages, record=False)
+
+    print(f"Scoped outputs (donors: {DONORS or 'all'}, years: {YEARS or 'all'})")
+    print(f"in {folder}")
+
+    return folder
@@ -0,0 +1,144 @@
+"""Sensitivity of the cost estimates to the window of years of the per capita IDRC.
+
+The per capita cost of a refugee is the IDRC of a donor over a window of years
+(YEAR_START to YEAR_END) divided by the asylum applications over the same years.
+Here the IDRC and the applications are merged once and accumulated by year, so the
+totals of any (start, end) window are a difference of two cumulative sums. The per
+capita costs of every window are computed together, as a donor x window matrix.
+
+The cost estimates are linear in the per capita cost, so the estimates of every
+window are the estimates for a cost of 1 (from `yearly_refugees_spending`) times
+the matrix. Years with reported IDRC don't depend on the window and are left out.
+"""
+
+import numpy as np
+import pandas as pd
+
+from scripts.config import PATHS, crisis_config
+from scripts.idrc_per_capita import YEAR_END, YEAR_START
+
+
+def cumulative_totals(
+    historical_refugees: pd.DataFrame, reported_idrc_data: pd.DataFrame
+) -> tuple[pd.Index, np.ndarray, np.ndarray, np.ndarray]:
+    """Cumulative IDRC and asylum applications of each donor, by year. The arrays
+    are donors x (years + 1), starting with zeros"""
+    df = reported_idrc_data.merge(
+        historical_refugees,
+        on=["iso_code", "year"],
+        suffixes=("_idrc", "_ref"),
+        how="inner",
+    ).astype({"iso_code": str, "year": int})
+
+    # Windows can extend over years only covered by one of the datasets
+    # (e.g. the default 2018-2022 window)
+    covered = pd.concat([historical_refugees.year, reported_idrc_data.year]).astype(int)
+    years = np.arange(covered.min(), covered.max() + 1)
+
+    def _cumulative(column: str) -> np.ndarray:
+        table = df.pivot_table(
+            index="iso_code", columns="year", values=column, aggfunc="sum"
+        ).reindex(columns=years)
+        values = table.fillna(0).to_numpy(dtype="float64")
+        return table.index, np.hstack([np.zeros((len(table), 1)), values.cumsum(1)])
+
+    donors, idrc = _cumulative("value_idrc")
+    _, refugees = _cumulative("value_ref")
+
+    return donors, years, idrc, refugees
+
+
+def per_capita_windows(
+    historical_refugees: pd.DataFrame,
+    reported_idrc_data: pd.DataFrame,
+    min_years: int = 3,
+) -> pd.DataFrame:
+    """Per capita IDRC of every donor (rows) for every window of at least
+    `min_years` years (columns, e.g. "2018-2022")"""
+    donors, years, idrc, refugees = cumulative_totals(
+        historical_refugees, reported_idrc_data
+    )
+
+    starts, ends = np.triu_indices(len(years), k=min_years - 1)
+
+    # Totals of each window: cumulative sum at the end minus before the start
+    window_idrc = idrc[:, ends + 1] - idrc[:, starts]
+    window_refugees = refugees[:, ends + 1] - refugees[:, starts]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cost = np.round(window_idrc * 1e6 / window_refugees, 1)
+
+    return pd.DataFrame(
+        cost,
+        index=pd.Index(donors, name="iso_code"),
+        columns=[f"{years[s]}-{years[e]}" for s, e in zip(starts, ends)],
+    )
+
+
+def estimate_ranges(
+    windows: pd.DataFrame, refugee_data: pd.DataFrame, years: list[int]
+) -> pd.DataFrame:
+    """Range of the cost estimates of each donor and year over all the windows"""
+    from scripts.idrc_per_capita import yearly_refugees_spending
+
+    # Estimates for a per capita cost of 1
+    unit = yearly_refugees_spending(
+        cost_data=windows.index.to_frame(index=False).assign(tot_cost_dfl=1.0),
+        refugee_data=refugee_data.astype({"iso_code": str}),
+        years=years,
+    ).set_index("iso_code")
+
+    baseline = f"{YEAR_START}-{YEAR_END}"
+    ranges = []
+
+    for year in years:
+        costs = windows.mul(unit[f"cost{str(year)[2:]}"], axis=0).dropna(how="all")
+        ranges.append(
+            pd.DataFrame(
+                {
+                    "year": year,
+                    "baseline": costs.get(baseline),
+                    "min": costs.min(axis=1),
+                    "max": costs.max(axis=1),
+                    "min_window": costs.idxmin(axis=1),
+                    "max_window": costs.idxmax(axis=1),
+                }
+            )
+        )
+
+    return pd.concat(ranges).reset_index().sort_values(["iso_code", "year"])
+
+
+def export_sensitivity(crisis: str = "ukraine", min_years: int = 3) -> None:
+    """Export the per capita IDRC of every window and the range of the cost
+    estimates of a crisis"""
+    from scripts.idrc_per_capita import (
+        HIGH_LOW,
+        filter_dac,
+        read_historical_unhcr_data,
+        read_ukriane_hcr_data,
+        yearly_constant_idrc,
+    )
+    from scripts.scope import scoped_years
+
+    config_ = crisis_config(crisis)
+
+    windows = per_capita_windows(
+        read_historical_unhcr_data(HIGH_LOW).pipe(filter_dac),
+        yearly_constant_idrc(),
+        min_years=min_years,
+    )
+    windows.to_csv(PATHS.output / "per_capita_windows.csv")
+
+    years = [y for y in scoped_years(config_["years"]) if y not in config_["reported"]]
+    refugees = read_ukriane_hcr_data(config_["ledger"]).pipe(filter_dac)
+
+    estimate_ranges(windows, refugees, years).to_csv(
+        PATHS.output / f"{crisis}_cost_estimate_ranges.csv", index=False
+    )
+
+    print(f"Exported the per capita cost of {windows.shape[1]} windows ({crisis})")
+
+
+if __name__ == "__main__":
+    export_sensitivity()
@@ -0,0 +1,239 @@
+"""Optional read-only HTTP server for the tracker outputs.
+
+The output files are loaded into in-memory tables indexed on donor and year, and
+queried per donor, year and indicator:
+
+    GET /tables
+    GET /tables/idrc_share?donor=Germany,France&year=2021,2022
+    GET /tables/cube?donor=Poland&indicator=idrc&format=csv
+
+Responses carry an ETag (If-None-Match returns 304) and are gzip-compressed when
+the client accepts it (with an ETag of their own, and Vary: Accept-Encoding). The
+tables without years (cost_estimates, hcr_data) can't be queried by year. The tables are reloaded in the background when a run
+publishes new outputs, and swapped in without interrupting requests.
+"""
+
+import gzip
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+from scripts.config import PATHS
+
+# name -> file pattern (in the output folder), donor column, year column
+TABLES: dict[str, dict] = {
+    "cost_estimates": {
+        "files": "ukraine_refugee_cost_estimates.csv",
+        "donor": "iso_code",
+        "year": None,
+    },
+    "idrc_share": {"files": "idrc_share.csv", "donor": "Donor", "year": "year"},
+    "idrc_oda_chart": {
+        "files": "idrc_oda_chart_*.csv",
+        "donor": "Donor",
+        "year": "year",
+    },
+    "idrc_constant": {
+        "files": "idrc_over_time_constant.csv",
+        "donor": "donor_name",
+        "year": "year",
+    },
+    "hcr_data": {"files": "hcr_data.csv", "donor": "iso_code", "year": None},
+    "latest_oda": {"files": "latest_oda.csv", "donor": "donor_name", "year": "year"},
+    "cube": {"files": "tracker_cube.parquet", "donor": "donor_name", "year": "year"},
+}
+
+
+def _read_table(name: str) -> pd.DataFrame:
+    """Read the files of a table into a single DataFrame"""
+    files = sorted(PATHS.output.glob(TABLES[name]["files"]))
+
+    if name == "cube":
+        return pd.read_parquet(files[0]).astype({"iso_code": str, "donor_name": str})
+
+    data = pd.concat([pd.read_csv(f) for f in files], ignore_index=True)
+
+    if name == "idrc_constant":
+        # The chart file is wide (one column per donor)
+        data = data.melt(id_vars="year", var_name="donor_name", value_name="idrc")
+
+    return data
+
+
+def _files_version() -> str:
+    """A version identifier of the output files, based on their modification times"""
+    stamps = [
+        f"{f.name}:{f.stat().st_mtime_ns}"
+        for table in TABLES.values()
+        for f in sorted(PATHS.output.glob(table["files"]))
+    ]
+    return hashlib.sha1("|".join(stamps).encode()).hexdigest()[:12]
+
+
+class TableStore:
+    """The output tables, indexed on donor (and year)"""
+
+    def __init__(self):
+        self.version = _files_version()
+        self.tables: dict[str, pd.DataFrame] = {}
+
+        for name, table in TABLES.items():
+            try:
+                data = _read_table(name)
+            except (FileNotFoundError, IndexError, ValueError):
+                continue
+            keys = [k for k in [table["donor"], table["year"]] if k is not None]
+            self.tables[name] = data.set_index(keys, drop=False).sort_index()
+
+    def query(
+        self,
+        name: str,
+        donors: list[str] | None = None,
+        years: list[int] | None = None,
+        indicators: list[str] | None = None,
+    ) -> pd.DataFrame:
+        """Select rows by donor and year (using the index) and indicators"""
+        if years is not None and TABLES[name]["year"] is None:
+            raise ValueError(f"{name} has no year column")
+
+        data = self.tables[name]
+        index = data.index
+
+        if isinstance(index, pd.MultiIndex):
+            donors = index.levels[0] if donors is None else donors
+            years = index.levels[1] if years is None else years
+            keys = (
+                index.levels[0].intersection(donors),
+                index.levels[1].intersection(years),
+            )
+            data = data.loc[keys, :] if all(len(k) for k in keys) else data.iloc[:0]
+        elif donors is not None:
+            data = data.loc[index.intersection(donors)]
+
+        if indicators is not None:
+            if "indicator" in data.columns:
+                data = data.loc[data.indicator.isin(indicators)]
+            else:
+                keys = [k for k in [TABLES[name]["donor"], TABLES[name]["year"]] if k]
+                data = data.filter(keys + indicators, axis=1)
+
+        return data.reset_index(drop=True)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "TrackerServer"
+
+    def _gzip(self) -> bool:
+        """Whether the client accepts gzip-compressed responses"""
+        return "gzip" in self.headers.get("Accept-Encoding", "")
+
+    def _send(self, status: int, body: bytes, content_type: str, etag: str) -> None:
+        encoded = self._gzip()
+        if encoded:
+            body = gzip.compress(body)
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("ETag", etag)
+        self.send_header("Vary", "Accept-Encoding")
+        self.send_header("Cache-Control", "no-cache")
+        if encoded:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status: int, message: str) -> None:
+        body = json.dumps({"error": message}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        store = self.server.store
+        url = urlparse(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        params = {k: ",".join(v).split(",") for k, v in parse_qs(url.query).items()}
+
+        # The ETag depends on the data version, the query and the encoding, so it
+        # is known before computing the response
+        query = hashlib.sha1(self.path.encode()).hexdigest()[:8]
+        etag = f'"{store.version}-{query}{"-gz" if self._gzip() else ""}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Vary", "Accept-Encoding")
+            self.end_headers()
+            return
+
+        if parts == ["tables"]:
+            body = json.dumps(
+                {name: list(df.columns) for name, df in store.tables.items()}
+            )
+            self._send(200, body.encode(), "application/json", etag)
+            return
+
+        if len(parts) != 2 or parts[0] != "tables" or parts[1] not in store.tables:
+            self._error(404, f"Unknown path: {url.path}")
+            return
+
+        try:
+            years = [int(y) for y in params["year"]] if "year" in params else None
+        except ValueError:
+            self._error(400, "year must be an integer")
+            return
+
+        try:
+            data = store.query(
+                parts[1],
+                donors=params.get("donor"),
+                years=years,
+                indicators=params.get("indicator"),
+            )
+        except ValueError as e:
+            self._error(400, str(e))
+            return
+
+        if params.get("format", ["json"])[0] == "csv":
+            self._send(200, data.to_csv(index=False).encode(), "text/csv", etag)
+        else:
+            body = data.to_json(orient="records", date_format="iso")
+            self._send(200, body.encode(), "application/json", etag)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+class TrackerServer(ThreadingHTTPServer):
+    """HTTP server that reloads the tables when the outputs change"""
+
+    def __init__(self, address: tuple[str, int], reload_interval: int = 30):
+        super().__init__(address, _Handler)
+        self.store = TableStore()
+        self.reload_interval = reload_interval
+        threading.Thread(target=self._reload_loop, daemon=True).start()
+
+    def _reload_loop(self) -> None:
+        while True:
+            time.sleep(self.reload_interval)
+            if _files_version() != self.store.version:
+                # Build the new tables before swapping them in
+                self.store = TableStore()
+                print(f"Reloaded tables (version {self.store.version})")
+
+
+def serve(host: str = "127.0.0.1", port: int = 8000) -> None:
+    """Serve the tracker outputs until interrupted"""
+    server = TrackerServer((host, port))
+    print(f"Serving tracker data on http://{host}:{port}/tables")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
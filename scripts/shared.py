@@ -0,0 +1,323 @@
+"""Base panels shared by the workers of a process pool, without copies.
+
+The panels read by most stages (IDRC, GNI, total ODA, the DAC1 indicators and the
+UNHCR asylum history) are loaded once by the parent process and written as
+uncompressed Arrow IPC files to a run folder in shared memory (/dev/shm, or the
+temporary folder where there is none). The workers memory-map the files: the
+pages are shared by all the processes, so the memory used stays close to one copy
+of the panels whatever the number of workers.
+
+The readers (`oda.read_idrc`, `oda.read_gni`, `oda.read_oda`,
+`dac1.tracker_dac1_data` and `idrc_per_capita.read_historical_unhcr_data`) attach
+to a published panel when there is one, and read the files otherwise:
+
+    with shared_panels():
+        results = run_parallel(estimate, donors, workers=4)
+
+The run folder is removed when the block exits, also on errors. Folders left by a
+run that was killed (named after the process that published them) are removed the
+next time panels are published, on POSIX systems only: Windows has no signal-free
+liveness check in the standard library (`os.kill(pid, 0)` terminates the process
+there) and can't delete files that are still mapped.
+
+No pipeline stage runs in a process pool yet (`update.py` runs the stages one
+after the other), so the panels are only published by the benchmark; the readers
+read their files as usual when nothing is published.
+"""
+
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import cache
+from importlib import import_module
+from pathlib import Path
+from typing import Callable, Iterable
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+# Set for the processes that can attach to the panels (inherited by the workers)
+ENV_VAR: str = "TRACKER_SHARED_DATA"
+
+PREFIX: str = "tracker-shared-"
+
+# panel -> reader ("module:function") and its arguments
+PANELS: dict[str, tuple[str, tuple]] = {
+    "idrc": ("scripts.oda:read_idrc", ()),
+    "gni": ("scripts.oda:read_gni", ()),
+    "oda": ("scripts.oda:read_oda", ()),
+    "dac1": ("scripts.dac1:tracker_dac1_data", ()),
+    "unhcr_high": ("scripts.idrc_per_capita:read_historical_unhcr_data", ("high",)),
+    "unhcr_low": ("scripts.idrc_per_capita:read_historical_unhcr_data", ("low",)),
+}
+
+
+def _root() -> Path:
+    """Folder of the run folders: shared memory where available"""
+    shm = Path("/dev/shm")
+    if shm.is_dir() and os.access(shm, os.W_OK):
+        return shm
+    return Path(tempfile.gettempdir())
+
+
+def _alive(pid: int) -> bool:
+    """Whether a process is running (POSIX: signal 0 only checks the process)"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def cleanup_stale() -> list[Path]:
+    """Remove the run folders of processes that are no longer running. Skipped on
+    Windows, where the liveness of a process can't be checked without terminating it"""
+    if os.name == "nt":
+        return []
+
+    removed = []
+    for folder in _root().glob(f"{PREFIX}*"):
+        pid = folder.name.removeprefix(PREFIX).split("-")[0]
+        if pid.isdigit() and not _alive(int(pid)):
+            shutil.rmtree(folder, ignore_errors=True)
+            removed.append(folder)
+
+    return removed
+
+
+def _reader(name: str) -> tuple[Callable, tuple]:
+    """The reader of a panel and its arguments"""
+    target, args = PANELS[name]
+    module, function = target.split(":")
+    return getattr(import_module(module), function), args
+
+
+def write_panel(folder: Path, name: str, df: pd.DataFrame) -> Path:
+    """Write a panel as an uncompressed Arrow IPC file (memory-mappable)"""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    file = folder / f"{name}.arrow"
+    temporary = file.with_suffix(".tmp")
+
+    with pa.OSFile(str(temporary), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(temporary, file)
+
+    return file
+
+
+def publish(
+    names: Iterable[str] | None = None, tables: dict[str, pd.DataFrame] | None = None
+) -> Path:
+    """Load the panels (or use the tables given) and write them to a new run
+    folder. Returns the folder, to be set in ENV_VAR.
+
+    By default all the panels are published, except those that can't be read
+    (e.g. a missing file): the readers then read their files as usual"""
+    cleanup_stale()
+
+    optional = names is None and tables is None
+    names = list(PANELS if optional else names or [])
+    folder = Path(tempfile.mkdtemp(prefix=f"{PREFIX}{os.getpid()}-", dir=_root()))
+
+    try:
+        for name in names:
+            reader, args = _reader(name)
+            try:
+                df = reader(*args)
+            except OSError as e:
+                if not optional:
+                    raise
+                print(f"Not publishing {name}: {e!r:.100}")
+                continue
+            write_panel(folder, name, df)
+            # The workers must attach to the panel, not inherit the parent's copy
+            if hasattr(reader, "cache_clear"):
+                reader.cache_clear()
+        for name, df in (tables or {}).items():
+            write_panel(folder, name, df)
+    except BaseException:
+        shutil.rmtree(folder, ignore_errors=True)
+        raise
+
+    size = sum(f.stat().st_size for f in folder.iterdir()) / 1e6
+    print(f"Published {len(list(folder.iterdir()))} panels ({size:.1f} MB) to {folder}")
+
+    return folder
+
+
+@contextmanager
+def shared_panels(
+    names: Iterable[str] | None = None, tables: dict[str, pd.DataFrame] | None = None
+):
+    """Publish the panels for the duration of the block (for this process and the
+    workers it starts) and remove them afterwards"""
+    folder = publish(names, tables)
+    previous = os.environ.get(ENV_VAR)
+    os.environ[ENV_VAR] = str(folder)
+
+    try:
+        yield folder
+    finally:
+        if previous is None:
+            os.environ.pop(ENV_VAR, None)
+        else:
+            os.environ[ENV_VAR] = previous
+        _map.cache_clear()
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+@cache
+def _map(file: str) -> pa.Table:
+    """The table of a panel file, backed by the mapped pages (no copy)"""
+    with pa.memory_map(file, "r") as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+def attach_table(name: str) -> pa.Table | None:
+    """The published panel as an Arrow table, or None if it isn't published"""
+    folder = os.environ.get(ENV_VAR)
+    if not folder:
+        return None
+
+    file = Path(folder) / f"{name}.arrow"
+    if not file.exists():
+        return None
+
+    return _map(str(file))
+
+
+def _views(table: pa.Table) -> dict[str, pd.api.extensions.ExtensionArray]:
+    """Nullable integer and categorical columns without missing values, as views of
+    the mapped values and codes (pandas copies them when converting the table)"""
+    numpy_types = {
+        c["name"]: c["numpy_type"] for c in table.schema.pandas_metadata["columns"]
+    }
+
+    views = {}
+    for name in table.column_names:
+        column = table.column(name)
+        if column.null_count or column.num_chunks != 1:
+            continue
+        chunk = column.chunk(0)
+
+        if pa.types.is_dictionary(chunk.type):
+            codes = chunk.indices.to_numpy(zero_copy_only=True)
+            dtype = pd.CategoricalDtype(
+                chunk.dictionary.to_pandas(), ordered=chunk.type.ordered
+            )
+            views[name] = pd.Categorical.from_codes(codes, dtype=dtype, validate=False)
+        elif numpy_types.get(name, "").startswith("Int"):
+            values = chunk.to_numpy(zero_copy_only=True)
+            # No value is missing: a read-only mask that takes no memory
+            mask = np.broadcast_to(np.False_, len(values))
+            views[name] = pd.arrays.IntegerArray(values, mask)
+
+    return views
+
+
+def attach(name: str) -> pd.DataFrame | None:
+    """The published panel as a DataFrame, or None if it isn't published. The
+    columns without missing values point to the mapped pages (they are read-only)"""
+    table = attach_table(name)
+    if table is None:
+        return None
+
+    views = _views(table)
+    df = table.drop_columns(list(views)).to_pandas(split_blocks=True)
+
+    # assign or a selection of the columns would copy them
+    return pd.DataFrame(
+        {c: views[c] if c in views else df[c] for c in table.column_names}, copy=False
+    )
+
+
+def run_parallel(
+    function: Callable, items: Iterable, workers: int | None = None
+) -> list:
+    """Apply a function (importable, e.g. a stage function) to the items in a
+    process pool. The workers attach to the panels published by shared_panels"""
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(function, items))
+
+
+# -----------------------------------------------------------------------------
+# Benchmark
+
+
+def _pss() -> int:
+    """Proportional set size of this process (shared pages are divided between
+    the processes that map them), in bytes"""
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            if line.startswith("Pss:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+_BASELINE: int = 0
+
+
+def _start_worker() -> None:
+    global _BASELINE
+    # Imports and allocations of the first conversion are not counted
+    pa.table({"a": [1]}).to_pandas(split_blocks=True).sum()
+    _BASELINE = _pss()
+
+
+def _use_panels(tables: dict[str, pd.DataFrame] | None) -> tuple[int, int]:
+    """Read every value of the panels (handed over or attached). Returns the pid
+    and the memory added to the worker"""
+    if tables is None:
+        names = [Path(file).stem for file in os.listdir(os.environ[ENV_VAR])]
+        tables = {name: attach(name) for name in names}
+
+    for df in tables.values():
+        df.select_dtypes("number").sum()
+
+    return os.getpid(), _pss() - _BASELINE
+
+
+def benchmark(workers: Iterable[int] = (1, 2, 4, 8), scale: int = 2000) -> pd.DataFrame:
+    """Memory added to the workers by the panels (repeated `scale` times), when
+    they are pickled to each worker and when they are shared"""
+    from scripts.idrc_per_capita import read_historical_unhcr_data
+    from scripts.oda import read_gni, read_idrc, read_oda
+
+    panels = {
+        "idrc": read_idrc(),
+        "gni": read_gni(),
+        "oda": read_oda(),
+        "unhcr_high": read_historical_unhcr_data("high"),
+    }
+    tables = {
+        name: pd.concat([df] * scale, ignore_index=True) for name, df in panels.items()
+    }
+
+    results = []
+    with shared_panels(tables=tables) as folder:
+        size = sum(f.stat().st_size for f in folder.iterdir())
+
+        for n in workers:
+            for mode, argument in [("pickled", tables), ("shared", None)]:
+                with ProcessPoolExecutor(n, initializer=_start_worker) as pool:
+                    added = dict(pool.map(_use_panels, [argument] * n))
+                results.append(
+                    {
+                        "workers": n,
+                        "mode": mode,
+                        "panels_mb": round(size / 1e6, 1),
+                        "workers_mb": round(sum(added.values()) / 1e6, 1),
+                    }
+                )
+
+    return pd.DataFrame(results)
+
+
+if __name__ == "__main__":
+    print(benchmark().to_string(index=False))
@@ -0,0 +1,157 @@
+"""Registry of the pipeline stages.
+
+Stages are stored as "module:function" strings so that running a stage only imports
+the modules (and dependencies) it actually needs. Import and run times are
+appended to a csv so that start-up costs can be tracked over time (the latest
+MAX_TIMINGS rows are kept; the file is not committed).
+"""
+
+import importlib
+import time
+from csv import reader, writer
+from datetime import datetime
+from pathlib import Path
+from typing import Callable
+
+from scripts.config import PATHS
+
+STAGES: dict[str, str] = {
+    # Check the local inputs before any download or scraping
+    "preflight": "scripts.preflight:run_preflight",
+    # Update Ukraine refugees data
+    "unhcr": "scripts.unhcr_data:update_ukraine_hcr_data",
+    # Update the historical UNHCR asylum data (only if the API data changed)
+    "unhcr_asylum": "scripts.idrc_per_capita:refresh_unhcr_data",
+    # Rebuild the monthly refugee data from the saved snapshots (no scraping)
+    "hcr_ledger": "scripts.unhcr_data:rebuild_ukraine_hcr_data",
+    # Same, with the missing months interpolated and projected to the horizon
+    "hcr_nowcast": "scripts.nowcast:nowcast_ukraine_hcr_data",
+    # Export IDRC, ODA and GNI from the DAC1 file
+    "dac1_exports": "scripts.oda:update_dac1_exports",
+    # Build the data cube used by the charts
+    "cube": "scripts.cube:build_cube",
+    # Update IDRC estimates charts
+    "idrc_share": "scripts.oda:idrc_as_share",
+    # Update IDRC ODA chart
+    "idrc_oda_chart": "scripts.oda:idrc_oda_chart",
+    # Update IDRC constant chart
+    "idrc_constant": "scripts.oda:idrc_constant_wide",
+    # IDRC constant prices in other base years and currencies
+    "idrc_constant_bases": "scripts.prices:idrc_constant_bases",
+    # Update donor tracker table
+    "dt_table": "scripts.dt_table:live_dt_table_pipeline",
+    # Donor Tracker tables of config.DT_TABLES, from the local article index
+    "dt_tables": "scripts.dt_index:update_dt_tables",
+    # Export summary cost data
+    "summary_cost": "scripts.idrc_per_capita:export_summary_cost_data",
+    # update historical refugee estimates
+    "refugee_cost": "scripts.idrc_per_capita:update_refugee_cost_data",
+    # Per capita IDRC of every window of years and the range of the estimates
+    "sensitivity": "scripts.sensitivity:export_sensitivity",
+    # update monthly oda
+    "latest_oda": "scripts.oda:update_oda",
+    # ODA to Ukraine by donor, year, sector and flow type, from the CRS files
+    "crs_ukraine": "scripts.crs:update_crs_ukraine",
+    # Cost estimates and Donor Tracker tables of all the crises in config.CRISES
+    "crises": "scripts.crises:run_crises",
+    # SQLite database with all the tracker data, indexed, with one view per chart
+    "database": "scripts.database:export_database",
+    # Rows added, removed and changed in each output since the last run
+    "changes": "scripts.changes:record_changes",
+    # Archive the outputs and inputs of the run
+    "archive": "scripts.archive:save_run",
+    # Update last updated date
+    "last_updated": "scripts.stages:last_updated",
+}
+
+DAILY_STAGES: list[str] = [
+    "preflight",
+    "unhcr",
+    "cube",
+    "idrc_share",
+    "idrc_oda_chart",
+    "idrc_constant",
+    "idrc_constant_bases",
+    "dt_table",
+    "dt_tables",
+    "summary_cost",
+    "database",
+    "changes",
+    "archive",
+]
+
+WEEKLY_STAGES: list[str] = [
+    "refugee_cost",
+    "latest_oda",
+    "crs_ukraine",
+    "database",
+    "changes",
+    "last_updated",
+    "archive",
+]
+
+# Rows kept in the timings csv
+MAX_TIMINGS: int = 5_000
+
+
+def last_updated():
+    """Appends the date of last run to a csv"""
+
+    with open(PATHS.output / "updates.csv", "a+", newline="") as write_obj:
+        # Create a writer object from csv module
+        csv_writer = writer(write_obj)
+        # Add contents of list as last row in the csv file
+        csv_writer.writerow([datetime.today()])
+
+
+def timings_file() -> Path:
+    """The timings csv. Found when it is written, as PATHS can point elsewhere (a
+    scratch folder) after this module is imported"""
+    return PATHS.output / "stage_timings.csv"
+
+
+def _record_timing(stage: str, import_seconds: float, run_seconds: float) -> None:
+    """Append the import and run time of a stage to the timings csv, keeping the
+    latest MAX_TIMINGS rows"""
+    rows = []
+    if timings_file().exists():
+        with open(timings_file(), "r", newline="") as read_obj:
+            rows = list(reader(read_obj))[1:]
+
+    rows.append(
+        [datetime.today(), stage, round(import_seconds, 4), round(run_seconds, 4)]
+    )
+
+    with open(timings_file(), "w", newline="") as write_obj:
+        csv_writer = writer(write_obj)
+        csv_writer.writerow(["date", "stage", "import_seconds", "run_seconds"])
+        csv_writer.writerows(rows[-MAX_TIMINGS:])
+
+
+def load_stage(stage: str) -> Callable[[], None]:
+    """Import the module of a stage and return the function that runs it"""
+    if stage not in STAGES:
+        raise ValueError(f"Unknown stage: {stage}. Valid stages: {list(STAGES)}")
+
+    module, function = STAGES[stage].split(":")
+
+    return getattr(importlib.import_module(module), function)
+
+
+def run_stage(stage: str, record: bool = True) -> None:
+    """Run a single stage, timing its import and its execution"""
+    start = time.perf_counter()
+    func = load_stage(stage)
+    imported = time.perf_counter()
+
+    func()
+    finished = time.perf_counter()
+
+    if record:
+        _record_timing(stage, imported - start, finished - imported)
+
+
+def run_stages(stages: list[str], record: bool = True) -> None:
+    """Run the stages in the order they are given"""
+    for stage in stages:
+        run_stage(stage, record=record)
@@ -0,0 +1,276 @@
+"""Stale-while-revalidate for the upstream fetches (the UNHCR Power BI scrape, the
+Donor Tracker request and the UNHCR asylum API).
+
+Every successful fetch is kept in `raw_data/.swr`. In stale mode, a fetch returns
+the last good result at once (its age is recorded and printed) and refreshes it in
+a background thread. At the end of the run, `revalidate` waits for the refreshes
+(up to a deadline): when a refreshed result differs from the one served, the
+stages that used it are re-run, and so are the stages that depend on the files
+they change (see watch.DEPENDENCIES). Refreshes that miss the deadline are served
+on the next run.
+
+    python -m scripts run daily --stale
+
+Outside of stale mode the fetches run as usual, and their results are kept for
+the next stale run.
+
+Stale mode is for local runs: the cache is gitignored, so the scheduled workflow
+(a fresh runner every day) has nothing to serve and runs `update.py` without it.
+"""
+
+import hashlib
+import json
+import pickle
+import threading
+import time
+from datetime import datetime
+from functools import wraps
+from pathlib import Path
+from typing import Any, Callable
+
+import pandas as pd
+
+from scripts.config import PATHS
+
+# Whether fetches serve their last good result and refresh it in the background
+ENABLED: bool = False
+
+# Seconds given to the background refreshes (from the start of each refresh)
+DEADLINE: float = 300
+
+# Background refreshes of this process: key -> state
+_REFRESHES: dict[str, dict] = {}
+_LOCK = threading.Lock()
+
+
+def _folder() -> Path:
+    return PATHS.raw_data / ".swr"
+
+
+def _digest(value: Any) -> str:
+    """Hash of a fetched result (DataFrame or json)"""
+    if isinstance(value, pd.DataFrame):
+        content = pd.util.hash_pandas_object(value, index=False).values.tobytes()
+        content += repr(list(value.columns)).encode()
+    else:
+        content = json.dumps(value, sort_keys=True, default=str).encode()
+
+    return hashlib.sha256(content).hexdigest()[:16]
+
+
+def _key(name: str, args: tuple, kwargs: dict) -> str:
+    """Cache key of a fetch and its arguments"""
+    arguments = repr((args, sorted(kwargs.items()))).encode()
+    return f"{name}-{hashlib.sha256(arguments).hexdigest()[:12]}"
+
+
+def read_index() -> dict:
+    """Fetched, served and age of every cached result"""
+    file = _folder() / "index.json"
+    if not file.exists():
+        return {}
+
+    with open(file, "r") as f:
+        return json.load(f)
+
+
+def _update_index(key: str, **values) -> None:
+    with _LOCK:
+        index = read_index()
+        index[key] = index.get(key, {}) | values
+        _folder().mkdir(parents=True, exist_ok=True)
+        with open(_folder() / "index.json", "w") as f:
+            json.dump(index, f, indent=2)
+
+
+def _store(key: str, name: str, source: str, value: Any) -> None:
+    """Keep a result (written to a temporary file, then moved in place)"""
+    _folder().mkdir(parents=True, exist_ok=True)
+    file = _folder() / f"{key}.pkl"
+    temporary = file.with_suffix(".tmp")
+
+    with open(temporary, "wb") as f:
+        pickle.dump(value, f)
+    temporary.replace(file)
+
+    _update_index(
+        key,
+        name=name,
+        source=source,
+        fetched=datetime.now().isoformat(timespec="seconds"),
+        digest=_digest(value),
+    )
+
+
+def _cached(key: str) -> Any | None:
+    file = _folder() / f"{key}.pkl"
+    if not file.exists():
+        return None
+
+    with open(file, "rb") as f:
+        return pickle.load(f)
+
+
+def _fetch(fetch: Callable, args: tuple, kwargs: dict) -> Any:
+    """Fetch, treating an empty result (e.g. a failed download) as an error"""
+    value = fetch(*args, **kwargs)
+    if value is None:
+        raise ValueError(f"{fetch.__name__} returned no data")
+    return value
+
+
+def _refresh(key: str, name: str, source: str, fetch, args, kwargs) -> None:
+    """Background refresh of a result, recording whether it changed"""
+    state = _REFRESHES[key]
+    try:
+        value = _fetch(fetch, args, kwargs)
+        state["changed"] = _digest(value) != read_index().get(key, {}).get("digest")
+        _store(key, name, source, value)
+    except Exception as e:  # the stale result stays in use
+        state["error"] = repr(e)
+        print(f"Could not refresh {name}: {e!r}")
+
+
+def _fetch_within_deadline(fetch: Callable, args: tuple, kwargs: dict) -> Any:
+    """Fetch in a thread, giving up after the deadline"""
+    result = {}
+
+    def _run():
+        try:
+            result["value"] = _fetch(fetch, args, kwargs)
+        except Exception as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=_run, daemon=True)
+    thread.start()
+    thread.join(DEADLINE)
+
+    if thread.is_alive():
+        raise TimeoutError(f"{fetch.__name__} took more than {DEADLINE}s")
+    if "error" in result:
+        raise result["error"]
+
+    return result["value"]
+
+
+def stale_while_revalidate(
+    name: str, source: str | Callable[..., str], stages: list[str]
+) -> Callable:
+    """Decorate a fetch function. `source` is the freshness source of the data
+    (or a function of the fetch arguments) and `stages` the stages that use it"""
+
+    def decorator(fetch: Callable) -> Callable:
+        @wraps(fetch)
+        def wrapper(*args, **kwargs):
+            key = _key(name, args, kwargs)
+            source_ = source(*args, **kwargs) if callable(source) else source
+
+            if not ENABLED:
+                value = fetch(*args, **kwargs)
+                if value is not None:
+                    _store(key, name, source_, value)
+                return value
+
+            cached = _cached(key)
+
+            # Nothing to serve yet: the fetch can't be avoided
+            if cached is None:
+                value = _fetch_within_deadline(fetch, args, kwargs)
+                _store(key, name, source_, value)
+                _update_index(key, served="fresh", age_hours=0)
+                return value
+
+            # Already served in this run: the refreshed result once it is in
+            if key in _REFRESHES:
+                return cached
+
+            fetched = read_index().get(key, {}).get("fetched")
+            age = (datetime.now() - datetime.fromisoformat(fetched)).total_seconds()
+            _update_index(key, served="stale", age_hours=round(age / 3600, 2))
+            print(f"Serving cached {name} ({age / 3600:.1f} hours old)")
+
+            _REFRESHES[key] = {
+                "name": name,
+                "source": source_,
+                "stages": stages,
+                "started": time.monotonic(),
+                "changed": False,
+            }
+            _REFRESHES[key]["thread"] = threading.Thread(
+                target=_refresh,
+                args=(key, name, source_, fetch, args, kwargs),
+                daemon=True,
+            )
+            _REFRESHES[key]["thread"].start()
+
+            return cached
+
+        return wrapper
+
+    return decorator
+
+
+def served_stale(source: str) -> bool:
+    """Whether cached data of the source was served and not yet revalidated (its
+    upstream version must not be recorded yet)"""
+    return any(
+        r["source"] == source and not r.get("revalidated") for r in _REFRESHES.values()
+    )
+
+
+def _file_digests() -> dict[Path, str]:
+    """Content hash of the watched input files"""
+    from scripts.watch import _input_files
+
+    return {f: hashlib.sha256(f.read_bytes()).hexdigest() for f in _input_files()}
+
+
+def revalidate(ran: list[str] | None = None) -> list[str]:
+    """Wait for the background refreshes (up to the deadline) and re-run the stages
+    (out of those that ran, if given) whose fetched data changed, then the stages
+    that depend on the files they changed. Returns the stages re-run"""
+    from scripts.stages import run_stage
+    from scripts.watch import ORDER, affected_stages, clear_caches
+
+    queue = []
+    for key, refresh in _REFRESHES.items():
+        remaining = refresh["started"] + DEADLINE - time.monotonic()
+        refresh["thread"].join(max(remaining, 0))
+
+        if refresh["thread"].is_alive():
+            print(f"{refresh['name']} not refreshed within {DEADLINE}s")
+        elif refresh["changed"]:
+            print(f"{refresh['name']} changed upstream")
+            queue += [s for s in refresh["stages"] if ran is None or s in ran]
+        refresh["revalidated"] = True
+
+    rerun = []
+    while queue:
+        queue.sort(key=lambda s: ORDER.index(s) if s in ORDER else len(ORDER))
+        stage = queue.pop(0)
+
+        before = _file_digests()
+        run_stage(stage)
+        rerun.append(stage)
+
+        changed = [f for f, d in _file_digests().items() if before.get(f) != d]
+        clear_caches(changed)
+        queue += [s for s in affected_stages(changed) if s not in queue + rerun]
+
+    return rerun
+
+
+def run_stale(stages: list[str], record: bool = True) -> list[str]:
+    """Run the stages serving the cached upstream data, then revalidate"""
+    from scripts.stages import run_stages
+
+    global ENABLED
+    ENABLED = True
+    try:
+        run_stages(stages, record=record)
+        return revalidate(stages)
+    finally:
+        ENABLED = False
+        # The refreshes of this run are done with (or left to finish in the
+        # background): a later run in the process starts without them
+        _REFRESHES.clear()
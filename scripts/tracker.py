@@ -0,0 +1,191 @@
+"""Lazily computed tracker data, for notebooks and other services.
+
+    from scripts.tracker import Tracker
+
+    tracker = Tracker()
+    tracker.cost_estimates    # reads and computes only what the estimates need
+    tracker.idrc_share        # reuses the panels already computed
+
+Each property is computed on first access from the saved inputs (the HCR
+snapshots, the DAC files and the asylum data; nothing is scraped or downloaded)
+with the functions used by the pipeline stages, and kept. Nothing is written to
+`output`. The properties depend on each other (see DEPENDENCIES): once an input
+has changed, `invalidate` drops a property and the properties computed from it,
+which are computed again on next access:
+
+    tracker.invalidate("refugee_ledger")   # the ledger, estimates, cube, charts
+    tracker.invalidate()                   # everything
+"""
+
+from functools import cached_property
+
+import pandas as pd
+
+# property -> the properties it is computed from
+DEPENDENCIES: dict[str, list[str]] = {
+    "refugee_ledger": [],
+    "asylum_applications": [],
+    "idrc": [],
+    "oda": [],
+    "gni": [],
+    "idrc_constant": ["idrc"],
+    "cost_per_refugee": ["asylum_applications", "idrc_constant"],
+    "cost_estimates": ["refugee_ledger", "cost_per_refugee", "idrc_constant"],
+    "cube": ["idrc", "oda", "gni", "cost_estimates"],
+    "idrc_share": ["cube"],
+    "idrc_oda": ["cube"],
+    "idrc_constant_chart": ["cube"],
+}
+
+
+class Tracker:
+    """The tracker data of a crisis, computed on first access and kept"""
+
+    def __init__(self, crisis: str = "ukraine", nowcast: bool = False):
+        from scripts.config import crisis_config
+
+        self.crisis = crisis
+        self.config = crisis_config(crisis)
+        # Impute the months missing from the Ukraine snapshots (see nowcast.py)
+        self.nowcast = nowcast
+
+    def __repr__(self) -> str:
+        return f"Tracker({self.crisis!r}, computed={self.computed})"
+
+    @property
+    def computed(self) -> list[str]:
+        """The properties computed so far"""
+        return [name for name in DEPENDENCIES if name in self.__dict__]
+
+    def invalidate(self, *names: str) -> list[str]:
+        """Drop the properties (all of them by default) and the properties computed
+        from them. Returns the properties dropped"""
+        unknown = set(names) - set(DEPENDENCIES)
+        if unknown:
+            raise ValueError(f"Unknown properties: {sorted(unknown)}")
+
+        stale = set(names or DEPENDENCIES)
+        while True:
+            dependants = {
+                name
+                for name, inputs in DEPENDENCIES.items()
+                if stale.intersection(inputs)
+            }
+            if dependants <= stale:
+                break
+            stale |= dependants
+
+        dropped = [name for name in self.computed if name in stale]
+        for name in dropped:
+            del self.__dict__[name]
+
+        return dropped
+
+    # -------------------------------------------------------------------------
+    # Inputs
+
+    @cached_property
+    def refugee_ledger(self) -> pd.DataFrame:
+        """Monthly refugees of the crisis by host country, from the saved data"""
+        if self.config["source"] is not None:
+            from scripts.crises import crisis_ledger
+
+            return crisis_ledger(self.crisis)
+
+        from scripts.unhcr_data import ukraine_hcr_ledger
+
+        return ukraine_hcr_ledger(nowcast=self.nowcast)
+
+    @cached_property
+    def asylum_applications(self) -> pd.DataFrame:
+        """Historical UNHCR asylum applications by donor and year"""
+        from scripts.idrc_per_capita import HIGH_LOW, read_historical_unhcr_data
+
+        # Read without the cache of the pipeline: the tracker keeps its own copy
+        return read_historical_unhcr_data.__wrapped__(HIGH_LOW)
+
+    @cached_property
+    def idrc(self) -> pd.DataFrame:
+        """Reported IDRC, in current prices"""
+        from scripts.oda import read_idrc
+
+        return read_idrc()
+
+    @cached_property
+    def oda(self) -> pd.DataFrame:
+        """Total ODA, in current prices"""
+        from scripts.oda import read_oda
+
+        return read_oda()
+
+    @cached_property
+    def gni(self) -> pd.DataFrame:
+        """GNI, in current prices"""
+        from scripts.oda import read_gni
+
+        return read_gni()
+
+    # -------------------------------------------------------------------------
+    # Computations
+
+    @cached_property
+    def idrc_constant(self) -> pd.DataFrame:
+        """Reported IDRC by ISO3 code, in constant prices"""
+        from scripts.idrc_per_capita import constant_idrc
+
+        return constant_idrc(self.idrc)
+
+    @cached_property
+    def cost_per_refugee(self) -> pd.DataFrame:
+        """IDRC per refugee of each DAC donor"""
+        from scripts.idrc_per_capita import filter_dac, per_capita_idrc
+
+        return per_capita_idrc(
+            self.asylum_applications.pipe(filter_dac), self.idrc_constant
+        )
+
+    @cached_property
+    def cost_estimates(self) -> pd.DataFrame:
+        """Refugees and cost estimates per year of the crisis, by donor"""
+        from scripts.idrc_per_capita import refugee_cost_estimates
+
+        return refugee_cost_estimates(
+            self.crisis,
+            ledger=self.refugee_ledger,
+            cost_data=self.cost_per_refugee,
+            idrc=self.idrc_constant,
+        )
+
+    @cached_property
+    def cube(self) -> pd.DataFrame:
+        """Donor x year x indicator x prices cube, indexed by donor and year, with
+        the IDRC estimates of the crisis"""
+        from scripts.cube import compute_cube, index_cube
+
+        return index_cube(
+            compute_cube(self.idrc, self.oda, self.gni, self.cost_estimates)
+        )
+
+    # -------------------------------------------------------------------------
+    # Chart tables
+
+    @cached_property
+    def idrc_share(self) -> pd.DataFrame:
+        """IDRC as a share of ODA, by donor and donor group"""
+        from scripts.oda import idrc_share_table
+
+        return idrc_share_table(self.cube)
+
+    @cached_property
+    def idrc_oda(self) -> pd.DataFrame:
+        """IDRC, ODA and GNI for the years of the ODA IDRC chart"""
+        from scripts.oda import idrc_oda_table
+
+        return idrc_oda_table(self.cube)
+
+    @cached_property
+    def idrc_constant_chart(self) -> pd.DataFrame:
+        """IDRC in constant prices, one column per donor"""
+        from scripts.oda import idrc_constant_table
+
+        return idrc_constant_table(self.cube)
@@ -2,44 +2,27 @@ import pandas as pd
 
 from scripts import config
 from scripts.config import PATHS
+from scripts.schema import apply_schema
 from scripts.unhcr_tools.get_page import get_unhcr_data
 
+# The data from the latest scrape of the UNHCR website
+LATEST_SNAPSHOT = PATHS.raw_data / "latest_hcr_data.csv"
+
 
 def load_historic_hcr_data() -> pd.DataFrame:
-    """Load a manually downloaded file containing historic HCR numbers for refugees."""
-
-    files = [
-        "early_august",
-        "early_december",
-        "early_january",
-        "early_november",
-        "early_october",
-        "early_september",
-        "july",
-        "late_december",
-        "late_july",
-        "late_november",
-        "late_october",
-        "late_september",
-        "mid_august",
-        "mid_december",
-        "mid_january",
-        "mid_november",
-        "mid_october",
-        "mid_september",
-    ]
+    """Load the saved snapshots of historic HCR numbers for refugees. The snapshot
+    of the latest scrape is not included"""
+
+    files = sorted(
+        f for f in config.PATHS.raw_data.glob("*_hcr_data.csv") if f != LATEST_SNAPSHOT
+    )
 
     dfs = []
 
     for file in files:
-        dfs.append(
-            pd.read_csv(
-                config.PATHS.raw_data / f"{file}_hcr_data.csv",
-                parse_dates=["Data Date"],
-            )
-        )
+        dfs.append(pd.read_csv(file, parse_dates=["Data Date"]))
 
-    return pd.concat(dfs)
+    return pd.concat(dfs).pipe(apply_schema)
 
 
 def clean_hrc_data(df: pd.DataFrame) -> pd.DataFrame:
@@ -70,18 +53,21 @@ def filter_hrc_data_by_month(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def monthly_difference_by_country(df: pd.DataFrame) -> pd.DataFrame:
+def monthly_difference_by_country(
+    df: pd.DataFrame,
+    column: str = "Refugees from Ukraine recorded in country as of date",
+) -> pd.DataFrame:
     """Calculate the difference in refugees from one month to the next
     for each country"""
 
-    column = "Refugees from Ukraine recorded in country as of date"
-
     df = df.sort_values(by=["Data Date", "iso_code"])
 
     df["difference"] = (
         df.groupby(by="iso_code", dropna=False, observed=True)[column]
         .diff()
         .fillna(df[column])
+        # Published as a float, whatever the dtype of the counts
+        .astype("float64")
     )
 
     return df
@@ -133,8 +119,11 @@ def read_manual_ukraine_refugee_data() -> pd.DataFrame:
     )
 
 
-def update_ukraine_hcr_data() -> None:
-    """Load and process HCR data"""
+def ukraine_hcr_ledger(nowcast: bool = False) -> pd.DataFrame:
+    """The monthly data from the saved HCR snapshots (historic and latest). This
+    does not scrape the UNHCR website. With nowcast, the missing months are
+    imputed (see nowcast.py)"""
+    from scripts.scope import in_scope
 
     # manual data
     manual_data = read_manual_ukraine_refugee_data().rename(
@@ -143,17 +132,6 @@ def update_ukraine_hcr_data() -> None:
         }
     )
 
-    # Get the latest data from the UNHCR website and clean the data types
-    new_data = (
-        get_unhcr_data()
-        .pipe(clean_hcr_data_download)
-        .rename(
-            columns={
-                "Individual refugees from Ukraine recorded across Europe": "Refugees from Ukraine recorded in country as of date"
-            }
-        )
-    )
-
     # Combine the new and historic data into a list
     data_files = [
         load_historic_hcr_data().rename(
@@ -162,25 +140,89 @@ def update_ukraine_hcr_data() -> None:
                 "from Ukraine recorded in country as of date"
             }
         ),
-        new_data,
     ]
 
+    # The latest scraped data
+    if LATEST_SNAPSHOT.exists():
+        data_files.append(
+            pd.read_csv(LATEST_SNAPSHOT, parse_dates=["Data Date"]).rename(
+                columns={
+                    "Individual refugees from Ukraine recorded across Europe": "Refugees from Ukraine recorded in country as of date"
+                }
+            )
+        )
+
     # Run data through pipeline
     data = (
         pd.concat(data_files, ignore_index=True)
+        .pipe(in_scope)
         .pipe(clean_hrc_data)
         .pipe(filter_hrc_data_by_month)
     )
-    data = pd.concat([data, manual_data], ignore_index=True)
+    data = pd.concat([data, manual_data], ignore_index=True).pipe(in_scope)
+
+    if nowcast:
+        from scripts.nowcast import nowcast_ledger
+
+        data = nowcast_ledger(data)
 
     data = data.pipe(monthly_difference_by_country).pipe(add_yearly_ratios)
 
     # Change the date format
     data["Data Date"] = data["Data Date"].dt.strftime("%m-%Y")
 
-    data.to_csv(PATHS.output / "hcr_data.csv", index=False)
+    return data.reset_index(drop=True)
+
+
+def seed_latest_snapshot() -> None:
+    """Save the rows of the last scrape, as published in output/hcr_data.csv, as the
+    latest snapshot. Before the latest snapshot was saved, the scraped rows were
+    only kept in the published data: the latest month of each country (other than
+    the manual data), dated on the first of the month"""
+    column = "Refugees from Ukraine recorded in country as of date"
+
+    manual = read_manual_ukraine_refugee_data().assign(
+        month=lambda d: d["Data Date"].dt.strftime("%m-%Y")
+    )
+    manual = set(zip(manual.iso_code, manual.month))
+
+    published = pd.read_csv(PATHS.output / "hcr_data.csv").assign(
+        date=lambda d: pd.to_datetime(d["Data Date"], format="%m-%Y")
+    )
+    scraped = [
+        key not in manual for key in zip(published.iso_code, published["Data Date"])
+    ]
+
+    (
+        published.loc[scraped]
+        .sort_values(["iso_code", "date"])
+        .drop_duplicates("iso_code", keep="last")
+        .assign(**{"Data Date": lambda d: d.date})
+        .filter(["iso_code", "Country", "Data Date", column], axis=1)
+        .to_csv(LATEST_SNAPSHOT, index=False)
+    )
+    print(f"Seeded {LATEST_SNAPSHOT.name} from the published HCR data")
+
+
+def rebuild_ukraine_hcr_data(nowcast: bool = False) -> None:
+    """Process the saved HCR snapshots into the monthly data (see ukraine_hcr_ledger)"""
+    # Without the latest snapshot the months after the last historic snapshot would
+    # be dropped from the published data
+    if not LATEST_SNAPSHOT.exists():
+        seed_latest_snapshot()
+
+    ukraine_hcr_ledger(nowcast).to_csv(PATHS.output / "hcr_data.csv", index=False)
     print("Updated UNHCR recorded refugee data")
 
 
+def update_ukraine_hcr_data() -> None:
+    """Scrape the latest HCR data, save it as the latest snapshot and process it"""
+
+    # Get the latest data from the UNHCR website and clean the data types
+    get_unhcr_data().pipe(clean_hcr_data_download).to_csv(LATEST_SNAPSHOT, index=False)
+
+    rebuild_ukraine_hcr_data()
+
+
 if __name__ == "__main__":
     update_ukraine_hcr_data()
@@ -1,13 +1,10 @@
 import datetime
 from time import sleep
 
-import country_converter
 import numpy as np
 import pandas as pd
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from webdriver_manager.chrome import ChromeDriverManager
+
+from scripts.swr import stale_while_revalidate
 
 OLD_UNHCR_URL: str = (
     "https://app.powerbi.com/view?r=eyJrIjoiNzkyMjdmN2QtMjdlNy00YT"
@@ -21,9 +18,16 @@ UNHCR_URL: str = (
     "NC04YTBjLTY1NDNkMmFmODBiZSIsImMiOjh9"
 )
 
+# When set, the table elements are read from this URL (a json list of the cell
+# texts, as recorded from the report) instead of scraping the Power BI report
+ELEMENTS_URL: str | None = None
+
 
-def _get_driver() -> webdriver.chrome:
-    """Get driver for Chrome"""
+def _get_driver() -> "webdriver.chrome":
+    """Get driver for Chrome. Selenium is only imported when a driver is needed"""
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+    from webdriver_manager.chrome import ChromeDriverManager
 
     options = webdriver.ChromeOptions()
     options.add_argument("--no-sandbox")
@@ -33,8 +37,10 @@ def _get_driver() -> webdriver.chrome:
     return webdriver.Chrome(service=Service(CHROME))
 
 
-def _get_list_of_elements(driver: webdriver.chrome) -> list:
+def _get_list_of_elements(driver: "webdriver.chrome") -> list:
     """Get table elements as a list of strings"""
+    from selenium.webdriver.common.by import By
+
     # Get page
     driver.get(UNHCR_URL)
     sleep(5)
@@ -101,6 +107,8 @@ def _get_other_df(elements_list: list) -> pd.DataFrame:
 
 
 def _clean_df(df: pd.DataFrame) -> pd.DataFrame:
+    import country_converter
+
     # Clean numbers
     df = df.apply(lambda row: row.str.replace(",", ""), axis=1)
 
@@ -135,9 +143,20 @@ def _clean_df(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
+@stale_while_revalidate(
+    "UNHCR Power BI data", source="UNHCR Power BI", stages=["unhcr"]
+)
 def get_unhcr_data() -> pd.DataFrame:
     """Get UNHCR data from the OECD"""
 
+    if ELEMENTS_URL is not None:
+        import requests
+
+        r = requests.get(ELEMENTS_URL, timeout=60)
+        r.raise_for_status()
+        elements_list = r.json()
+        return _get_neighbouring_df(elements_list).pipe(_clean_df)
+
     # Get driver
     driver = _get_driver()
 
@@ -0,0 +1,264 @@
+"""Long-running watch mode.
+
+The process keeps the imported modules and the cached datasets (DAC1 panel,
+cube, refugee history) in memory, polls the input files for changes and re-runs
+only the stages that depend on the files that changed. Stages write files that
+are themselves inputs of later stages, so a change cascades through the pipeline.
+
+Scheduled stages (e.g. the UNHCR scrape) run when they are due. Stages can also be
+triggered by writing their names (one per line) to the trigger file. A health file
+records the state of the process.
+
+On Unix, SIGHUP clears the cached data and re-reads all inputs (graceful reload),
+and SIGTERM/SIGINT stop the process after the current stage.
+"""
+
+import gc
+import json
+import os
+import signal
+import sys
+import time
+from datetime import datetime
+from fnmatch import fnmatch
+from pathlib import Path
+
+from scripts.config import PATHS
+from scripts.stages import DAILY_STAGES, STAGES, run_stage
+
+WATCH_DIR = PATHS.project / ".watch"
+HEALTH_FILE = WATCH_DIR / "health.json"
+TRIGGER_FILE = WATCH_DIR / "trigger"
+
+# Input files (relative to the project folder) -> stages that depend on them
+DEPENDENCIES: dict[str, list[str]] = {
+    "raw_data/*_hcr_data.csv": ["hcr_ledger"],
+    "raw_data/non-eu-refugees.csv": ["hcr_ledger"],
+    "raw_data/table1_raw.feather": ["dac1_exports"],
+    "raw_data/total_idrc_current.csv": ["cube", "refugee_cost", "summary_cost"],
+    "raw_data/total_oda_current.csv": ["cube"],
+    "raw_data/gni.csv": ["cube"],
+    "output/hcr_data.csv": ["refugee_cost", "summary_cost"],
+    "output/unhcr_data_*.feather": ["refugee_cost", "summary_cost"],
+    "output/ukraine_refugee_cost_estimates.csv": ["cube"],
+    "output/tracker_cube.parquet": [
+        "idrc_share",
+        "idrc_oda_chart",
+        "idrc_constant",
+        "idrc_constant_bases",
+    ],
+}
+
+# Stages that fetch upstream data, and how often they run (in seconds)
+SCHEDULE: dict[str, int] = {
+    "unhcr": 24 * 3600,
+    "dt_table": 24 * 3600,
+    "dt_tables": 24 * 3600,
+}
+
+# Order in which the stages are run when several are due
+ORDER: list[str] = [
+    "unhcr",
+    "hcr_ledger",
+    "dac1_exports",
+    "refugee_cost",
+    "cube",
+    "idrc_share",
+    "idrc_oda_chart",
+    "idrc_constant",
+    "idrc_constant_bases",
+    "summary_cost",
+    "dt_table",
+    "dt_tables",
+    "latest_oda",
+]
+
+
+def _input_files() -> dict[Path, float]:
+    """Modification time of every watched file"""
+    files = {}
+    for folder in [PATHS.raw_data, PATHS.output]:
+        for file in folder.iterdir():
+            relative = file.relative_to(PATHS.project).as_posix()
+            if any(fnmatch(relative, pattern) for pattern in DEPENDENCIES):
+                files[file] = file.stat().st_mtime
+    return files
+
+
+def affected_stages(changed: list[Path]) -> list[str]:
+    """The stages that depend on the changed files, in the order they should run"""
+    stages = set()
+    for file in changed:
+        relative = file.relative_to(PATHS.project).as_posix()
+        for pattern, dependants in DEPENDENCIES.items():
+            if fnmatch(relative, pattern):
+                stages.update(dependants)
+
+    return sorted(stages, key=lambda s: ORDER.index(s) if s in ORDER else len(ORDER))
+
+
+def _memory_mb() -> float:
+    """Resident memory of the process, in MB (peak memory where not available)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError, AttributeError):
+        pass
+
+    try:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+    except ImportError:
+        return 0.0
+
+
+# Input files -> in-memory datasets that must be reloaded when they change
+CACHES: dict[str, list[tuple[str, str]]] = {
+    "raw_data/table1_raw.feather": [("scripts.dac1", "tracker_dac1_data")],
+    "raw_data/total_idrc_current.csv": [
+        ("scripts.idrc_per_capita", "yearly_constant_idrc"),
+        ("scripts.idrc_per_capita", "cost_per_refugee"),
+    ],
+    "output/tracker_cube.parquet": [("scripts.cube", "load_cube")],
+    "output/unhcr_data_*.feather": [
+        ("scripts.idrc_per_capita", "read_historical_unhcr_data"),
+        ("scripts.idrc_per_capita", "cost_per_refugee"),
+    ],
+}
+
+
+def clear_caches(changed: list[Path] | None = None) -> None:
+    """Drop the datasets kept in memory (all of them, or those whose files changed).
+    They are reloaded on next use"""
+    for pattern, caches in CACHES.items():
+        if changed is not None and not any(
+            fnmatch(f.relative_to(PATHS.project).as_posix(), pattern) for f in changed
+        ):
+            continue
+        for module, function in caches:
+            if module in sys.modules:
+                getattr(sys.modules[module], function).cache_clear()
+    gc.collect()
+
+
+class Watcher:
+    """Poll the inputs and run the stages that depend on the ones that changed"""
+
+    def __init__(self, interval: int = 30, max_memory_mb: float | None = None):
+        self.interval = interval
+        self.max_memory_mb = max_memory_mb
+        self.running = False
+        self.reload = False
+        self.files = _input_files()
+        self.last_run: dict[str, float] = {}
+        self.errors: dict[str, str] = {}
+
+    def _write_health(self, status: str) -> None:
+        WATCH_DIR.mkdir(exist_ok=True)
+        health = {
+            "pid": os.getpid(),
+            "status": status,
+            "checked": datetime.today().isoformat(timespec="seconds"),
+            "memory_mb": round(_memory_mb(), 1),
+            "last_run": {
+                stage: datetime.fromtimestamp(t).isoformat(timespec="seconds")
+                for stage, t in self.last_run.items()
+            },
+            "errors": self.errors,
+        }
+        with open(HEALTH_FILE, "w") as f:
+            json.dump(health, f, indent=2)
+
+    def _changed_files(self) -> list[Path]:
+        files = _input_files()
+        changed = [f for f, mtime in files.items() if self.files.get(f) != mtime]
+        self.files = files
+        return changed
+
+    def _triggered_stages(self) -> list[str]:
+        if not TRIGGER_FILE.exists():
+            return []
+        stages = TRIGGER_FILE.read_text().split() or DAILY_STAGES
+        TRIGGER_FILE.unlink()
+        return [s for s in stages if s in STAGES]
+
+    def _due_stages(self) -> list[str]:
+        now = time.time()
+        return [
+            stage
+            for stage, every in SCHEDULE.items()
+            if now - self.last_run.get(stage, 0) >= every
+        ]
+
+    def _check_memory(self) -> None:
+        if self.max_memory_mb is None or _memory_mb() <= self.max_memory_mb:
+            return
+        clear_caches()
+        if _memory_mb() > self.max_memory_mb:
+            # Let the supervisor restart the process with a clean heap
+            self._write_health("stopped: memory limit")
+            sys.exit(3)
+
+    def _changes(self) -> list[str]:
+        """Stages affected by the files that changed since the last check"""
+        changed = self._changed_files()
+        clear_caches(changed)
+        return affected_stages(changed)
+
+    def run_once(self, stages: list[str]) -> None:
+        """Run stages, and the stages that depend on the files they write.
+        Failures are recorded instead of stopping the watcher"""
+        queue = list(dict.fromkeys(stages))
+
+        while queue and self.running:
+            stage = queue.pop(0)
+            self._write_health(f"running {stage}")
+            try:
+                run_stage(stage)
+                self.errors.pop(stage, None)
+            except Exception as e:  # a failing stage must not stop the watcher
+                self.errors[stage] = repr(e)
+                print(f"Stage {stage} failed: {e!r}")
+            self.last_run[stage] = time.time()
+
+            # Files written by the stage trigger the stages that depend on them
+            queue += [s for s in self._changes() if s not in queue]
+            queue.sort(key=lambda s: ORDER.index(s) if s in ORDER else len(ORDER))
+
+    def _handle_signal(self, signum, frame) -> None:
+        if signum == getattr(signal, "SIGHUP", None):
+            self.reload = True
+        else:
+            self.running = False
+
+    def start(self) -> None:
+        """Watch until stopped"""
+        self.running = True
+        signal.signal(signal.SIGINT, self._handle_signal)
+        signal.signal(signal.SIGTERM, self._handle_signal)
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, self._handle_signal)
+
+        print(f"Watching {PATHS.raw_data} and {PATHS.output}")
+
+        while self.running:
+            if self.reload:
+                clear_caches()
+                self.files = {}
+                self.reload = False
+                print("Reloaded cached data")
+
+            stages = self._triggered_stages() + self._due_stages() + self._changes()
+
+            self.run_once(stages)
+            self._check_memory()
+            self._write_health("idle")
+
+            for _ in range(self.interval):
+                if not self.running or self.reload or TRIGGER_FILE.exists():
+                    break
+                time.sleep(1)
+
+        self._write_health("stopped")
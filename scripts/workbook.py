@@ -0,0 +1,248 @@
+"""Streamed, write-only Excel workbooks.
+
+`pd.ExcelWriter` builds every cell of the workbook in memory before it is saved, so
+its memory grows with the sheets (the "Monthly data" sheet of the cost estimates
+has a row per donor and month of the ledger). `write_workbook` writes each sheet
+row by row to a write-only workbook instead (openpyxl's write-only mode serializes
+the rows as they are appended), from its DataFrame in chunks or from a generator
+of chunks, so the memory used doesn't depend on the length of the sheets. A
+workbook can hold any number of sheets.
+
+The cells are typed with a number format for the dtype of their column
+(NUMBER_FORMATS), which can be overridden by column. The document dates and the
+times of the files in the archive are fixed (TIMESTAMP), so the same sheets give
+the same file byte for byte.
+
+    write_workbook(
+        PATHS.output / "estimates.xlsx",
+        {"Summary": summary, "Monthly data": monthly_chunks()},
+        formats={"Monthly data": {"ratio22": "0.0000"}},
+    )
+
+`python -m scripts.workbook` compares the memory and time of the streamed export
+with `pd.ExcelWriter` as the monthly sheet grows.
+"""
+
+import re
+import shutil
+import zipfile
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import Cell, WriteOnlyCell
+from openpyxl.styles import Font
+
+# dtype kind -> Excel number format. Other columns (text) are written as they are
+NUMBER_FORMATS: dict[str, str] = {
+    "i": "#,##0",
+    "u": "#,##0",
+    "f": "#,##0.00",
+    "M": "yyyy-mm-dd",
+}
+
+# Rows converted at a time, for the sheets given as a DataFrame
+CHUNK_SIZE: int = 10_000
+
+# Longest sheet name Excel accepts
+MAX_SHEET_NAME: int = 31
+
+# Creation and modification date of every workbook (openpyxl uses the time of
+# saving, which would change the file on every run)
+TIMESTAMP: datetime = datetime(2000, 1, 1)
+
+Sheet = pd.DataFrame | Iterable[pd.DataFrame]
+
+
+def _chunks(sheet: Sheet, chunk_size: int) -> Iterator[pd.DataFrame]:
+    """The chunks of a sheet (a DataFrame, or an iterable of DataFrames)"""
+    if not isinstance(sheet, pd.DataFrame):
+        yield from sheet
+        return
+
+    for start in range(0, len(sheet), chunk_size):
+        yield sheet.iloc[start : start + chunk_size]
+
+    # The header of an empty sheet is still written
+    if sheet.empty:
+        yield sheet
+
+
+def _column_cells(
+    ws, chunk: pd.DataFrame, formats: dict[str, str]
+) -> list[Cell | None]:
+    """A cell with the number format of each column (None for the columns written
+    as they are). The rows are serialized as they are appended, so the same cell
+    is used for every row of a column"""
+    cells = []
+    for column, dtype in chunk.dtypes.items():
+        number_format = formats.get(column, NUMBER_FORMATS.get(dtype.kind))
+        if number_format is None:
+            cells.append(None)
+            continue
+        cell = WriteOnlyCell(ws)
+        cell.number_format = number_format
+        cells.append(cell)
+
+    return cells
+
+
+def _write_sheet(ws, sheet: Sheet, formats: dict[str, str], chunk_size: int) -> int:
+    """Write the header and the rows of a sheet. Returns the number of rows"""
+    columns, cells, rows = None, None, 0
+
+    for chunk in _chunks(sheet, chunk_size):
+        if columns is None:
+            columns = list(chunk.columns)
+            cells = _column_cells(ws, chunk, formats)
+
+            header = []
+            for column in columns:
+                cell = WriteOnlyCell(ws, value=str(column))
+                cell.font = Font(bold=True)
+                header.append(cell)
+            ws.append(header)
+
+        elif list(chunk.columns) != columns:
+            raise ValueError(f"The chunks of sheet {ws.title} have different columns")
+
+        # Missing values are left empty
+        values = chunk.astype(object).where(chunk.notna(), None)
+
+        for row in values.itertuples(index=False, name=None):
+            typed = []
+            for cell, value in zip(cells, row):
+                if cell is None or value is None:
+                    typed.append(value)
+                else:
+                    cell.value = value
+                    typed.append(cell)
+            ws.append(typed)
+        rows += len(chunk)
+
+    return rows
+
+
+def _fix_timestamps(source: Path, target: Path) -> None:
+    """Copy a saved workbook, setting its modification date and the times of its
+    files to TIMESTAMP"""
+    modified = re.compile(rb"(<dcterms:modified[^>]*>)[^<]*(</dcterms:modified>)")
+    stamp = TIMESTAMP.strftime("%Y-%m-%dT%H:%M:%SZ").encode()
+
+    with zipfile.ZipFile(source) as zin, zipfile.ZipFile(
+        target, "w", zipfile.ZIP_DEFLATED
+    ) as zout:
+        for item in zin.infolist():
+            info = zipfile.ZipInfo(item.filename, TIMESTAMP.timetuple()[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            if item.filename == "docProps/core.xml":
+                core = modified.sub(rb"\g<1>" + stamp + rb"\g<2>", zin.read(item))
+                zout.writestr(info, core)
+                continue
+            with zin.open(item) as src, zout.open(info, "w") as dst:
+                shutil.copyfileobj(src, dst)
+
+
+def write_workbook(
+    file: Path,
+    sheets: dict[str, Sheet],
+    formats: dict[str, dict[str, str]] | None = None,
+    chunk_size: int = CHUNK_SIZE,
+) -> None:
+    """Write the sheets (name -> DataFrame, or iterable of DataFrames with the same
+    columns) to an Excel file, row by row. `formats` overrides the number format
+    of some columns: sheet -> column -> format"""
+    formats = formats or {}
+
+    invalid = [name for name in sheets if len(name) > MAX_SHEET_NAME]
+    if invalid:
+        raise ValueError(f"Sheet names longer than {MAX_SHEET_NAME}: {invalid}")
+
+    unknown = set(formats) - set(sheets)
+    if unknown:
+        raise ValueError(f"Formats given for unknown sheets: {sorted(unknown)}")
+
+    wb = Workbook(write_only=True)
+    wb.properties.created = TIMESTAMP
+    for name, sheet in sheets.items():
+        ws = wb.create_sheet(name)
+        ws.freeze_panes = "A2"
+        _write_sheet(ws, sheet, formats.get(name, {}), chunk_size)
+
+    # Written to temporary files, then moved in place
+    saved = Path(file).with_suffix(".saved.xlsx")
+    temporary = Path(file).with_suffix(".tmp.xlsx")
+    try:
+        wb.save(saved)
+        _fix_timestamps(saved, temporary)
+    finally:
+        saved.unlink(missing_ok=True)
+    temporary.replace(file)
+
+
+# -----------------------------------------------------------------------------
+# Benchmark
+
+
+def _monthly_sheet() -> pd.DataFrame:
+    """The monthly sheet of the Ukraine cost estimates (the refugee ledger)"""
+    from scripts.config import PATHS, crisis_config
+
+    return pd.read_csv(PATHS.output / crisis_config("ukraine")["ledger"])
+
+
+def _measure(scale: int, mode: str) -> dict:
+    """Time and peak memory of an export with the monthly sheet repeated `scale`
+    times (run in a new process)"""
+    import resource
+    import tempfile
+    import time
+
+    monthly = _monthly_sheet()
+    file = Path(tempfile.mkdtemp(prefix="workbook-benchmark-")) / "benchmark.xlsx"
+
+    start = time.perf_counter()
+    if mode == "streamed":
+        write_workbook(file, {"Monthly data": (monthly for _ in range(scale))})
+    else:
+        with pd.ExcelWriter(file) as writer:
+            pd.concat([monthly] * scale).to_excel(
+                writer, sheet_name="Monthly data", index=False
+            )
+    seconds = time.perf_counter() - start
+
+    size = file.stat().st_size / 1e6
+    file.unlink()
+    file.parent.rmdir()
+
+    return {
+        "seconds": round(seconds, 2),
+        # kilobytes on linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3),
+        "file_mb": round(size, 1),
+    }
+
+
+def benchmark(scales: tuple[int, ...] = (1, 10, 100, 1000)) -> pd.DataFrame:
+    """Time and peak memory of the streamed export and of pd.ExcelWriter, for the
+    monthly sheet repeated a growing number of times"""
+    from concurrent.futures import ProcessPoolExecutor
+
+    rows = len(_monthly_sheet())
+    results = []
+    for scale in scales:
+        for mode in ["streamed", "pd.ExcelWriter"]:
+            # A new process for each run, so that the peaks are not shared
+            with ProcessPoolExecutor(1) as pool:
+                measure = pool.submit(_measure, scale, mode).result()
+            results.append(
+                {"scale": scale, "rows": rows * scale, "mode": mode} | measure
+            )
+
+    return pd.DataFrame(results)
+
+
+if __name__ == "__main__":
+    print(benchmark().to_string(index=False))